@@ -1,31 +1,41 @@
 import pandas as pd
-import plotly.graph_objects as go
-import plotly.express as px
-from dash import Dash, dcc, html, Input, Output
+from dash import ClientsideFunction, Dash, Patch, ctx, dcc, html, no_update, Input, Output, State
+from dash.exceptions import PreventUpdate
+from flask import abort, jsonify, request, send_file
 import datetime
 
+import config
+from data_export import (DEFAULT_EXPORT_COLUMNS, EXPORT_FORMATS, export_cache, export_column_options,
+                         export_query, export_response)
+from downsample import line_graph_view, zoom_window
+from figure_pool import run_concurrently
+from figures import (LOADING_FIGURE, build_figure, choropleth_map_values, clientside_figure_templates, colors,
+                     geojson_choropleth_map)
+from geometries import load_country_geometries
+from http_responses import configure_responses
+from instrumentation import instrument_payload, instrument_server, instrumented_callback
+from metrics import DEFAULT_METRIC, METRICS
+from regions import RegionRegistry
+from selection import (default_countries, load_selection, recent_selections, selection_cache, selection_key,
+                       update_selection)
+from series import country_series, series_key
+from server_cache import create_cache, make_cache_key, memoize
+
 # CSS stylesheet for dash start.
-external_stylesheets = ['https://codepen.io/chriddyp/pen/bWLwgP.css', 'https://cdnjs.cloudflare.com/ajax/libs/font-awesome/4.7.0/css/font-awesome.min.css']
+# The stylesheets are served from assets/: the grid and typography (base.css), font-awesome and covid_19.css.
 app = Dash(
     __name__, 
     meta_tags=[{"name": "viewport", "content": "width=device-width, initial-scale=1"}], 
-    external_stylesheets=external_stylesheets
 )
-app.title = 'COVID-19 Analysis in Europe.'
+app.title = 'COVID-19 Analysis by Continent.'
 
 server = app.server
 
-#Overwrite your CSS setting by including style locally
-colors = {
-    'background': '#2D2D2D',
-    'text': '#E1E2E5',
-    'figure_text': '#ffffff',
-    'confirmed_text':'#3CA4FF',
-    'deaths_text':'#f44336',
-    'recovered_text':'#5A9E6F',
-    'highest_case_bg':'#393939',
-    
-}
+# Timings of the callbacks per phase, payload size and selection cardinality, served by GET /metrics and logged as
+# JSON lines. A single request can be profiled with the header 'X-Profile: 1' (see config.PROFILING).
+instrument_server(server)
+
+# The colors of the theme are defined in figures.py.
 
 #Creating custom style for local use
 divBorderStyle = {
@@ -44,497 +54,701 @@ boxBorderStyle = {
 # CSS stylesheet for dash end.
 
 #############################################################################################################
-# Reading the csv data file via Github URL and filtering the data based on the continent 'Europe' start.
+# Reading the data of the selected continent from the local columnar snapshot start.
 #############################################################################################################
-data_set_url = 'https://raw.githubusercontent.com/owid/covid-19-data/master/public/data/owid-covid-data.csv'
-covid19_data_frame = pd.read_csv(data_set_url)
-
-# Filter out data based on Europe continent.
-covid19_data_frame = covid19_data_frame.loc[covid19_data_frame['continent'] == 'Europe']
-
-# Replace NaN values with 0 for the following columns. 
-columns_to_replace_nan = ['total_cases', 'total_deaths', 'new_cases', 'new_deaths']
-covid19_data_frame[columns_to_replace_nan] = covid19_data_frame[columns_to_replace_nan].fillna(0)
-
-# calculating the total confirmed cases, total deaths, new confirmed cases and new deaths
-confirmed_total_cases = covid19_data_frame['total_cases'].sum()
-confirmed_new_cases = 0 if pd.isna(covid19_data_frame['new_cases'].values[-1]) else covid19_data_frame['new_cases'].values[-1]
-confirmed_total_deaths = covid19_data_frame['total_deaths'].sum()
-confirmed_new_deaths = 0 if pd.isna(covid19_data_frame['new_deaths'].values[-1]) else covid19_data_frame['new_deaths'].values[-1]
-
-# getting the list of countries in Europe
-countries_in_europe = covid19_data_frame['location'].unique().tolist()
-# Reading the csv data file via Github URL and filtering the data based on the continent 'Europe' End.
-
-# Creating color dictionary by combining different discrete plotly maps
-color_list = px.colors.qualitative.Alphabet + px.colors.qualitative.Dark24 + px.colors.qualitative.Dark2
-color_dict = dict(zip(countries_in_europe, color_list))
-
-# Creating color dictionary for choropleth map
-iso_code_list = covid19_data_frame["iso_code"].unique().tolist()
-iso_code_color_dict = dict(zip(iso_code_list, color_list))
+# The csv file is only downloaded and parsed when no snapshot exists yet (see data_loader.py).
+# Every region (continent) has its own refresher, appending newly published days in a background thread and
+# swapping in a new Dataset (data frame, countries, colors and header numbers). Callbacks read it via
+# regions.current(region). Regions other than config.DEFAULT_REGION are loaded on first selection and dropped
+# again when idle or above the memory budget (see regions.py).
+# With config.LAZY_STARTUP the data is loaded in the background and the page is served right away.
+regions = RegionRegistry(lazy=config.LAZY_STARTUP)
+
+# Figures are cached per selection, the selection key holds the dataset version and the normalized inputs.
+figure_cache = create_cache(config.FIGURE_CACHE_BACKEND, config.FIGURE_CACHE_DIR,
+                            config.FIGURE_CACHE_TIMEOUT, config.FIGURE_CACHE_MAX_BYTES)
+
+# Drop the cached selections and figures of the previous version of the region after a refresh.
+def discard_stale_cache_entries(dataset):
+    selection_cache.discard_other_versions(dataset.version, dataset.cache_namespace)
+    recent_selections.discard_other_versions(dataset.version, dataset.cache_namespace)
+    figure_cache.discard_other_versions(dataset.version, dataset.cache_namespace)
+    export_cache.discard_other_versions(dataset.version, dataset.cache_namespace)
+
+regions.add_listener(discard_stale_cache_entries)
+regions.start()
+
+# Compressed responses, ETags of the callback and layout responses keyed on the data version and the request, and
+# long-lived cache headers for the versioned files of assets/ (see config.COMPRESSION).
+configure_responses(server, regions.version)
+# Size of the callback responses before compression, next to the size sent
+instrument_payload(server)
+
+# Readiness probe: 503 until the data of the default region is loaded.
+@server.route('/ready')
+def ready():
+    dataset = regions.current()
+    if dataset is None:
+        return jsonify(status='loading'), 503
+    return jsonify(status='ready', version=dataset.version, regions=regions.memory_usage())
+
+# Liveness probe: 500 when loading the data of the default region failed, the loader keeps retrying in the background.
+@server.route('/health')
+def health():
+    refresher = regions.refresher()
+    if refresher.load_error is not None:
+        return jsonify(status='error', error=str(refresher.load_error)), 500
+    return jsonify(status='ok', ready=refresher.is_ready())
+
+# Country geometries of the choropleth map, read once at startup and loaded once by the browser.
+if config.CHOROPLETH_MAP_MODE == 'geojson':
+    load_country_geometries()
+
+@server.route('/geometries/countries.geojson')
+def country_geometries():
+    return send_file(config.COUNTRY_GEOMETRIES_PATH, mimetype='application/geo+json', max_age=24 * 3600)
+
+# Download of the rows of a selection as csv, parquet or jsonl, streamed in chunks from the CountryDateStore and
+# cached for the next download of the same selection (see data_export.py). Unlike the callbacks, an unknown region
+# does not fall back to the default region.
+@server.route('/export/<export_format>')
+def export_selection(export_format):
+    region = request.args.get('region')
+    if export_format not in EXPORT_FORMATS or region not in regions.regions:
+        abort(404)
+    dataset = regions.current(region, wait=True)
+    if dataset is None:
+        return jsonify(status='loading'), 503
+    return export_response(dataset, export_format, request.args)
+
+# Current dataset of the region of the selection stored in the dcc.Store, None while the data is loading and when
+# it failed to load within the timeout of RegionRegistry.current.
+def stored_selection_dataset(selection_data):
+    return None if selection_data is None else regions.current(selection_data['region'], wait=True)
+
+# Cache key of a figure of the selection stored in the dcc.Store, and of further inputs like the zoom window.
+# The figure is keyed on the selection in the dataset it is built from, the key in the store may name the version
+# before a refresh.
+def figure_cache_key(figure_id):
+    def key(dataset, selection_data, *parts):
+        # Nothing is cached while the data is loading
+        if dataset is None:
+            return None
+        return (f"{selection_key(dataset, selection_data['inputs'])}-{figure_id}" +
+                (f"-{make_cache_key(*parts)}" if parts else ''))
+    return key
+
+# Countries and days of the selection stored in the dcc.Store, recorded with the timings of the figure callbacks.
+def stored_selection_cardinality(selection_data, *inputs):
+    return selection_data.get('cardinality') if selection_data else None
+
+def series_cardinality(region, countries, *inputs):
+    return {'countries': len(countries or [])}
+# Reading the data of the selected continent from the local columnar snapshot End.
 
 #############################################################################################################
 # Custom functions.
 #############################################################################################################
-# Calculating the COVID-19 death rate.
-def calculate_covid19_death_rate(data_frame):
-    return round((data_frame["total_deaths"] / data_frame["total_cases"]) * 100, 2)
-
-# Selecting the most recent data for each country.
-def select_recent_data_for_each_countries(data_frame, code_list, country_list):
-    
-    if isinstance(country_list, str):
-        country_list = [country_list]
-    
-    death_rate_data_frame = data_frame.loc[
-        (data_frame['location'].isin(country_list)) &
-        (data_frame['iso_code'].isin(code_list)) &        
-        pd.notnull(data_frame['total_deaths']) &
-        pd.notnull(data_frame['total_cases']),
-        ['iso_code', 'location', 'date', 'total_cases', 'new_cases', 'total_deaths', 'new_deaths']
-    ].groupby('iso_code').last().reset_index()
-    
-    death_rate_data_frame['covid19_death_rate'] = calculate_covid19_death_rate(death_rate_data_frame)
-
-    return death_rate_data_frame
+# The death rate and the most recent data of each country are computed in selection.py.
 
-# convert date string to datetime object and add days_to_add
+# convert date (string or datetime64) to datetime object and add days_to_add
 def datatime_convert(date_str,days_to_add=0):
-    # Convert string to datetime object
-    format_str = '%Y-%m-%d' # The format
-    datetime_obj = datetime.datetime.strptime(date_str, format_str)
+    # Convert to datetime object
+    datetime_obj = pd.Timestamp(date_str).to_pydatetime()
     datetime_obj += datetime.timedelta(days=days_to_add)
     
     return datetime_obj.strftime('%d-%b-%Y')
 
+# Last updated date, outbreak start and the header numbers of the given date (default the last date).
+def header_values(dataset, date=None):
+    if dataset is None:
+        return ('Loading data...', 'Outbreak since: ...', '...', '...', '...', '...')
+    kpis = dataset.kpis.at(date)
+    return (datatime_convert(dataset.last_date),
+            'Outbreak since: ' + datatime_convert(dataset.first_date),
+            f"{kpis['total_cases']:,.0f}",
+            f"{kpis['total_deaths']:,.0f}",
+            f"{kpis['new_cases']:,.0f}",
+            f"{kpis['new_deaths']:,.0f}")
+
+# Options of the country dropdown, empty while the data is loading.
+def country_options(dataset):
+    return [{'label': i, 'value': i} for i in dataset.countries] if dataset else []
+
+def page_title(region):
+    return f'Analysis and Visualization of COVID-19 Impact and Response in {region}.'
+
 #############################################################################################################
 # Dash Layout.
 #############################################################################################################
-app.layout = html.Div(
-    html.Div([
-        
-        # Header display
-        html.Div(
-            [
-                html.H1(children='Analysis and Visualization of COVID-19 Impact and Response in Europe.',
-                        style={
-                            'textAlign': 'left',
-                            'color': colors['text'],
-                            'backgroundColor': colors['background'],
-                        },
-                        className='ten columns',
-                        ),
+# Layout of every page load, with placeholders while the data is loading (see config.LAZY_STARTUP).
+def serve_layout():
+    dataset = regions.current()
+    last_updated, outbreak_since, total_cases, total_deaths, new_cases, new_deaths = header_values(dataset)
 
-                html.Div([
-                    html.Button(html.I(className="fa fa-info-circle"),
-                        id='info-button',
-                        style={
-                             'color': colors['text'],
-                             'fontSize':'36px'
-
-                         },)
-
-                ],className='two columns',),
-
-                # Preload Modal windows and set "display": "none" to hide it first
-                html.Div([  # modal div
-                    html.Div([  # content div
-
-                        dcc.Markdown('''
-                            ## Data on COVID-19 (coronavirus) by Our World in Data:
-                            https://ourworldindata.org/coronavirus
-                           
-                            Data Sources:
-                            * GitHub repository for the data: https://github.com/owid/covid-19-data/tree/master/public/data
-                            '''),
-                        # html.Hr(),
-                        html.Button('Close', id='modal-close-button',
-                        style={
-                             'color': colors['text'],
-                         },)
+    return html.Div(
+        html.Div([
+
+            # Header display
+            html.Div(
+                [
+                    html.H1(children=page_title(config.DEFAULT_REGION),
+                            id='page-title',
+                            style={
+                                'textAlign': 'left',
+                                'color': colors['text'],
+                                'backgroundColor': colors['background'],
+                            },
+                            className='ten columns',
+                            ),
+
+                    html.Div([
+                        html.Button(html.I(className="fa fa-info-circle"),
+                            id='info-button',
+                            style={
+                                 'color': colors['text'],
+                                 'fontSize':'36px'
+
+                             },)
+
+                    ],className='two columns',),
+
+                    # Preload Modal windows and set "display": "none" to hide it first
+                    html.Div([  # modal div
+                        html.Div([  # content div
+
+                            dcc.Markdown('''
+                                ## Data on COVID-19 (coronavirus) by Our World in Data:
+                                https://ourworldindata.org/coronavirus
+
+                                Data Sources:
+                                * GitHub repository for the data: https://github.com/owid/covid-19-data/tree/master/public/data
+                                '''),
+                            # html.Hr(),
+                            html.Button('Close', id='modal-close-button',
+                            style={
+                                 'color': colors['text'],
+                             },)
+                        ],
+                            style={
+                                'fontSize': 10,
+                                'lineHeight': 0.9,
+                            },
+                            className='modal-content',
+                        ),
                     ],
-                        style={
-                            'fontSize': 10,
-                            'lineHeight': 0.9,
-                        },
-                        className='modal-content',
+                        id='modal',
+                        className='modal',
+                        style={"display": "none"},
+                    ),
+
+                    html.Div(
+                        [
+                            html.Span('Dashboard: Covid-19 outbreak. Last Updated: ',
+                                      style={'color': colors['text'],}),
+                            html.Span(last_updated,
+                                      id='last-updated',
+                                      style={'color': colors['confirmed_text'],
+                                             'fontWeight': 'bold',}),
+                        ],className='twelve columns'
                     ),
+
+                    html.Div(
+                        [
+                            html.Span(outbreak_since,
+                                      id='outbreak-since',
+                                      style={'color': colors['text'],}),                        
+                        ], className='twelve columns'
+                    ),
+
+                    # Polls for refreshed data to update the header numbers
+                    dcc.Interval(id='refresh-interval',
+                                 interval=max(config.REFRESH_INTERVAL, 1) * 1000,
+                                 disabled=config.REFRESH_INTERVAL <= 0),
+
+                    # Polls while the data of the selected region is loading, to fill in the header, the dropdown
+                    # and the date range
+                    dcc.Interval(id='loading-interval', interval=1000, disabled=dataset is not None),
+                ], 
+                className="row", style={'margin': '15px 0'},  # Add a top and bottom margin
+            ),
+
+
+            # Top column display of confirmed, death and recovered total numbers
+            html.Div([
+                html.Div([
+                    html.H4(children='Total Cases: ',
+                           style={
+                               'textAlign': 'center',
+                               'color': colors['confirmed_text'],
+                           }
+                           ),
+                    # format a floating-point number with commas as thousands separators
+                    html.P(total_cases,
+                           id='total-cases',
+                           style={
+                        'textAlign': 'center',
+                        'color': colors['confirmed_text'],
+                        'fontSize': 30,
+                    }
+                    ),                
                 ],
-                    id='modal',
-                    className='modal',
-                    style={"display": "none"},
+                    style=divBorderStyle,
+                    className='three columns',
                 ),
 
-                html.Div(
-                    [
-                        html.Span('Dashboard: Covid-19 outbreak. Last Updated: ',
-                                  style={'color': colors['text'],}),
-                        html.Span(datatime_convert(covid19_data_frame['date'].values[-1]),
-                                  style={'color': colors['confirmed_text'],
-                                         'fontWeight': 'bold',}),
-                    ],className='twelve columns'
+                html.Div([
+                    html.H4(children='Total Deceased: ',
+                           style={
+                               'textAlign': 'center',
+                               'color': colors['deaths_text'],
+                           }
+                           ),
+                    # format a floating-point number with commas as thousands separators.
+                    html.P(total_deaths,
+                           id='total-deaths',
+                           style={
+                        'textAlign': 'center',
+                        'color': colors['deaths_text'],
+                        'fontSize': 30,
+                    }
+                    ),                
+                ],
+                    style=divBorderStyle,
+                    className='three columns'
                 ),
-                
-                html.Div(
-                    [
-                        html.Span('Outbreak since: '+ datatime_convert(covid19_data_frame['date'].values[0]),
-                                  style={'color': colors['text'],}),                        
-                    ], className='twelve columns'
+
+                html.Div([
+                    html.H4(children='New Cases: ',
+                           style={
+                               'textAlign': 'center',
+                               'color': colors['recovered_text'],
+                           }
+                           ),
+                    # format a integer number with commas as thousands separators
+                    html.P(new_cases,
+                           id='new-cases',
+                           style={
+                        'textAlign': 'center',
+                        'color': colors['recovered_text'],
+                        'fontSize': 30,
+                    }
+                    ),                
+                ],
+                    style=divBorderStyle,
+                    className='three columns'
                 ),
-            ], 
-            className="row", style={'margin': '15px 0'},  # Add a top and bottom margin
-        ),
-        
 
-        # Top column display of confirmed, death and recovered total numbers
-        html.Div([
-            html.Div([
-                html.H4(children='Total Cases: ',
-                       style={
-                           'textAlign': 'center',
-                           'color': colors['confirmed_text'],
-                       }
-                       ),
-                # format a floating-point number with commas as thousands separators
-                html.P(f"{confirmed_total_cases:,.0f}",
-                       style={
-                    'textAlign': 'center',
-                    'color': colors['confirmed_text'],
-                    'fontSize': 30,
-                }
-                ),                
+                html.Div([
+                    html.H4(children='New Decease: ',
+                           style={
+                               'textAlign': 'center',
+                               'color': colors['recovered_text'],
+                           }
+                           ),
+                    # format a integer number with commas as thousands separators
+                    html.P(new_deaths,
+                           id='new-deaths',
+                           style={
+                        'textAlign': 'center',
+                        'color': colors['recovered_text'],
+                        'fontSize': 30,
+                    }
+                    ),                
+                ],
+                    style=divBorderStyle,
+                    className='three columns'
+                ),
             ],
-                style=divBorderStyle,
-                className='three columns',
+            className='row',
+            style={'margin': '15px 0'},  # Add a top and bottom margin
             ),
 
+            # add a dropdown for region selection, a dropdown for country selection and a date range picker
             html.Div([
-                html.H4(children='Total Deceased: ',
-                       style={
-                           'textAlign': 'center',
-                           'color': colors['deaths_text'],
-                       }
-                       ),
-                # format a floating-point number with commas as thousands separators.
-                html.P(f"{confirmed_total_deaths:,.0f}",
-                       style={
-                    'textAlign': 'center',
-                    'color': colors['deaths_text'],
-                    'fontSize': 30,
-                }
-                ),                
-            ],
-                style=divBorderStyle,
-                className='three columns'
-            ),
-            
-            html.Div([
-                html.H4(children='New Cases: ',
-                       style={
-                           'textAlign': 'center',
-                           'color': colors['recovered_text'],
-                       }
-                       ),
-                # format a integer number with commas as thousands separators
-                html.P(f"{confirmed_new_cases:,.0f}",
-                       style={
-                    'textAlign': 'center',
-                    'color': colors['recovered_text'],
-                    'fontSize': 30,
-                }
-                ),                
-            ],
-                style=divBorderStyle,
-                className='three columns'
+                html.Div([
+                    dcc.Dropdown(id='region-dropdown',
+                                 options=[{'label': i, 'value': i} for i in config.REGIONS],
+                                 value=config.DEFAULT_REGION,
+                                 clearable=False,
+                                 ),
+                ], style=divBorderStyle, className='two columns'),
+
+                html.Div([
+                    dcc.Dropdown(id='country-dropdown',
+                                 options=country_options(dataset),
+                                 value=default_countries(dataset),  # Default value
+                                 multi=True,  # Allow multiple selections
+                                 ),
+                ], style=divBorderStyle, className='six columns'),
+
+                html.Div([
+                    dcc.DatePickerRange(id='date-range-slider',
+                                        start_date=dataset.first_date.date() if dataset else None,
+                                        end_date=dataset.last_date.date() if dataset else None,
+                                        display_format='YYYY-MM-DD')                               
+                ], style=divBorderStyle, className='four columns',),
+
+                # Key of the selection shared by the four figures, the selection itself stays on the server
+                dcc.Store(id='selection'),
+                # Region of the base figure of the choropleth map, whose values follow the selection
+                dcc.Store(id='choropleth-map-base'),
+
+                # Series of the selected countries and the figure layouts, used when the date range is applied in the browser
+                dcc.Store(id='series'),
+                dcc.Store(id='figure-templates',
+                          data=clientside_figure_templates() if config.DATE_FILTERING == 'client' else None),
+            ], 
+            className='row',
+            style={'margin': '15px 0'},  # Add a top and bottom margin
             ),
 
-            html.Div([
-                html.H4(children='New Decease: ',
-                       style={
-                           'textAlign': 'center',
-                           'color': colors['recovered_text'],
-                       }
-                       ),
-                # format a integer number with commas as thousands separators
-                html.P(f"{confirmed_new_deaths:,.0f}",
-                       style={
-                    'textAlign': 'center',
-                    'color': colors['recovered_text'],
-                    'fontSize': 30,
-                }
-                ),                
-            ],
-                style=divBorderStyle,
-                className='three columns'
+            # place the line graph and the parallel coordinates plot side by side
+            html.Div(
+                [
+                    html.Div([
+                        # Metric of the y-axis of the line graph, the derived metrics are computed with the data
+                        html.Div([
+                            dcc.Dropdown(id='line-graph-metric',
+                                         options=[{'label': metric.label, 'value': name} for name, metric in METRICS.items()],
+                                         value=DEFAULT_METRIC,
+                                         clearable=False,
+                                         ),
+                        ], style=divBorderStyle),
+                        dcc.Graph(
+                            id='line-graph',
+                        )
+                    ], className='eight columns'
+                    ),
+
+                    html.Div([
+                        dcc.Graph(
+                            id='pie-chart',
+                        )
+                    ], className='four columns'
+                    ),
+
+                ], 
+                className="row",
+                style={'margin': '15px 0'},  # Add a top and bottom margin         
             ),
-        ],
-        className='row',
-        style={'margin': '15px 0'},  # Add a top and bottom margin
-        ),
 
-        # add a dropdown for country selection and a date range picker
-        html.Div([            
-            html.Div([
-                dcc.Dropdown(id='country-dropdown',
-                             options=[{'label': i, 'value': i} for i in countries_in_europe],
-                             value= ['Germany', 'France','Netherlands', 'Russia'],  # Default value 
-                             multi=True,  # Allow multiple selections
-                             ),
-            ], style=divBorderStyle, className='eight columns'),
+            # place the pie chart and the choropleth map side by side
+            html.Div(
+                [
+                    html.Div([
+                        dcc.Graph(
+                            id='parallel-coordinates',
+                        )
+                    ], className='eight columns'
+                    ),
+
+                    html.Div([
+                        dcc.Graph(
+                            id='choropleth-map',
+                        )
+                    ], className='four columns'
+                    ),
+                ], className="row",
+                style={'margin': '15px 0'},  # Add a top and bottom margin
+            ),
 
+            # Download of the rows of the selection. A link streams the file from GET /export/<format>, dcc.Download
+            # would send the whole file inside a callback response.
             html.Div([
-                dcc.DatePickerRange(id='date-range-slider',
-                                    start_date=covid19_data_frame['date'].min(),
-                                    end_date=covid19_data_frame['date'].max(),
-                                    display_format='YYYY-MM-DD')                               
-            ], style=divBorderStyle, className='four columns',),
-        ], 
-        className='row',
-        style={'margin': '15px 0'},  # Add a top and bottom margin
-        ),
-
-        # place the line graph and the parallel coordinates plot side by side
-        html.Div(
-            [
-                html.Div([
-                    dcc.Graph(
-                        id='line-graph',
-                    )
-                ], className='eight columns'
-                ),
-                
                 html.Div([
-                    dcc.Graph(
-                        id='pie-chart',
-                    )
-                ], className='four columns'
-                ),
-
-            ], 
-            className="row",
-            style={'margin': '15px 0'},  # Add a top and bottom margin         
-        ),
+                    dcc.Dropdown(id='export-columns',
+                                 options=export_column_options(),
+                                 value=DEFAULT_EXPORT_COLUMNS,
+                                 multi=True,
+                                 ),
+                ], style=divBorderStyle, className='eight columns'),
 
-        # place the pie chart and the choropleth map side by side
-        html.Div(
-            [
                 html.Div([
-                    dcc.Graph(
-                        id='parallel-coordinates',
-                    )
-                ], className='eight columns'
-                ),
-                
+                    dcc.Dropdown(id='export-format',
+                                 options=[{'label': 'CSV', 'value': 'csv'}, {'label': 'Parquet', 'value': 'parquet'},
+                                          {'label': 'JSON Lines', 'value': 'jsonl'}],
+                                 value='csv',
+                                 clearable=False,
+                                 ),
+                ], style=divBorderStyle, className='two columns'),
+
                 html.Div([
-                    dcc.Graph(
-                        id='choropleth-map',
-                    )
-                ], className='four columns'
-                ),
-            ], className="row",
+                    html.A('Download data', id='export-link', className='button', download='',
+                           style={'color': colors['text'], 'width': '100%'}),
+                ], className='two columns'),
+            ],
+            className='row',
             style={'margin': '15px 0'},  # Add a top and bottom margin
-        ),
-     ], className='ten columns offset-by-one'
-    ), 
-    style={
-        'textAlign': 'left',
-        'color': colors['text'],
-    },
-)
+            ),
+         ], className='ten columns offset-by-one'
+        ), 
+        style={
+            'textAlign': 'left',
+            'color': colors['text'],
+        },
+    )
+
+app.layout = serve_layout
 # Dash Layout end.
 
 #############################################################################################################
 # Dash Callbacks.
 #############################################################################################################
 
-# Update the line graph based on the country selection and date range picker.
-@app.callback(Output('line-graph', 'figure'),
-              [Input('country-dropdown', 'value'),
+# Update the header numbers and dates of the selected region after a data refresh, and optionally for the
+# selected end date.
+header_inputs = [Input('region-dropdown', 'value'), Input('refresh-interval', 'n_intervals'),
+                 Input('loading-interval', 'n_intervals')]
+if config.HEADER_FOLLOWS_END_DATE:
+    header_inputs.append(Input('date-range-slider', 'end_date'))
+
+@app.callback([Output('page-title', 'children'),
+               Output('last-updated', 'children'),
+               Output('outbreak-since', 'children'),
+               Output('total-cases', 'children'),
+               Output('total-deaths', 'children'),
+               Output('new-cases', 'children'),
+               Output('new-deaths', 'children')],
+              header_inputs)
+@instrumented_callback()
+def update_header(region, n_intervals, loading_intervals, end_date=None):
+    return (page_title(region),) + header_values(regions.current(region), end_date)
+
+# Fill in the country dropdown and the date range of the selected region. While the region is loading the
+# loading interval polls until its data is ready, then stops.
+@app.callback([Output('country-dropdown', 'options'),
+               Output('country-dropdown', 'value'),
+               Output('date-range-slider', 'start_date'),
+               Output('date-range-slider', 'end_date'),
+               Output('loading-interval', 'disabled')],
+              [Input('region-dropdown', 'value'),
+               Input('loading-interval', 'n_intervals')],
+              [State('country-dropdown', 'value')],
+              prevent_initial_call=True)
+@instrumented_callback()
+def update_controls(region, n_intervals, countries):
+    dataset = regions.current(region)
+    if dataset is None:
+        if ctx.triggered_id == 'loading-interval':
+            raise PreventUpdate
+        return [], no_update, no_update, no_update, False
+    # Keep the selected countries of the region
+    countries = [i for i in countries or [] if i in dataset.store.country_slices] or default_countries(dataset)
+    return country_options(dataset), countries, dataset.first_date.date(), dataset.last_date.date(), True
+
+# Date filtering in the browser: ship the series of the selected countries once per country selection and
+# after a data refresh, assets/clientside.js slices them to the date range and builds the four figures.
+if config.DATE_FILTERING == 'client':
+    @app.callback(Output('series', 'data'),
+                  [Input('region-dropdown', 'value'),
+                   Input('country-dropdown', 'value'),
+                   Input('line-graph-metric', 'value'),
+                   Input('refresh-interval', 'n_intervals'),
+                   Input('loading-interval', 'disabled')],
+                  [State('series', 'data')])
+    @instrumented_callback(series_cardinality)
+    def update_series_store(region, countries, metric, n_intervals, loading_done, series_data):
+        dataset = regions.current(region)
+        # The browser shows the loading figures until the data is ready
+        if dataset is None:
+            return no_update
+        if ctx.triggered_id == 'refresh-interval' and series_data and series_data['version'] == dataset.version:
+            return no_update
+        return cached_country_series(dataset, countries, metric)
+
+    @memoize(figure_cache, lambda dataset, countries, metric: series_key(dataset, countries or [], metric))
+    def cached_country_series(dataset, countries, metric):
+        return country_series(dataset, countries, metric)
+
+    app.clientside_callback(
+        ClientsideFunction(namespace='covid19', function_name='filter_figures'),
+        [Output('line-graph', 'figure'),
+         Output('parallel-coordinates', 'figure'),
+         Output('pie-chart', 'figure'),
+         Output('choropleth-map', 'figure')],
+        [Input('series', 'data'),
+         Input('date-range-slider', 'start_date'),
+         Input('date-range-slider', 'end_date')],
+        [State('figure-templates', 'data')])
+
+# Figures built on the server for every change of the selection.
+else:
+    # Compute the selection once for the country selection and date range picker, the figures below read it.
+    @app.callback(Output('selection', 'data'),
+                  [Input('region-dropdown', 'value'),
+                   Input('country-dropdown', 'value'),
+                   Input('date-range-slider', 'start_date'),
+                   Input('date-range-slider', 'end_date')])
+    @instrumented_callback()
+    def update_selection_store(region, countries, start_date, end_date):
+        dataset = regions.current(region)
+        # The figures show a loading message until the data is ready
+        if dataset is None:
+            return None
+        return update_selection(dataset, countries, start_date, end_date)
+
+    # The figures of a selection, cached per selection and shared by the separate and the combined figure callbacks.
+    # dataset is the dataset of the stored selection, see stored_selection_dataset.
+    @memoize(figure_cache, figure_cache_key('line-graph'))
+    def line_graph_figure(dataset, selection_data, window, metric=DEFAULT_METRIC):
+        if dataset is None:
+            return LOADING_FIGURE
+        selection = load_selection(dataset, selection_data)
+        view = line_graph_view(selection, window, uirevision=f"{selection_data['key']}-{metric}", metric=metric)
+        return build_figure('line-graph', selection, dataset, view=view)
+
+    @memoize(figure_cache, figure_cache_key('parallel-coordinates'))
+    def parallel_coordinates_figure(dataset, selection_data):
+        if dataset is None:
+            return LOADING_FIGURE
+        return build_figure('parallel-coordinates', load_selection(dataset, selection_data), dataset)
+
+    @memoize(figure_cache, figure_cache_key('pie-chart'))
+    def pie_chart_figure(dataset, selection_data):
+        if dataset is None:
+            return LOADING_FIGURE
+        return build_figure('pie-chart', load_selection(dataset, selection_data), dataset)
+
+    # Choropleth map of the bundled geometries: the base figure is sent when the region changes, the country
+    # selection and date range picker only update the values of the selected countries with a Patch.
+    if config.CHOROPLETH_MAP_MODE == 'geojson':
+        @app.callback([Output('choropleth-map', 'figure'),
+                       Output('choropleth-map-base', 'data')],
+                      [Input('region-dropdown', 'value'),
+                       Input('loading-interval', 'disabled')])
+        @instrumented_callback()
+        def update_choropleth_map_base(region, loading_done):
+            dataset = regions.current(region)
+            if dataset is None:
+                return LOADING_FIGURE, None
+            return geojson_choropleth_map(dataset, app.get_relative_path('/geometries/countries.geojson')), region
+
+        # Patch of the values of the selected countries, None while the base figure of their region is missing.
+        def choropleth_map_figure(dataset, selection_data, base_region):
+            if dataset is None or selection_data['region'] != base_region:
+                return None
+            patch = Patch()
+            for key, values in choropleth_map_patch_values(dataset, selection_data).items():
+                patch['data'][1][key] = values
+            return patch
+
+        @memoize(figure_cache, figure_cache_key('choropleth-map-values'))
+        def choropleth_map_patch_values(dataset, selection_data):
+            return choropleth_map_values(load_selection(dataset, selection_data), dataset)
+
+    else:
+        @memoize(figure_cache, figure_cache_key('choropleth-map'))
+        def choropleth_map_figure(dataset, selection_data, base_region=None):
+            if dataset is None:
+                return LOADING_FIGURE
+            return build_figure('choropleth-map', load_selection(dataset, selection_data), dataset)
+
+    # Outputs of the choropleth map values, a duplicate of the base figure output with the geojson map.
+    if config.CHOROPLETH_MAP_MODE == 'geojson':
+        choropleth_map_output = Output('choropleth-map', 'figure', allow_duplicate=True)
+        choropleth_map_inputs = [Input('choropleth-map-base', 'data')]
+    else:
+        choropleth_map_output = Output('choropleth-map', 'figure')
+        choropleth_map_inputs = []
+
+    # One request per figure, built one after the other by the worker serving it.
+    if config.FIGURE_CALLBACKS == 'separate':
+        # Update the line graph based on the country selection, date range picker, the metric and the zoom of the
+        # line graph. Long date ranges are downsampled to the point budget, zooming in serves the daily points again.
+        @app.callback(Output('line-graph', 'figure'),
+                      [Input('selection', 'data'),
+                       Input('line-graph-metric', 'value'),
+                       Input('line-graph', 'relayoutData')])
+        @instrumented_callback(stored_selection_cardinality)
+        def update_line_graph(selection_data, metric, relayout_data):
+            # A new selection or metric starts with the whole date range
+            window = zoom_window(relayout_data) if ctx.triggered_id == 'line-graph' else None
+            return line_graph_figure(stored_selection_dataset(selection_data), selection_data, window, metric)
+
+        # Update the parallel coordinates plot based on the country selection and date range picker.
+        @app.callback(Output('parallel-coordinates', 'figure'),
+                      [Input('selection', 'data')])
+        @instrumented_callback(stored_selection_cardinality)
+        def update_parallel_coordinates_plot(selection_data):
+            return parallel_coordinates_figure(stored_selection_dataset(selection_data), selection_data)
+
+        # Update the pie chart based on the country selection and date range picker.
+        @app.callback(Output('pie-chart', 'figure'),
+                      [Input('selection', 'data')])
+        @instrumented_callback(stored_selection_cardinality)
+        def update_pie_chart(selection_data):
+            return pie_chart_figure(stored_selection_dataset(selection_data), selection_data)
+
+        # Update the choropleth map based on the country selection and date range picker.
+        @app.callback(choropleth_map_output,
+                      [Input('selection', 'data')] + choropleth_map_inputs,
+                      prevent_initial_call=config.CHOROPLETH_MAP_MODE == 'geojson')
+        @instrumented_callback(stored_selection_cardinality)
+        def update_choropleth_map(selection_data, base_region=None):
+            figure = choropleth_map_figure(stored_selection_dataset(selection_data), selection_data, base_region)
+            # The values wait for the base figure of their region
+            if figure is None:
+                raise PreventUpdate
+            return figure
+
+    # One request for the figures of a selection, built concurrently in the figure pool (see figure_pool.py).
+    else:
+        FIGURE_IDS = ['line-graph', 'parallel-coordinates', 'pie-chart', 'choropleth-map']
+
+        # The figures of figure_ids, no_update for the others.
+        def build_figures(selection_data, metric, window, base_region, figure_ids=FIGURE_IDS):
+            # One dataset for the figures of the request, also when a refresh swaps it meanwhile
+            dataset = stored_selection_dataset(selection_data)
+            builders = {
+                'line-graph': lambda: line_graph_figure(dataset, selection_data, window, metric),
+                'parallel-coordinates': lambda: parallel_coordinates_figure(dataset, selection_data),
+                'pie-chart': lambda: pie_chart_figure(dataset, selection_data),
+                'choropleth-map': lambda: choropleth_map_figure(dataset, selection_data, base_region),
+            }
+            figures = run_concurrently({figure_id: builders[figure_id] for figure_id in figure_ids})
+            return [no_update if figures.get(figure_id) is None else figures[figure_id] for figure_id in FIGURE_IDS]
+
+        # Update the four figures based on the country selection and date range picker. The metric and the zoom
+        # only rebuild the line graph, the base figure of the geojson map only its values.
+        @app.callback([Output('line-graph', 'figure'),
+                       Output('parallel-coordinates', 'figure'),
+                       Output('pie-chart', 'figure'),
+                       choropleth_map_output],
+                      [Input('selection', 'data'),
+                       Input('line-graph-metric', 'value'),
+                       Input('line-graph', 'relayoutData')] + choropleth_map_inputs,
+                      prevent_initial_call=config.CHOROPLETH_MAP_MODE == 'geojson')
+        @instrumented_callback(stored_selection_cardinality)
+        def update_figures(selection_data, metric, relayout_data, base_region=None):
+            triggered = {prop_id.split('.')[0] for prop_id in ctx.triggered_prop_ids}
+            if not triggered or 'selection' in triggered:
+                figure_ids = FIGURE_IDS
+            elif 'choropleth-map-base' in triggered:
+                figure_ids = ['choropleth-map']
+            else:
+                figure_ids = ['line-graph']
+            # A new selection or metric starts with the whole date range
+            window = zoom_window(relayout_data) if triggered == {'line-graph'} else None
+            return build_figures(selection_data, metric, window, base_region, figure_ids)
+
+# Link of the download of the selected countries, date range, columns and format.
+@app.callback(Output('export-link', 'href'),
+              [Input('region-dropdown', 'value'),
+               Input('country-dropdown', 'value'),
                Input('date-range-slider', 'start_date'),
-               Input('date-range-slider', 'end_date')])
-def update_line_graph(countries, start_date, end_date):
-    if isinstance(countries, str):
-        countries = [countries]
-    
-    fig_line_graph = px.line(covid19_data_frame.loc[(covid19_data_frame['location'].isin(countries))
-                                                    & (covid19_data_frame['date'] >= start_date)
-                                                    & (covid19_data_frame['date'] <= end_date)],
-                             x='date', y='stringency_index',
-                             labels={'date': 'Date', 'stringency_index': 'Government stringency index (0-100)',
-                                     'location': 'European country', 'total_cases': 'Total confirmed cases',
-                                     'total_deaths': 'Total deaths', 'new_cases': 'New confirmed cases',
-                                     'new_deaths': 'New deaths'},
-                             color='location', color_discrete_map=color_dict,
-                             hover_data=['total_cases', 'total_deaths', 'new_cases', 'new_deaths'],
-                             title='Line Graphs for Multivariate Data', height=700)    
-    
-    fig_line_graph.update_layout(plot_bgcolor=colors['background'], paper_bgcolor=colors['background'],
-                                 title_font=dict(color=colors['figure_text']),
-                                 xaxis=dict(title_font=dict(color=colors['figure_text'])),
-                                 yaxis=dict(title_font=dict(color=colors['figure_text'])),
-                                 xaxis_tickfont=dict(color=colors['figure_text']),
-                                 yaxis_tickfont=dict(color=colors['figure_text']),
-                                 legend=dict(font=dict(color=colors['figure_text'])))
-    
-    return fig_line_graph
-
-# Update the parallel coordinates plot based on the country selection and date range picker.
-@app.callback(Output('parallel-coordinates', 'figure'),
-              [Input('country-dropdown', 'value'),
-               Input('date-range-slider', 'start_date'),
-               Input('date-range-slider', 'end_date')])
-def update_parallel_coordinates_plot(countries, start_date, end_date):
-    if isinstance(countries, str):
-        countries = [countries]
-    
-    # Filter the DataFrame for countries in Europe and non-null total deaths and total cases
-    recent_deaths_data_frame = covid19_data_frame.loc[
-        (covid19_data_frame['location'].isin(countries))
-        & pd.notnull(covid19_data_frame['total_deaths'])
-        & pd.notnull(covid19_data_frame['total_cases'])
-        & (covid19_data_frame['date'] >= start_date)
-        & (covid19_data_frame['date'] <= end_date),
-        ['location', 'total_cases', 'total_deaths', 'date', 'population', 'hospital_beds_per_thousand', 'median_age', 'life_expectancy']
-    ]
-    
-    # Get the most recent data for each country
-    recent_deaths_data_frame = recent_deaths_data_frame.sort_values('date').groupby('location').last().reset_index()
-    
-    # Calculate the COVID-19 death rate
-    recent_deaths_data_frame['covid19_death_rate'] = (recent_deaths_data_frame['total_deaths'] / recent_deaths_data_frame['total_cases']) * 100
-
-    # Fill NA values with 0
-    recent_deaths_data_frame.fillna(0, inplace=True)
-    
-    # Create a lookup dictionary for countries
-    lookup = {country: i for i, country in enumerate(countries)}
-
-    # Map the 'location' column to the lookup dictionary
-    recent_deaths_data_frame['num'] = recent_deaths_data_frame['location'].map(lookup)
-    
-    # Plotting Parallel Coordinates for the data frame
-    fig_parallel_coordinates = go.Figure(data=go.Parcoords(
-        line=dict(color=recent_deaths_data_frame['num'], colorscale='HSV',
-                  showscale=False, cmin=0, cmax=len(countries_in_europe)),
-                  dimensions=list(
-                      [
-                        dict(range=[0, len(countries_in_europe)],
-                               tickvals=list(range(len(countries_in_europe))), ticktext=countries_in_europe,
-                                label="countries", values=recent_deaths_data_frame['num']),
-                        dict(range=[0, recent_deaths_data_frame['hospital_beds_per_thousand'].max()],
-                             label="Hospitals beds per 1000", values=recent_deaths_data_frame['hospital_beds_per_thousand']),
-                        dict(range=[0, recent_deaths_data_frame['median_age'].max()], 
-                             label='Median Age', values=recent_deaths_data_frame['median_age']),
-                        dict(range=[0, recent_deaths_data_frame['population'].max()],
-                             label='Population', values=recent_deaths_data_frame['population']),
-                        dict(range=[0, recent_deaths_data_frame['life_expectancy'].max()],
-                             label='Life expectancy', values=recent_deaths_data_frame['life_expectancy']),
-                        dict(range=[0, recent_deaths_data_frame['covid19_death_rate'].max()],
-                             label='COVID-19 Death rate', values=recent_deaths_data_frame['covid19_death_rate']),
-                        ]
-                    )
-        ), layout=go.Layout(
-            autosize=True,
-            height=700,
-            hovermode='closest',
-            margin=dict(l=170, r=85, t=75))
-    )    
-
-    # Updating margin of the plot
-    fig_parallel_coordinates.update_layout(
-        plot_bgcolor=colors['background'],
-        paper_bgcolor=colors['background'],
-        title={
-            'text': "Parallel Coordinates",
-            'y': 0.99,
-            'x': 0.2,
-            'xanchor': 'center',
-            'yanchor': 'top'
-            },
-            title_font=dict(color=colors['figure_text']),
-            legend=dict(font=dict(color=colors['figure_text']))
-        )
-    
-    fig_parallel_coordinates.update_traces(labelfont=dict(color= colors['figure_text']))  # Change the color here
-    
-    return fig_parallel_coordinates
-
-# Update the pie chart based on the country selection and date range picker.
-@app.callback(Output('pie-chart', 'figure'),
-              [Input('country-dropdown', 'value'),
-               Input('date-range-slider', 'start_date'),
-               Input('date-range-slider', 'end_date')])
-def update_pie_chart(countries, start_date, end_date):
-    
-    if isinstance(countries, str):
-        countries = [countries]
-    
-    recent_tests_data_frame = covid19_data_frame.loc[
-        (covid19_data_frame['location'].isin(countries)) &
-        (covid19_data_frame['date'] >= start_date) &
-        (covid19_data_frame['date'] <= end_date) &
-        pd.notnull(covid19_data_frame['total_tests']),
-        ['location', 'total_tests', 'date']
-    ].groupby('location').last().reset_index()    
-
-    fig_pie_chart = px.pie(recent_tests_data_frame, values='total_tests', names='location', title='Pie Chart',
-                           color='location', color_discrete_map=color_dict, hover_data=['date'],
-                           labels={'location': 'European country', 'date': 'Recent data available date',
-                                   'total_tests': 'Total tests'}, height=700)
-        
-    fig_pie_chart.update_traces(textposition='inside', textinfo='percent+label',
-                                hovertemplate='Total tests: %{value} <br>Recent data available date,' + 'European country: %{customdata}</br>',
-                                )
-    
-    fig_pie_chart.update_layout(plot_bgcolor=colors['background'], paper_bgcolor=colors['background'],
-                                title_font=dict(color=colors['figure_text']),
-                                xaxis=dict(title_font=dict(color=colors['figure_text'])),
-                                yaxis=dict(title_font=dict(color=colors['figure_text'])),
-                                xaxis_tickfont=dict(color=colors['figure_text']),
-                                yaxis_tickfont=dict(color=colors['figure_text']),
-                                legend=dict(font=dict(color=colors['figure_text']))
-                            )
-
-    return fig_pie_chart                                                   
-
-# Update the choropleth map based on the country selection and date range picker.
-@app.callback(Output('choropleth-map', 'figure'),
-              [Input('country-dropdown', 'value'),
-               Input('date-range-slider', 'start_date'),
-               Input('date-range-slider', 'end_date')])
-def update_choropleth_map(countries, start_date, end_date):
-    
-    recent_death_rate_data_frame = select_recent_data_for_each_countries(covid19_data_frame, iso_code_list, countries)
-    
-    fig_choropleth_map = px.choropleth(recent_death_rate_data_frame.loc[(recent_death_rate_data_frame['date'] >= start_date)
-                                                              & (recent_death_rate_data_frame['date'] <= end_date)],
-                                       color='iso_code', locations='iso_code',
-                                       hover_name='location', hover_data=['date', 'covid19_death_rate', 'total_deaths', 'total_cases'],
-                                       labels={'iso_code': 'ISO code', 'date': 'Date', 'location': 'European country',
-                                               'total_cases': 'Total confirmed cases', 'total_deaths': 'Total deaths',
-                                               'covid19_death_rate': 'COVID-19 Death rate(%)'},
-                                       scope="europe", color_discrete_map=iso_code_color_dict)
-    
-    fig_choropleth_map.update_geos(fitbounds="locations", lataxis_showgrid=True, lonaxis_showgrid=True)
-    
-    fig_choropleth_map.update_layout(height=700, 
-                                     title='Choropleth map (Europe)', 
-                                     plot_bgcolor=colors['background'], 
-                                     paper_bgcolor=colors['background'],
-                                     title_font=dict(color=colors['figure_text']),
-                                     xaxis=dict(title_font=dict(color=colors['figure_text'])),
-                                    yaxis=dict(title_font=dict(color=colors['figure_text'])),
-                                    xaxis_tickfont=dict(color=colors['figure_text']),
-                                    yaxis_tickfont=dict(color=colors['figure_text']),
-                                    legend=dict(font=dict(color=colors['figure_text']))
-                                )
-    
-    return fig_choropleth_map
+               Input('date-range-slider', 'end_date'),
+               Input('export-format', 'value'),
+               Input('export-columns', 'value')])
+@instrumented_callback()
+def update_export_link(region, countries, start_date, end_date, export_format, columns):
+    query = export_query(region, countries, start_date, end_date, columns)
+    return app.get_relative_path(f'/export/{export_format}') + '?' + query
 
 # Show modal by setting info_button click to 1
 @app.callback(Output('modal', 'style'),
               [Input('info-button', 'n_clicks')])
+@instrumented_callback()
 def show_modal(n):
     if n > 0:
         return {"display": "block"}
@@ -543,6 +757,7 @@ def show_modal(n):
 # Close modal by resetting info_button click to 0
 @app.callback(Output('info-button', 'n_clicks'),
               [Input('modal-close-button', 'n_clicks')])
+@instrumented_callback()
 def close_modal(n):
     return 0
 
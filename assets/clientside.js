@@ -0,0 +1,209 @@
+// Date filtering in the browser for the 'client' date filtering mode (COVID19_DATE_FILTERING=client).
+// The server ships the series of the selected countries once per country selection (series.py), changing the
+// date range only slices these arrays and builds the four figures like the light builders of figures.py.
+(function () {
+    var DAY = 24 * 60 * 60 * 1000;
+
+    // Day offset of a 'YYYY-MM-DD' date from the first date of the data, null for a missing date.
+    function dayOf(date, firstDate) {
+        if (!date) {
+            return null;
+        }
+        return Math.round((Date.parse(date.slice(0, 10)) - Date.parse(firstDate)) / DAY);
+    }
+
+    function dateOf(day, firstDate) {
+        return new Date(Date.parse(firstDate) + day * DAY).toISOString().slice(0, 10);
+    }
+
+    // First index of the sorted days with days[index] >= day (after: days[index] > day).
+    function searchSorted(days, day, after) {
+        var low = 0, high = days.length;
+        while (low < high) {
+            var middle = (low + high) >> 1;
+            if (days[middle] < day || (after && days[middle] === day)) {
+                low = middle + 1;
+            } else {
+                high = middle;
+            }
+        }
+        return low;
+    }
+
+    // Rows [first, last) of a country within the date range, both days included.
+    function rowRange(series, startDay, endDay) {
+        var first = startDay === null ? 0 : searchSorted(series.day, startDay, false);
+        var last = endDay === null ? series.day.length : searchSorted(series.day, endDay, true);
+        return [first, Math.max(first, last)];
+    }
+
+    // Index of the last row within [first, last) where the column is not null, -1 if there is none.
+    function lastValid(values, first, last) {
+        for (var row = last - 1; row >= first; row--) {
+            if (values[row] !== null) {
+                return row;
+            }
+        }
+        return -1;
+    }
+
+    // Most recent value of the column within [first, last), like CountryDateStore.latest.
+    function latest(values, first, last) {
+        var row = lastValid(values, first, last);
+        return row < 0 ? null : values[row];
+    }
+
+    function finiteOrZero(value) {
+        return value === null || !isFinite(value) ? 0 : value;
+    }
+
+    function maximum(values) {
+        return values.length ? Math.max.apply(null, values) : null;
+    }
+
+    function lineGraph(data, ranges, templates) {
+        var traces = [];
+        data.countries.forEach(function (country) {
+            var series = data.series[country], first = ranges[country][0], last = ranges[country][1];
+            if (first === last) {
+                return;
+            }
+            var x = [], customdata = [];
+            for (var row = first; row < last; row++) {
+                x.push(dateOf(series.day[row], data.first_date));
+                customdata.push([series.total_cases[row], series.total_deaths[row],
+                                 series.new_cases[row], series.new_deaths[row]]);
+            }
+            traces.push({
+                type: 'scatter', mode: 'lines', name: country, legendgroup: country, showlegend: true,
+                x: x, y: series.y.slice(first, last), customdata: customdata,
+                line: {color: series.color, dash: 'solid'},
+                hovertemplate: templates.line_graph_location_label + '=' + country + templates.line_graph_hovertemplate,
+                xaxis: 'x', yaxis: 'y'
+            });
+        });
+        return {data: traces, layout: templates.layouts['line-graph']};
+    }
+
+    function parallelCoordinatesPlot(data, ranges, templates) {
+        var allCountries = data.all_countries;
+        var num = [], deathRate = [];
+        var attributes = [['hospital_beds_per_thousand', 'Hospitals beds per 1000'], ['median_age', 'Median Age'],
+                          ['population', 'Population'], ['life_expectancy', 'Life expectancy']];
+        var values = attributes.map(function () { return []; });
+
+        data.countries.forEach(function (country) {
+            var series = data.series[country], first = ranges[country][0], last = ranges[country][1];
+            if (first === last) {
+                return;
+            }
+            num.push(Math.max(allCountries.indexOf(country), 0));
+            attributes.forEach(function (attribute, i) {
+                values[i].push(finiteOrZero(series[attribute[0]]));
+            });
+            var totalDeaths = latest(series.total_deaths, first, last);
+            var totalCases = latest(series.total_cases, first, last);
+            deathRate.push(totalDeaths === null || totalCases === null ? 0 : finiteOrZero(totalDeaths / totalCases * 100));
+        });
+
+        var dimensions = [{
+            range: [0, allCountries.length], tickvals: allCountries.map(function (_, i) { return i; }),
+            ticktext: allCountries, label: 'countries', values: num
+        }];
+        attributes.forEach(function (attribute, i) {
+            dimensions.push({range: [0, maximum(values[i])], label: attribute[1], values: values[i]});
+        });
+        dimensions.push({range: [0, maximum(deathRate)], label: 'COVID-19 Death rate', values: deathRate});
+
+        var trace = {
+            type: 'parcoords',
+            line: {color: num, colorscale: templates.parallel_coordinates_colorscale, showscale: false,
+                   cmin: 0, cmax: allCountries.length},
+            dimensions: dimensions,
+            labelfont: {color: templates.figure_text}
+        };
+        return {data: [trace], layout: templates.layouts['parallel-coordinates']};
+    }
+
+    function pieChart(data, ranges, templates) {
+        var labels = [], values = [], customdata = [], markerColors = [];
+        data.countries.forEach(function (country) {
+            var series = data.series[country];
+            var row = lastValid(series.total_tests, ranges[country][0], ranges[country][1]);
+            if (row < 0) {
+                return;
+            }
+            labels.push(country);
+            values.push(series.total_tests[row]);
+            customdata.push([dateOf(series.day[row], data.first_date), country]);
+            markerColors.push(series.color);
+        });
+
+        var trace = {
+            type: 'pie', name: '', legendgroup: '', showlegend: true,
+            labels: labels, values: values, customdata: customdata,
+            marker: {colors: markerColors},
+            domain: {x: [0.0, 1.0], y: [0.0, 1.0]},
+            textposition: 'inside', textinfo: 'percent+label',
+            hovertemplate: templates.pie_chart_hovertemplate
+        };
+        return {data: [trace], layout: templates.layouts['pie-chart']};
+    }
+
+    function choroplethMap(data, ranges, templates) {
+        var traces = [];
+        data.countries.forEach(function (country) {
+            var series = data.series[country], first = ranges[country][0], last = ranges[country][1];
+            if (first === last) {
+                return;
+            }
+            var totalDeaths = latest(series.total_deaths, first, last);
+            var totalCases = latest(series.total_cases, first, last);
+            var deathRate = totalDeaths === null || totalCases === null ? null
+                : Math.round(totalDeaths / totalCases * 100 * 100) / 100;
+            traces.push({
+                type: 'choropleth', geo: 'geo', name: series.iso_code, showlegend: true, showscale: false,
+                locations: [series.iso_code], z: [1], hovertext: [country],
+                customdata: [[dateOf(series.day[last - 1], data.first_date), deathRate, totalDeaths, totalCases]],
+                colorscale: [[0.0, series.iso_color], [1.0, series.iso_color]],
+                hovertemplate: templates.choropleth_map_hovertemplate
+            });
+        });
+        return {data: traces, layout: templates.layouts['choropleth-map']};
+    }
+
+    // Templates of the default region with the overrides of the region of the series.
+    function regionTemplates(templates, overrides) {
+        if (!overrides) {
+            return templates;
+        }
+        var layouts = {};
+        Object.keys(templates.layouts).forEach(function (figureId) {
+            layouts[figureId] = Object.assign({}, templates.layouts[figureId], overrides.layouts[figureId] || {});
+        });
+        return Object.assign({}, templates, overrides, {layouts: layouts});
+    }
+
+    window.dash_clientside = Object.assign({}, window.dash_clientside, {
+        covid19: {
+            // The four figures for the series of the selected countries within the date range.
+            filter_figures: function (data, startDate, endDate, templates) {
+                if (!templates) {
+                    throw window.dash_clientside.PreventUpdate;
+                }
+                // The series arrive once the data is loaded on the server
+                if (!data) {
+                    return [templates.loading, templates.loading, templates.loading, templates.loading];
+                }
+                templates = regionTemplates(templates, data.overrides);
+                var startDay = dayOf(startDate, data.first_date), endDay = dayOf(endDate, data.first_date);
+                var ranges = {};
+                data.countries.forEach(function (country) {
+                    ranges[country] = rowRange(data.series[country], startDay, endDay);
+                });
+                return [lineGraph(data, ranges, templates), parallelCoordinatesPlot(data, ranges, templates),
+                        pieChart(data, ranges, templates), choroplethMap(data, ranges, templates)];
+            }
+        }
+    });
+})();
@@ -0,0 +1,192 @@
+#############################################################################################################
+# Microbenchmarks of the dashboard on a synthetic data set of countries x days x columns: ingestion (csv to
+# columnar snapshot, snapshot to Dataset), startup of the app in a fresh process, and every callback function
+# invoked directly with representative selections, with the serialization and size of its output.
+#
+#   python benchmarks/bench_callbacks.py [--countries 50] [--days 700] [--extra-columns 0] [--repeat 20]
+#                                        [--output results.json]
+#
+# With --source sample the bundled sample data is used instead of a synthetic data set.
+# With COVID19_FIGURE_CALLBACKS=combined the figures of a selection are measured as one combined callback.
+#############################################################################################################
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import pandas as pd
+import plotly.io as pio
+
+from common import BASE_DIR, app_environment, load_app, save_results, summarize_ms, time_ms
+from synthetic_data import write_synthetic_csv
+
+# Script of the startup benchmark, run in a fresh interpreter: import of the app, then the data of the default region.
+STARTUP_SCRIPT = '''
+import json, sys, time
+started = time.perf_counter()
+sys.path.insert(0, {benchmarks_dir!r})
+from common import load_app
+app_module = load_app()
+imported = time.perf_counter()
+app_module.regions.current(wait=True)
+print(json.dumps({{'import_ms': (imported - started) * 1000, 'ready_ms': (time.perf_counter() - started) * 1000}}))
+'''
+
+
+# Time to parse the csv into the columnar snapshot, and to load the snapshot of the region into a Dataset.
+def bench_ingestion(source, region, repeat):
+    from data_loader import build_snapshot, load_continent_data_frame, prepare_data_frame
+    from dataset import Dataset
+
+    results = {}
+    with tempfile.TemporaryDirectory() as cache_dir:
+        results['ingestion/csv to snapshot'] = time_ms(lambda: build_snapshot(source, cache_dir), max(repeat // 5, 3))
+        results['ingestion/snapshot to data frame'] = time_ms(
+            lambda: load_continent_data_frame(region, source, cache_dir, rebuild=False), repeat)
+        data_frame = prepare_data_frame(load_continent_data_frame(region, source, cache_dir, rebuild=False))
+        results['ingestion/dataset'] = time_ms(lambda: Dataset(data_frame.copy(), region), max(repeat // 5, 3))
+    return results
+
+
+# Wall time of starting the app in a new process: 'cold' builds the snapshot from the csv, 'warm' reads the
+# existing snapshot, 'lazy' serves the page before the data is loaded (the import time) with the snapshot present.
+def bench_startup(source, repeat):
+    script = STARTUP_SCRIPT.format(benchmarks_dir=os.path.dirname(os.path.abspath(__file__)))
+    results = {}
+    with tempfile.TemporaryDirectory() as cache_dir:
+        for name, settings in [('cold', {'rebuild_cache': 1}), ('warm', {}), ('lazy', {'lazy_startup': 1})]:
+            environment = dict(os.environ, **app_environment(source, cache_dir, **settings))
+            runs = [json.loads(subprocess.run([sys.executable, '-c', script], env=environment, cwd=BASE_DIR,
+                                              capture_output=True, text=True, check=True).stdout.splitlines()[-1])
+                    for _ in range(repeat)]
+            results[f'startup/{name}/import'] = summarize_ms([run['import_ms'] for run in runs])
+            results[f'startup/{name}/ready'] = summarize_ms([run['ready_ms'] for run in runs])
+    return results
+
+
+# Selections of growing size: (countries, start date, end date) of the dataset.
+def representative_selections(dataset):
+    last_date = str(dataset.last_date.date())
+    default = [country for country in ['Germany', 'France', 'Netherlands', 'Russia'] if country in dataset.countries]
+    return {
+        'one country, 30 days': ([dataset.countries[0]], days_before(dataset.last_date, 29), last_date),
+        'four countries, all days': (default or dataset.countries[:4], None, None),
+        'all countries, 90 days': (dataset.countries, days_before(dataset.last_date, 89), last_date),
+        'all countries, all days': (dataset.countries, None, None),
+    }
+
+
+def days_before(date, days):
+    return str((date - pd.Timedelta(days=days)).date())
+
+
+# Steps of the callbacks whose output stays on the server and is not serialized.
+SERVER_SIDE_FUNCTIONS = ['compute_selection', 'select_recent_data_for_each_countries']
+
+
+# Every server callback of the app as a function of the selection data, and the series of the client date filtering.
+def callback_functions(app_module, dataset):
+    from series import country_series
+    from selection import compute_selection, select_recent_data_for_each_countries
+
+    region = dataset.region
+    functions = {
+        'compute_selection': lambda data: compute_selection(dataset, data['inputs']),
+        'select_recent_data_for_each_countries': lambda data: select_recent_data_for_each_countries(
+            dataset.store, data['inputs']['countries'], data['inputs']['start_date'], data['inputs']['end_date']),
+        'update_selection_store': lambda data: app_module.update_selection_store(region, *data['inputs'].values()),
+        'update_header': lambda data: app_module.update_header(region, None, None),
+        'line_graph': lambda data: app_module.line_graph_figure(dataset, data, None),
+        'line_graph (zoomed, 14 days)': lambda data: app_module.line_graph_figure(
+            dataset, data, (days_before(dataset.last_date, 14), str(dataset.last_date.date()))),
+        'line_graph (new_cases_smoothed)': lambda data: app_module.line_graph_figure(dataset, data, None,
+                                                                                     'new_cases_smoothed'),
+        'country_series (client date filtering)': lambda data: country_series(dataset, data['inputs']['countries']),
+    }
+    if app_module.config.CHOROPLETH_MAP_MODE == 'geojson':
+        functions['update_choropleth_map_base'] = lambda data: app_module.update_choropleth_map_base(region, True)
+    # The four figures of a selection in one request, built concurrently
+    if app_module.config.FIGURE_CALLBACKS == 'combined':
+        functions['update_figures'] = lambda data: app_module.build_figures(data, app_module.DEFAULT_METRIC, None, region)
+        return functions
+
+    functions['update_parallel_coordinates_plot'] = app_module.update_parallel_coordinates_plot
+    functions['update_pie_chart'] = app_module.update_pie_chart
+    if app_module.config.CHOROPLETH_MAP_MODE == 'geojson':
+        functions['update_choropleth_map (patch)'] = lambda data: app_module.update_choropleth_map(data, region)
+    else:
+        functions['update_choropleth_map'] = app_module.update_choropleth_map
+    return functions
+
+
+# Serialize an output like Dash does for the response of a callback.
+def serialize(output):
+    if hasattr(output, 'to_plotly_json') and not hasattr(output, 'to_dict'):
+        output = output.to_plotly_json()
+    return pio.json.to_json_plotly(output)
+
+
+def bench_callbacks(app_module, repeat):
+    dataset = app_module.regions.current(wait=True)
+    functions = callback_functions(app_module, dataset)
+    results = {}
+    print(f'{"selection":<28}{"callback":<40}{"p50 [ms]":>10}{"p95 [ms]":>10}{"serialize [ms]":>16}{"payload [kB]":>14}')
+    for label, (countries, start_date, end_date) in representative_selections(dataset).items():
+        selection_data = app_module.update_selection_store(dataset.region, countries, start_date, end_date)
+        for name, function in functions.items():
+            call = time_ms(lambda: function(selection_data), repeat)
+            results[f'callbacks/{label}/{name}'] = call
+            if name in SERVER_SIDE_FUNCTIONS:
+                print(f'{label:<28}{name:<40}{call["p50_ms"]:>10.2f}{call["p95_ms"]:>10.2f}')
+                continue
+            output = function(selection_data)
+            serialization = time_ms(lambda: serialize(output), repeat)
+            call.update(serialize_p50_ms=serialization['p50_ms'], payload_bytes=len(serialize(output)))
+            print(f'{label:<28}{name:<40}{call["p50_ms"]:>10.2f}{call["p95_ms"]:>10.2f}'
+                  f'{serialization["p50_ms"]:>16.2f}{call["payload_bytes"] / 1024:>14.1f}')
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Ingestion, startup and callback microbenchmarks.')
+    parser.add_argument('--source', default=None, help="Data source, e.g. 'sample'. Default: a synthetic data set.")
+    parser.add_argument('--countries', type=int, default=50, help='Countries of the synthetic data set.')
+    parser.add_argument('--days', type=int, default=700, help='Days of the synthetic data set.')
+    parser.add_argument('--extra-columns', type=int, default=0, help='Further numeric columns of the synthetic csv.')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=20, help='Timed runs per measurement.')
+    parser.add_argument('--startup-repeat', type=int, default=3, help='Processes started per startup measurement.')
+    parser.add_argument('--skip-startup', action='store_true', help='Skip the startup benchmark.')
+    parser.add_argument('--output', help='Write the results as JSON to this path.')
+    arguments = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        source = arguments.source
+        if source is None:
+            started = time.perf_counter()
+            source = write_synthetic_csv(os.path.join(work_dir, 'owid-covid-data.csv'), arguments.countries,
+                                         arguments.days, arguments.extra_columns, seed=arguments.seed)
+            print(f'Synthetic data set: {arguments.countries} countries x {arguments.days} days, '
+                  f'{os.path.getsize(source) / 1024 ** 2:.1f} MB, written in {time.perf_counter() - started:.1f} s\n')
+
+        environment = app_environment(source, os.path.join(work_dir, 'cache'))
+        os.environ.update(environment)
+
+        results = bench_ingestion(source, os.environ.get('COVID19_DEFAULT_REGION', 'Europe'), arguments.repeat)
+        if not arguments.skip_startup:
+            results.update(bench_startup(source, arguments.startup_repeat))
+        for name, statistics in results.items():
+            print(f'{name:<68}{statistics["p50_ms"]:>10.1f} ms')
+        print()
+
+        results.update(bench_callbacks(load_app(environment), arguments.repeat))
+
+    if arguments.output:
+        save_results(arguments.output, 'callbacks', vars(arguments), results)
+
+
+if __name__ == '__main__':
+    main()
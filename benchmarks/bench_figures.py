@@ -0,0 +1,54 @@
+#############################################################################################################
+# CPU time of building and serializing the four figures with plotly express ('express') against the
+# pre-validated layouts filled with numpy arrays ('light'), for growing country selections.
+#
+#   python benchmarks/bench_figures.py [--repeat 20] [--output results.json]
+#############################################################################################################
+import argparse
+import tempfile
+
+import plotly.io as pio
+
+from common import median_ms, save_results
+from data_loader import load_continent_data_frame, prepare_data_frame
+from dataset import Dataset
+from figures import FIGURE_BUILDERS, build_figure
+from selection import compute_selection, selection_inputs
+
+
+# Build the figure and serialize it like Dash does for the response.
+def build_and_serialize(figure_id, selection, dataset, mode):
+    return pio.json.to_json_plotly(build_figure(figure_id, selection, dataset, mode))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Figure building and serialization, plotly express against light.')
+    parser.add_argument('--repeat', type=int, default=20, help='Timed runs per measurement.')
+    parser.add_argument('--output', help='Write the results as JSON to this path.')
+    arguments = parser.parse_args()
+    results = {}
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        data_frame = load_continent_data_frame('Europe', source='sample', cache_dir=cache_dir, rebuild=True)
+    dataset = Dataset(prepare_data_frame(data_frame))
+    print(f'JSON engine: {pio.json.config.default_engine}\n')
+
+    print(f'{"countries":>10}{"figure":>24}{"express [ms]":>14}{"light [ms]":>12}{"speed-up":>10}{"payload [kB]":>14}')
+    for country_count in [1, 4, 10, len(dataset.countries)]:
+        inputs = selection_inputs(dataset.countries[:country_count], str(dataset.first_date.date()),
+                                  str(dataset.last_date.date()))
+        selection = compute_selection(dataset, inputs)
+        for figure_id in FIGURE_BUILDERS['light']:
+            express = median_ms(lambda: build_and_serialize(figure_id, selection, dataset, 'express'), arguments.repeat)
+            light = median_ms(lambda: build_and_serialize(figure_id, selection, dataset, 'light'), arguments.repeat)
+            payload = len(build_and_serialize(figure_id, selection, dataset, 'light')) / 1024
+            print(f'{country_count:>10}{figure_id:>24}{express:>14.2f}{light:>12.2f}{express / light:>9.1f}x{payload:>14.1f}')
+            results[f'figures/{country_count} countries/{figure_id}'] = {'express_ms': express, 'p50_ms': light,
+                                                                        'payload_bytes': payload * 1024}
+
+    if arguments.output:
+        save_results(arguments.output, 'figures', vars(arguments), results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,288 @@
+#############################################################################################################
+# Load test of the Dash callback endpoint (_dash-update-component) with concurrent virtual users, reporting
+# the p50/p95/p99 latency per callback and the throughput.
+#
+#   python benchmarks/bench_load.py [--users 8] [--duration 60] [--countries 50] [--days 700]
+#                                   [--url http://127.0.0.1:8050] [--output results.json]
+#
+# Without --url the app is started in this process on a synthetic data set (or --source sample) with the
+# threaded development server. Client and server then share one interpreter, for numbers of a production setup
+# start the app with gunicorn on the same data and pass its --url.
+#
+# Every virtual user opens the page and repeats a realistic interaction sequence: select countries, change the
+# date range, zoom into the line graph, change the metric of the line graph and now and then switch the region.
+# Like the Dash renderer in the browser, a change fires every callback with the changed property as input, the
+# outputs of these callbacks fire the next callbacks, and a callback waits for the callbacks producing its
+# inputs. The callbacks of one step are sent one after the other.
+#############################################################################################################
+import argparse
+import collections
+import json
+import logging
+import os
+import random
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+
+import pandas as pd
+
+from common import app_environment, load_app, save_results, summarize_ms
+from synthetic_data import write_synthetic_csv
+
+# Properties of the layout components read as the initial state of a page.
+STATE_PROPERTIES = ['value', 'options', 'start_date', 'end_date', 'data', 'disabled', 'n_intervals', 'n_clicks',
+                    'relayoutData']
+
+# Callbacks fired by a page load, the other inputs are fired by the interactions.
+PAGE_LOAD_INPUTS = ['region-dropdown.value', 'country-dropdown.value', 'date-range-slider.start_date',
+                    'date-range-slider.end_date', 'line-graph-metric.value']
+
+# Ticks of the loading interval (one per second) before a user gives up on a loading region.
+LOADING_POLLS = 120
+
+# Metrics of the line graph the users pick from.
+METRICS = ['stringency_index', 'new_cases_smoothed', 'total_cases_per_million', 'new_cases_growth_rate']
+
+
+def output_name(output):
+    return output.strip('.').split('...')[0].split('@')[0]
+
+
+#############################################################################################################
+# Callbacks of the app read from /_dash-dependencies, with the properties they read and write.
+#############################################################################################################
+class Callback:
+
+    def __init__(self, dependency):
+        self.output = dependency['output']
+        self.name = output_name(self.output)
+        self.inputs = [f"{item['id']}.{item['property']}" for item in dependency['inputs']]
+        self.state = [f"{item['id']}.{item['property']}" for item in dependency['state']]
+        self.outputs = [part.split('@')[0] for part in self.output.strip('.').split('...')]
+        self.outputs_body = [{'id': output.rsplit('.', 1)[0], 'property': output.rsplit('.', 1)[1]}
+                             for output in self.outputs]
+        if len(self.outputs_body) == 1:
+            self.outputs_body = self.outputs_body[0]
+
+
+def request_json(url, body=None):
+    data = None if body is None else json.dumps(body).encode()
+    request = urllib.request.Request(url, data=data, headers={'Content-Type': 'application/json'})
+    with urllib.request.urlopen(request, timeout=120) as response:
+        payload = response.read()
+        return response.status, payload
+
+
+#############################################################################################################
+# One browser tab: the state of the components and the callbacks fired by a change of their properties.
+# Every request is recorded in the shared list of samples as (callback, seconds, status, bytes).
+#############################################################################################################
+class VirtualUser:
+
+    def __init__(self, url, callbacks, samples, seed):
+        self.url = url
+        self.callbacks = callbacks
+        self.samples = samples
+        self.random = random.Random(seed)
+        self.state = {}
+        self.dates = []
+
+    def open_page(self):
+        started = time.perf_counter()
+        status, payload = request_json(f'{self.url}/_dash-layout')
+        self.samples.append(('_dash-layout', time.perf_counter() - started, status, len(payload)))
+        self.state = {}
+        collect_state(json.loads(payload), self.state)
+        self.fire(PAGE_LOAD_INPUTS)
+        self.poll_loading()
+        self.dates = self.date_range()
+
+    def call(self, callback, changed):
+        body = {
+            'output': callback.output,
+            'outputs': callback.outputs_body,
+            'inputs': [self.property_body(prop) for prop in callback.inputs],
+            'state': [self.property_body(prop) for prop in callback.state],
+            'changedPropIds': [prop for prop in callback.inputs if prop in changed],
+        }
+        started = time.perf_counter()
+        try:
+            status, payload = request_json(f'{self.url}/_dash-update-component', body)
+        except urllib.error.HTTPError as error:
+            status, payload = error.code, error.read()
+        except urllib.error.URLError:
+            status, payload = 0, b''
+        self.samples.append((callback.name, time.perf_counter() - started, status, len(payload)))
+        if status != 200:
+            return set()
+
+        updated = set()
+        for component_id, properties in json.loads(payload).get('response', {}).items():
+            for prop, value in properties.items():
+                self.state[f'{component_id}.{prop}'] = value
+                updated.add(f'{component_id}.{prop}')
+        return updated
+
+    def property_body(self, prop):
+        component_id, name = prop.rsplit('.', 1)
+        return {'id': component_id, 'property': name, 'value': self.state.get(prop)}
+
+    # Callbacks with one of the changed properties as input, with the changed properties they read.
+    def triggered(self, changed):
+        return {callback: changed.intersection(callback.inputs) for callback in self.callbacks
+                if changed.intersection(callback.inputs)}
+
+    # Fire the callbacks with one of the changed properties as input, and then those of their outputs.
+    # A callback waits while another pending callback still produces one of its inputs.
+    def fire(self, changed):
+        pending = self.triggered(set(changed))
+        for _ in range(10):
+            if not pending:
+                return
+            ready = [callback for callback in pending
+                     if not any(set(callback.inputs).intersection(other.outputs)
+                                for other in pending if other is not callback)] or list(pending)
+            waiting = {callback: props for callback, props in pending.items() if callback not in ready}
+            for callback in ready:
+                for other, props in self.triggered(self.call(callback, pending[callback])).items():
+                    waiting.setdefault(other, set()).update(props)
+            pending = waiting
+
+    def set_and_fire(self, values):
+        for prop, value in values.items():
+            self.state[prop] = value
+        self.fire(values)
+        self.poll_loading()
+
+    # Tick the loading interval like the browser while the data of the selected region is loading.
+    def poll_loading(self):
+        for _ in range(LOADING_POLLS):
+            if self.state.get('loading-interval.disabled', True):
+                return
+            time.sleep(1)
+            self.state['loading-interval.n_intervals'] = (self.state.get('loading-interval.n_intervals') or 0) + 1
+            self.fire({'loading-interval.n_intervals'})
+
+    def countries(self):
+        options = [option['value'] for option in self.state.get('country-dropdown.options') or []]
+        return self.random.sample(options, min(len(options), self.random.randint(1, 8)))
+
+    # One round of interactions of a user exploring the dashboard.
+    def interact(self, regions):
+        self.set_and_fire({'country-dropdown.value': self.countries()})
+        if len(self.dates) > 1:
+            start, end = sorted(self.random.sample(self.dates, 2))
+            self.set_and_fire({'date-range-slider.start_date': start, 'date-range-slider.end_date': end})
+            self.set_and_fire({'line-graph.relayoutData': {'xaxis.range[0]': start, 'xaxis.range[1]': end}})
+        self.set_and_fire({'line-graph-metric.value': self.random.choice(METRICS)})
+        if len(regions) > 1 and self.random.random() < 0.1:
+            self.set_and_fire({'region-dropdown.value': self.random.choice(regions)})
+            self.dates = self.date_range()
+
+    # Dates of the whole date range of the region in steps of a week.
+    def date_range(self):
+        start, end = self.state.get('date-range-slider.start_date'), self.state.get('date-range-slider.end_date')
+        if not start or not end:
+            return []
+        return [str(date.date()) for date in pd.date_range(str(start)[:10], str(end)[:10], freq='7D')]
+
+    def run(self, deadline, regions):
+        self.open_page()
+        while time.monotonic() < deadline:
+            self.interact(regions)
+
+
+# Initial values of the component properties of the layout.
+def collect_state(node, state):
+    if isinstance(node, dict):
+        props = node.get('props', {})
+        if isinstance(props.get('id'), str):
+            for prop in STATE_PROPERTIES:
+                if prop in props:
+                    state[f"{props['id']}.{prop}"] = props[prop]
+        for value in props.values():
+            collect_state(value, state)
+    elif isinstance(node, list):
+        for value in node:
+            collect_state(value, state)
+
+
+def start_local_server(app_module):
+    from werkzeug.serving import make_server
+    # No access log line per request
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    server = make_server('127.0.0.1', 0, app_module.server, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f'http://127.0.0.1:{server.server_port}'
+
+
+def report(samples, elapsed, users):
+    by_callback = collections.defaultdict(list)
+    for name, seconds, status, size in samples:
+        by_callback[name].append((seconds * 1000, status, size))
+
+    results = {}
+    print(f'{"callback":<36}{"requests":>10}{"errors":>8}{"p50 [ms]":>10}{"p95 [ms]":>10}{"p99 [ms]":>10}{"kB":>8}')
+    for name, records in sorted(by_callback.items()) + [('all', [(ms, s, b) for r in by_callback.values() for ms, s, b in r])]:
+        statistics = summarize_ms([ms for ms, _, _ in records])
+        statistics['errors'] = sum(1 for _, status, _ in records if status >= 400 or status == 0)
+        statistics['mean_bytes'] = sum(size for _, _, size in records) / len(records)
+        results[f'load/{name}'] = statistics
+        print(f'{name:<36}{statistics["count"]:>10}{statistics["errors"]:>8}{statistics["p50_ms"]:>10.1f}'
+              f'{statistics["p95_ms"]:>10.1f}{statistics["p99_ms"]:>10.1f}{statistics["mean_bytes"] / 1024:>8.1f}')
+
+    throughput = len(samples) / elapsed
+    results['load/throughput'] = {'requests_per_second': throughput, 'requests': len(samples), 'seconds': elapsed,
+                                  'users': users}
+    print(f'\n{len(samples)} requests in {elapsed:.1f} s with {users} users: {throughput:.1f} requests/s')
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test of the Dash callback endpoint.')
+    parser.add_argument('--url', help='URL of a running dashboard. Default: start the app in this process.')
+    parser.add_argument('--users', type=int, default=8, help='Concurrent virtual users.')
+    parser.add_argument('--duration', type=float, default=60, help='Seconds of the test.')
+    parser.add_argument('--source', default=None, help="Data source, e.g. 'sample'. Default: a synthetic data set.")
+    parser.add_argument('--countries', type=int, default=50, help='Countries of the synthetic data set.')
+    parser.add_argument('--days', type=int, default=700, help='Days of the synthetic data set.')
+    parser.add_argument('--regions', default='Europe', help='Comma separated regions the users switch between.')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='Write the results as JSON to this path.')
+    arguments = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        url = arguments.url
+        if url is None:
+            source = arguments.source or write_synthetic_csv(os.path.join(work_dir, 'owid-covid-data.csv'),
+                                                             arguments.countries, arguments.days, seed=arguments.seed)
+            app_module = load_app(app_environment(source, os.path.join(work_dir, 'cache')))
+            app_module.regions.current(wait=True)
+            url = start_local_server(app_module)
+        url = url.rstrip('/')
+
+        _, payload = request_json(f'{url}/_dash-dependencies')
+        callbacks = [Callback(dependency) for dependency in json.loads(payload)
+                     if not dependency.get('clientside_function')]
+        regions = [region.strip() for region in arguments.regions.split(',') if region.strip()]
+
+        samples = []
+        deadline = time.monotonic() + arguments.duration
+        users = [VirtualUser(url, callbacks, samples, arguments.seed + index) for index in range(arguments.users)]
+        threads = [threading.Thread(target=user.run, args=(deadline, regions)) for user in users]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        results = report(samples, time.perf_counter() - started, arguments.users)
+
+    if arguments.output:
+        save_results(arguments.output, 'load', vars(arguments), results)
+
+
+if __name__ == '__main__':
+    main()
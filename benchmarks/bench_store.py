@@ -0,0 +1,154 @@
+#############################################################################################################
+# Per-callback latency of the row selection: full-frame boolean scans (before) against the
+# CountryDateStore (after), followed by the latency of the shared selection and the figure callbacks.
+#
+#   python benchmarks/bench_store.py [--scale 10] [--repeat 50] [--output results.json]
+#
+# The bundled sample data is used; --scale repeats it along the date axis to mimic a longer pandemic.
+#############################################################################################################
+import argparse
+import os
+import tempfile
+
+import pandas as pd
+
+from common import BENCHMARK_ENVIRONMENT, load_app, median_ms, save_results
+
+# The app module reads its settings on import.
+os.environ.setdefault('COVID19_DATA_SOURCE', 'sample')
+for name, value in BENCHMARK_ENVIRONMENT.items():
+    os.environ.setdefault(name, value)
+
+from data_loader import load_continent_data_frame, prepare_data_frame  # noqa: E402
+from dataset import Dataset  # noqa: E402
+from selection import compute_selection, selection_inputs  # noqa: E402
+
+SELECTIONS = {
+    'one country, one week': (['Germany'], '2020-04-01', '2020-04-07'),
+    'default view': (['Germany', 'France', 'Netherlands', 'Russia'], None, None),
+}
+
+
+# Repeat the data along the date axis, every copy shifted after the previous one.
+def scale_data_frame(data_frame, scale):
+    days = (data_frame['date'].max() - data_frame['date'].min()).days + 1
+    copies = []
+    for copy in range(scale):
+        shifted = data_frame.copy()
+        shifted['date'] = shifted['date'] + pd.Timedelta(days=copy * days)
+        copies.append(shifted)
+    return pd.concat(copies, ignore_index=True)
+
+
+# The row selections of the callbacks before the CountryDateStore.
+def scan_line_graph(data_frame, countries, start_date, end_date):
+    return data_frame.loc[(data_frame['location'].isin(countries))
+                          & (data_frame['date'] >= start_date)
+                          & (data_frame['date'] <= end_date)]
+
+
+def scan_parallel_coordinates_plot(data_frame, countries, start_date, end_date):
+    return data_frame.loc[(data_frame['location'].isin(countries))
+                          & pd.notnull(data_frame['total_deaths'])
+                          & pd.notnull(data_frame['total_cases'])
+                          & (data_frame['date'] >= start_date)
+                          & (data_frame['date'] <= end_date)]
+
+
+def scan_pie_chart(data_frame, countries, start_date, end_date):
+    return data_frame.loc[(data_frame['location'].isin(countries))
+                          & (data_frame['date'] >= start_date)
+                          & (data_frame['date'] <= end_date)
+                          & pd.notnull(data_frame['total_tests'])]
+
+
+def scan_choropleth_map(data_frame, countries, start_date, end_date):
+    return data_frame.loc[data_frame['location'].isin(countries)]
+
+
+# The same row selections through the CountryDateStore.
+def store_line_graph(store, countries, start_date, end_date):
+    return store.select(countries, start_date, end_date)
+
+
+def store_parallel_coordinates_plot(store, countries, start_date, end_date):
+    selection = store.select(countries, start_date, end_date)
+    return selection.loc[pd.notnull(selection['total_deaths']) & pd.notnull(selection['total_cases'])]
+
+
+def store_pie_chart(store, countries, start_date, end_date):
+    selection = store.select(countries, start_date, end_date)
+    return selection.loc[pd.notnull(selection['total_tests'])]
+
+
+def store_choropleth_map(store, countries, start_date, end_date):
+    return store.select(countries)
+
+
+CALLBACKS = ['line_graph', 'parallel_coordinates_plot', 'pie_chart', 'choropleth_map']
+
+
+# The figure callback of the app as a function of the selection data, the line graph over the whole date range.
+def figure_callback(app_module, callback):
+    if callback == 'line_graph':
+        return lambda selection_data: app_module.line_graph_figure(
+            app_module.stored_selection_dataset(selection_data), selection_data, None)
+    if callback == 'choropleth_map' and app_module.config.CHOROPLETH_MAP_MODE == 'geojson':
+        return lambda selection_data: app_module.update_choropleth_map(selection_data, selection_data['region'])
+    return getattr(app_module, 'update_' + callback)
+
+
+# Latency of the shared selection stage and of the figure callbacks reading it.
+def bench_figure_callbacks(app_module, repeat):
+    results = {}
+    dataset = app_module.regions.current(wait=True)
+    print(f'\n{"selection":<24}{"callback":<28}{"total [ms]":>12}')
+    for label, (countries, start_date, end_date) in SELECTIONS.items():
+        inputs = selection_inputs(countries, start_date or str(dataset.first_date.date()),
+                                  end_date or str(dataset.last_date.date()))
+        total = median_ms(lambda: compute_selection(dataset, inputs), repeat)
+        results[f'callbacks/{label}/selection (shared)'] = {'p50_ms': total}
+        print(f'{label:<24}{"selection (shared)":<28}{total:>12.3f}')
+
+        selection_data = app_module.update_selection_store(dataset.region, *inputs.values())
+        for callback in CALLBACKS:
+            function = figure_callback(app_module, callback)
+            total = median_ms(lambda: function(selection_data), max(repeat // 5, 3))
+            results[f'callbacks/{label}/{callback}'] = {'p50_ms': total}
+            print(f'{label:<24}{callback:<28}{total:>12.3f}')
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Row selection latency before and after the CountryDateStore.')
+    parser.add_argument('--scale', type=int, default=1, help='Repeat the sample data along the date axis.')
+    parser.add_argument('--repeat', type=int, default=30, help='Timed runs per measurement.')
+    parser.add_argument('--output', help='Write the results as JSON to this path.')
+    arguments = parser.parse_args()
+    results = {}
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        data_frame = load_continent_data_frame('Europe', source='sample', cache_dir=cache_dir, rebuild=True)
+    dataset = Dataset(scale_data_frame(prepare_data_frame(data_frame), arguments.scale))
+    print(f'{len(dataset.data_frame)} rows, {len(dataset.countries)} countries\n')
+
+    print(f'{"selection":<24}{"callback":<28}{"before [ms]":>12}{"after [ms]":>12}{"speed-up":>10}')
+    for label, (countries, start_date, end_date) in SELECTIONS.items():
+        start_date = start_date or dataset.first_date
+        end_date = end_date or dataset.last_date
+        for callback in CALLBACKS:
+            scan, select = globals()['scan_' + callback], globals()['store_' + callback]
+            before = median_ms(lambda: scan(dataset.data_frame, countries, start_date, end_date), arguments.repeat)
+            after = median_ms(lambda: select(dataset.store, countries, start_date, end_date), arguments.repeat)
+            print(f'{label:<24}{callback:<28}{before:>12.3f}{after:>12.3f}{before / after:>9.1f}x')
+            results[f'row selection/{label}/{callback}'] = {'scan_ms': before, 'p50_ms': after}
+
+    # Latency of the shared selection stage and of the figure callbacks reading it, on the sample data.
+    results.update(bench_figure_callbacks(load_app(), arguments.repeat))
+
+    if arguments.output:
+        save_results(arguments.output, 'store', vars(arguments), results)
+
+
+if __name__ == '__main__':
+    main()
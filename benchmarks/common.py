@@ -0,0 +1,103 @@
+#############################################################################################################
+# Helpers shared by the benchmarks: timing statistics, loading the app on a given data source and writing
+# the results as JSON, so that two runs can be compared with compare.py.
+#############################################################################################################
+import datetime
+import importlib.metadata
+import importlib.util
+import json
+import os
+import platform
+import subprocess
+import sys
+import timeit
+
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+# Packages whose versions are stored with the results.
+PACKAGES = ['dash', 'flask', 'numpy', 'pandas', 'plotly', 'pyarrow', 'orjson']
+
+# Settings of the app while benchmarking: no background refresh, and no figure cache so that the callbacks
+# are measured and not the cache lookups.
+BENCHMARK_ENVIRONMENT = {
+    'COVID19_REFRESH_INTERVAL': '0',
+    'COVID19_FIGURE_CACHE_BACKEND': 'none',
+}
+
+
+def median_ms(function, repeat):
+    return float(np.median(timeit.repeat(function, number=1, repeat=repeat))) * 1000
+
+
+# Statistics of durations in milliseconds.
+def summarize_ms(durations):
+    durations = np.asarray(durations, dtype=np.float64)
+    if not len(durations):
+        return {'count': 0}
+    p50, p95, p99 = np.percentile(durations, [50, 95, 99])
+    return {'count': len(durations), 'mean_ms': float(durations.mean()), 'p50_ms': float(p50),
+            'p95_ms': float(p95), 'p99_ms': float(p99), 'min_ms': float(durations.min()),
+            'max_ms': float(durations.max())}
+
+
+def time_ms(function, repeat):
+    return summarize_ms(np.array(timeit.repeat(function, number=1, repeat=repeat)) * 1000)
+
+
+# Set the settings of the app module for a data source and a cache directory, read by config.py on import.
+def app_environment(source, cache_dir, **settings):
+    environment = dict(BENCHMARK_ENVIRONMENT, COVID19_DATA_SOURCE=source, COVID19_CACHE_DIR=cache_dir)
+    environment.update({f'COVID19_{name.upper()}': str(value) for name, value in settings.items()})
+    return environment
+
+
+# Import COVID-19.py with the given environment. config.py is read once per process, the environment has to be
+# set before the first module of the app is imported.
+def load_app(environment=None):
+    os.environ.update(environment or {})
+    spec = importlib.util.spec_from_file_location('covid19_app', os.path.join(BASE_DIR, 'COVID-19.py'))
+    app_module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(app_module)
+    return app_module
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=BASE_DIR, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def package_versions():
+    versions = {}
+    for package in PACKAGES:
+        try:
+            versions[package] = importlib.metadata.version(package)
+        except importlib.metadata.PackageNotFoundError:
+            versions[package] = None
+    return versions
+
+
+# Write the results of a benchmark with the parameters and the environment of the run.
+# results maps the name of every measurement to its statistics.
+def save_results(path, benchmark, parameters, results):
+    document = {
+        'benchmark': benchmark,
+        'created': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'packages': package_versions(),
+        'settings': {name: value for name, value in os.environ.items() if name.startswith('COVID19_')},
+        'parameters': parameters,
+        'results': results,
+    }
+    with open(path, 'w') as results_file:
+        json.dump(document, results_file, indent=2)
+    print(f'\nResults written to {path}')
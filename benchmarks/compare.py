@@ -0,0 +1,56 @@
+#############################################################################################################
+# Compare the JSON results of two benchmark runs, measurement by measurement.
+#
+#   python benchmarks/compare.py before.json after.json [--statistic p50_ms] [--threshold 5]
+#
+# Changes above the threshold (in percent) are marked, '+' is slower and '-' faster for durations.
+#############################################################################################################
+import argparse
+import json
+
+
+def load_results(path):
+    with open(path) as results_file:
+        return json.load(results_file)
+
+
+# The value of the statistic of a measurement, the throughput for the load test summary.
+def measurement_value(statistics, statistic):
+    if statistic in statistics:
+        return statistics[statistic]
+    return statistics.get('requests_per_second')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the results of two benchmark runs.')
+    parser.add_argument('before')
+    parser.add_argument('after')
+    parser.add_argument('--statistic', default='p50_ms', help='Statistic to compare, e.g. p50_ms, p95_ms, p99_ms.')
+    parser.add_argument('--threshold', type=float, default=5, help='Mark changes above this many percent.')
+    arguments = parser.parse_args()
+
+    before, after = load_results(arguments.before), load_results(arguments.after)
+    print(f'before: {before["created"]} {before["commit"] or ""}')
+    print(f'after:  {after["created"]} {after["commit"] or ""}')
+    if before['parameters'] != after['parameters']:
+        print('warning: the runs used different parameters')
+    print()
+
+    print(f'{"measurement":<80}{"before":>12}{"after":>12}{"change":>10}')
+    for name in [name for name in before['results'] if name in after['results']]:
+        old = measurement_value(before['results'][name], arguments.statistic)
+        new = measurement_value(after['results'][name], arguments.statistic)
+        if old is None or new is None:
+            continue
+        change = (new - old) / old * 100 if old else 0.0
+        marker = ' *' if abs(change) >= arguments.threshold else ''
+        print(f'{name:<80}{old:>12.2f}{new:>12.2f}{change:>+9.1f}%{marker}')
+
+    for label, missing in [('only before', before['results'].keys() - after['results'].keys()),
+                           ('only after', after['results'].keys() - before['results'].keys())]:
+        for name in sorted(missing):
+            print(f'{name:<80} ({label})')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+#############################################################################################################
+# Generator of synthetic data sets in the OWID csv format, scaling the number of countries, days and extra
+# columns independently of the bundled sample. The values follow seeded random epidemic waves, so the same
+# arguments always produce the same file.
+#
+#   python benchmarks/synthetic_data.py --countries 200 --days 1000 --extra-columns 40 --output /tmp/owid.csv
+#############################################################################################################
+import argparse
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Names and iso codes of the countries, taken from the bundled geometries so that the choropleth map draws them.
+# Countries beyond them get synthetic names and codes without a geometry.
+COUNTRY_GEOMETRIES_PATH = os.path.join(BASE_DIR, 'data', 'countries.geojson')
+
+FIRST_DATE = '2020-01-22'
+
+
+def country_names(count):
+    with open(COUNTRY_GEOMETRIES_PATH) as geometries_file:
+        features = json.load(geometries_file)['features']
+    countries = sorted((feature['properties']['name'], feature['id']) for feature in features)[:count]
+    countries += [(f'Synthetic country {index:04d}', f'S{index:04d}') for index in range(len(countries), count)]
+    return countries
+
+
+# New cases of one country: a few epidemic waves of random height and width with multiplicative noise.
+def daily_cases(rng, days, population):
+    time = np.arange(days)
+    cases = np.zeros(days)
+    for _ in range(rng.integers(2, 6)):
+        peak, width = rng.uniform(0, days), rng.uniform(15, 90)
+        height = population * rng.uniform(1e-5, 1e-3)
+        cases += height * np.exp(-0.5 * ((time - peak) / width) ** 2)
+    return np.round(cases * rng.lognormal(0, 0.3, days))
+
+
+# Data frame of countries x days rows with the columns of the OWID data set read by the dashboard, the
+# columns the dashboard skips when reading the csv, and extra_columns further numeric columns.
+def synthetic_data_frame(countries=50, days=365, extra_columns=0, continent='Europe', seed=0):
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range(FIRST_DATE, periods=days, freq='D')
+    parts = []
+    for location, iso_code in country_names(countries):
+        population = float(rng.integers(300_000, 150_000_000))
+        new_cases = daily_cases(rng, days, population)
+        new_deaths = np.round(new_cases * rng.uniform(0.005, 0.03))
+        # Reporting starts with the first case, tests are reported weekly
+        reported = np.cumsum(new_cases) > 0
+        new_tests = np.round(new_cases * rng.uniform(5, 50) + population * 1e-4)
+        total_tests = np.where(np.arange(days) % 7 == 6, np.cumsum(new_tests), np.nan)
+        stringency = np.repeat(rng.uniform(0, 100, days // 14 + 1), 14)[:days].round(2)
+
+        part = pd.DataFrame({
+            'iso_code': iso_code,
+            'continent': continent,
+            'location': location,
+            'date': dates,
+            'total_cases': np.where(reported, np.cumsum(new_cases), np.nan),
+            'new_cases': np.where(reported, new_cases, np.nan),
+            'total_deaths': np.where(reported, np.cumsum(new_deaths), np.nan),
+            'new_deaths': np.where(reported, new_deaths, np.nan),
+            'total_tests': total_tests,
+            'new_tests': new_tests,
+            'stringency_index': stringency,
+            'reproduction_rate': rng.uniform(0.5, 2.0, days).round(2),
+            'population_density': round(rng.uniform(2, 500), 3),
+            'median_age': round(rng.uniform(18, 48), 1),
+            'aged_65_older': round(rng.uniform(2, 25), 3),
+            'gdp_per_capita': round(rng.uniform(1000, 90000), 3),
+            'hospital_beds_per_thousand': round(rng.uniform(0.5, 13), 2),
+            'life_expectancy': round(rng.uniform(55, 85), 2),
+            'population': population,
+        })
+        for column in range(extra_columns):
+            part[f'extra_metric_{column:03d}'] = rng.normal(0, 1, days).round(4)
+        parts.append(part)
+    return pd.concat(parts, ignore_index=True)
+
+
+# Write the synthetic data set as csv, the format of the OWID download, and return its path.
+def write_synthetic_csv(path, countries=50, days=365, extra_columns=0, continent='Europe', seed=0):
+    synthetic_data_frame(countries, days, extra_columns, continent, seed).to_csv(path, index=False)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Write a synthetic data set in the OWID csv format.')
+    parser.add_argument('--countries', type=int, default=50)
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--extra-columns', type=int, default=0)
+    parser.add_argument('--continent', default='Europe')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', required=True, help='Path of the csv file.')
+    arguments = parser.parse_args()
+
+    write_synthetic_csv(arguments.output, arguments.countries, arguments.days, arguments.extra_columns,
+                        arguments.continent, arguments.seed)
+    print(f'Wrote {arguments.countries * arguments.days} rows to {arguments.output}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+import os
+
+#############################################################################################################
+# Application settings. Every value can be overridden with an environment variable of the same name
+# prefixed with 'COVID19_'.
+#############################################################################################################
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# OWID data set published on Github.
+OWID_DATA_SET_URL = 'https://raw.githubusercontent.com/owid/covid-19-data/master/public/data/owid-covid-data.csv'
+
+# Bundled OWID shaped sample used when running offline.
+SAMPLE_DATA_SET_PATH = os.path.join(BASE_DIR, 'data', 'owid-covid-data-sample.csv')
+
+# Data source: an URL, a local csv path or 'sample' for the bundled sample file.
+DATA_SOURCE = os.environ.get('COVID19_DATA_SOURCE', OWID_DATA_SET_URL)
+
+# Directory holding the columnar (feather) snapshot split by continent.
+CACHE_DIR = os.environ.get('COVID19_CACHE_DIR', os.path.join(BASE_DIR, 'data', 'cache'))
+
+# Set to 1 to ignore an existing snapshot and read the csv again.
+REBUILD_CACHE = os.environ.get('COVID19_REBUILD_CACHE', '0') == '1'
+
+# Seconds between two checks of the data source for new data, 0 disables the background refresh.
+REFRESH_INTERVAL = float(os.environ.get('COVID19_REFRESH_INTERVAL', 3600))
+
+# Directory of the cache shared by all worker processes, e.g. the selection of the dropdown and date range.
+SERVER_CACHE_DIR = os.environ.get('COVID19_SERVER_CACHE_DIR', os.path.join(CACHE_DIR, 'server'))
+
+# Seconds a cached selection stays valid.
+SELECTION_CACHE_TIMEOUT = float(os.environ.get('COVID19_SELECTION_CACHE_TIMEOUT', 600))
+
+# Maximum size in bytes of the selection cache directory, the least recently used selections are removed first.
+SELECTION_CACHE_MAX_BYTES = int(os.environ.get('COVID19_SELECTION_CACHE_MAX_BYTES', 256 * 1024 ** 2))
+
+# Cache of the four figures: 'memory' (per worker process), 'filesystem' (shared by all worker processes)
+# or 'none'. Entries are evicted least recently used first above the memory cap and after the timeout.
+FIGURE_CACHE_BACKEND = os.environ.get('COVID19_FIGURE_CACHE_BACKEND', 'memory')
+FIGURE_CACHE_DIR = os.environ.get('COVID19_FIGURE_CACHE_DIR', os.path.join(SERVER_CACHE_DIR, 'figures'))
+FIGURE_CACHE_TIMEOUT = float(os.environ.get('COVID19_FIGURE_CACHE_TIMEOUT', 3600))
+FIGURE_CACHE_MAX_BYTES = int(os.environ.get('COVID19_FIGURE_CACHE_MAX_BYTES', 64 * 1024 ** 2))
+
+# Figure building: 'light' fills pre-validated layouts with numpy arrays, 'express' uses plotly express.
+FIGURE_MODE = os.environ.get('COVID19_FIGURE_MODE', 'light')
+
+# Figure callbacks of the server date filtering: 'separate' sends one request per figure, 'combined' builds the
+# figures of a selection in one request, concurrently in a pool of FIGURE_WORKERS threads. The pool is shared by
+# all requests of a worker process, so a busy worker never runs more figure threads than that.
+FIGURE_CALLBACKS = os.environ.get('COVID19_FIGURE_CALLBACKS', 'separate')
+FIGURE_WORKERS = int(os.environ.get('COVID19_FIGURE_WORKERS', min(4, os.cpu_count() or 1)))
+
+# Point budget of the line graph. Longer selections are downsampled with 'lttb' (largest-triangle-three-buckets)
+# or 'weekly' aggregation, 'none' always sends every daily point. Zooming in serves the daily points again.
+LINE_GRAPH_MAX_POINTS = int(os.environ.get('COVID19_LINE_GRAPH_MAX_POINTS', 4000))
+LINE_GRAPH_DOWNSAMPLING = os.environ.get('COVID19_LINE_GRAPH_DOWNSAMPLING', 'lttb')
+
+# Date range filtering: 'server' builds the figures on the server for every change, 'client' ships the series of
+# the selected countries once per country selection and applies the date range in the browser.
+DATE_FILTERING = os.environ.get('COVID19_DATE_FILTERING', 'server')
+
+# Set to 1 to show the header numbers of the selected end date instead of the last date of the data.
+HEADER_FOLLOWS_END_DATE = os.environ.get('COVID19_HEADER_FOLLOWS_END_DATE', '0') == '1'
+
+# Set to 1 to serve the page while the data loads in a background thread, the figures show a loading message
+# until it is ready. GET /ready answers 503 until then, for the readiness probe of an orchestrator.
+LAZY_STARTUP = os.environ.get('COVID19_LAZY_STARTUP', '0') == '1'
+
+# Regions (OWID continents) of the region dropdown, the default region is loaded at startup and never evicted.
+REGIONS = [region.strip() for region in os.environ.get(
+    'COVID19_REGIONS', 'Europe,Asia,Africa,North America,South America,Oceania').split(',') if region.strip()]
+DEFAULT_REGION = os.environ.get('COVID19_DEFAULT_REGION', 'Europe')
+
+# Other regions are loaded on first use and dropped after this many seconds without a request,
+# or least recently used first when the data of all loaded regions exceeds the memory budget in bytes.
+REGION_IDLE_TIMEOUT = float(os.environ.get('COVID19_REGION_IDLE_TIMEOUT', 1800))
+REGION_MEMORY_BUDGET = int(os.environ.get('COVID19_REGION_MEMORY_BUDGET', 512 * 1024 ** 2))
+
+# Choropleth map of the server date filtering: 'geojson' draws the bundled country geometries (data/countries.geojson)
+# colored by the death rate and updates only the values of the selected countries, 'scope' draws the countries on
+# the plotly base map of the region colored by country.
+CHOROPLETH_MAP_MODE = os.environ.get('COVID19_CHOROPLETH_MAP_MODE', 'geojson')
+COUNTRY_GEOMETRIES_PATH = os.path.join(BASE_DIR, 'data', 'countries.geojson')
+
+# Set to 0 to switch off the timings of the callbacks, served in the Prometheus text format by GET /metrics and
+# logged as one JSON line per callback request by the 'instrumentation' logger at level INFO.
+INSTRUMENTATION = os.environ.get('COVID19_INSTRUMENTATION', '1') == '1'
+
+# Set to 1 to allow profiling a single request with the header 'X-Profile: 1' or the query flag '?profile=1'.
+# The reports (pyinstrument HTML when installed, else cProfile pstats) are written to PROFILE_DIR.
+PROFILING = os.environ.get('COVID19_PROFILING', '0') == '1'
+PROFILE_DIR = os.environ.get('COVID19_PROFILE_DIR', os.path.join(CACHE_DIR, 'profiles'))
+
+# Set to 1 to read the data from shared memory: the master process of gunicorn (see gunicorn.conf.py) loads every
+# region once and publishes it as a memory-mapped Arrow file in SHARED_MEMORY_DIR, the workers attach to it
+# read-only without a copy and check every SHARED_POLL_INTERVAL seconds for a refreshed version.
+SHARED_DATASET = os.environ.get('COVID19_SHARED_DATASET', '0') == '1'
+SHARED_MEMORY_DIR = os.environ.get('COVID19_SHARED_MEMORY_DIR', '/dev/shm/covid19' if os.path.isdir('/dev/shm')
+                                   else os.path.join(CACHE_DIR, 'shared'))
+SHARED_POLL_INTERVAL = float(os.environ.get('COVID19_SHARED_POLL_INTERVAL', 5))
+
+# Set to 0 to switch off the compression of the responses: callback responses, the layout and the static files are
+# sent with brotli when the package is installed and the browser accepts it, else with gzip, from a size of
+# COMPRESSION_MIN_BYTES on. Callback and layout responses carry an ETag of the dataset version and the request,
+# a request repeating it with If-None-Match is answered with 304 without running the callback.
+COMPRESSION = os.environ.get('COVID19_COMPRESSION', '1') == '1'
+COMPRESSION_MIN_BYTES = int(os.environ.get('COVID19_COMPRESSION_MIN_BYTES', 1024))
+
+# Seconds the browser keeps the files of assets/ requested with a version in the query string (the modification
+# time Dash appends to them in the page), without asking the server again.
+STATIC_MAX_AGE = int(os.environ.get('COVID19_STATIC_MAX_AGE', 365 * 24 * 3600))
+
+# Static export (export_static.py): directory of the pre-rendered pages, and the JSON file of the presets rendered
+# besides the default view of every region.
+STATIC_EXPORT_DIR = os.environ.get('COVID19_STATIC_EXPORT_DIR', os.path.join(BASE_DIR, 'data', 'static'))
+STATIC_EXPORT_PRESETS = os.environ.get('COVID19_STATIC_EXPORT_PRESETS', os.path.join(BASE_DIR, 'data',
+                                                                                     'static-presets.json'))
+
+# Downloads of the selection (GET /export/<format>): rows per chunk of the stream, downloads streamed at once per
+# worker process (further requests get 503), and the cache of the finished downloads shared by the worker processes.
+EXPORT_CHUNK_ROWS = int(os.environ.get('COVID19_EXPORT_CHUNK_ROWS', 10000))
+EXPORT_MAX_CONCURRENT = int(os.environ.get('COVID19_EXPORT_MAX_CONCURRENT', 2))
+EXPORT_CACHE_DIR = os.environ.get('COVID19_EXPORT_CACHE_DIR', os.path.join(SERVER_CACHE_DIR, 'exports'))
+EXPORT_CACHE_TIMEOUT = float(os.environ.get('COVID19_EXPORT_CACHE_TIMEOUT', 3600))
+EXPORT_CACHE_MAX_BYTES = int(os.environ.get('COVID19_EXPORT_CACHE_MAX_BYTES', 512 * 1024 ** 2))
@@ -0,0 +1,218 @@
+import io
+import logging
+import threading
+import urllib.parse
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from flask import Response, abort, send_file
+
+import config
+from data_loader import continent_slug
+from data_store import STATIC_COLUMNS
+from metrics import METRICS
+from selection import selection_inputs
+from server_cache import FileCache, make_versioned_cache_key
+
+logger = logging.getLogger(__name__)
+
+# Formats of the downloads: file extension and content type.
+EXPORT_FORMATS = {
+    'csv': ('csv', 'text/csv'),
+    'parquet': ('parquet', 'application/vnd.apache.parquet'),
+    'jsonl': ('jsonl', 'application/x-ndjson'),
+}
+
+# Columns of a download besides the country and the date: the metrics of the line graph (raw and derived) and the
+# static attributes of the countries. Without a choice, the raw metrics are exported.
+EXPORT_COLUMNS = list(METRICS) + STATIC_COLUMNS
+DEFAULT_EXPORT_COLUMNS = [name for name, metric in METRICS.items() if metric.compute is None]
+
+# Finished downloads, shared by the worker processes. A download of the same selection and dataset version is
+# served from the file.
+export_cache = FileCache(config.EXPORT_CACHE_DIR, config.EXPORT_CACHE_TIMEOUT, config.EXPORT_CACHE_MAX_BYTES)
+
+# Downloads streamed at once by this worker process. Every download holds a thread of the server while the client
+# reads it, further requests are answered with 503 so that the callbacks keep their threads.
+export_slots = threading.BoundedSemaphore(config.EXPORT_MAX_CONCURRENT)
+
+
+# Date of a query parameter of a download, None when it is empty.
+def export_date(name, value):
+    if not value:
+        return None
+    try:
+        date = pd.Timestamp(value)
+    except (ValueError, TypeError):
+        date = pd.NaT
+    # The dates of the data have no time zone
+    if pd.isna(date) or date.tz is not None:
+        raise ValueError(f'{name} {value!r} is not a date.')
+    return value
+
+
+# Normalized parameters of a download: the selection (all countries of the region when none is given) and the
+# columns in the order of EXPORT_COLUMNS. Raises ValueError for unknown countries or columns and for invalid or
+# reversed dates.
+def export_parameters(dataset, countries, start_date, end_date, columns):
+    unknown_countries = [country for country in countries or [] if country not in dataset.store.country_slices]
+    if unknown_countries:
+        raise ValueError(f'Unknown countries of {dataset.region}: {", ".join(unknown_countries)}.')
+    unknown_columns = [column for column in columns or [] if column not in EXPORT_COLUMNS]
+    if unknown_columns:
+        raise ValueError(f'Unknown columns: {", ".join(unknown_columns)}.')
+    start_date, end_date = export_date('start_date', start_date), export_date('end_date', end_date)
+    if start_date and end_date and pd.Timestamp(start_date) > pd.Timestamp(end_date):
+        raise ValueError(f'start_date {start_date} is after end_date {end_date}.')
+
+    columns = [column for column in EXPORT_COLUMNS if column in (columns or DEFAULT_EXPORT_COLUMNS)]
+    return selection_inputs(countries or dataset.countries, start_date, end_date), columns
+
+
+# Options of the column dropdown of the download.
+def export_column_options():
+    return [{'label': METRICS[column].label if column in METRICS else column.replace('_', ' ').capitalize(),
+             'value': column} for column in EXPORT_COLUMNS]
+
+
+# Query string of the download of a selection, see export_response.
+def export_query(region, countries, start_date, end_date, columns):
+    return urllib.parse.urlencode({'region': region, 'country': countries or [], 'start_date': start_date or '',
+                                   'end_date': end_date or '', 'column': columns or []}, doseq=True)
+
+
+def export_cache_key(dataset, export_format, inputs, columns):
+    return make_versioned_cache_key(dataset.version, 'export', export_format, inputs, columns)
+
+
+def export_file_name(dataset, export_format, inputs):
+    start_date = str(inputs['start_date'] or dataset.first_date.date())[:10]
+    end_date = str(inputs['end_date'] or dataset.last_date.date())[:10]
+    return f'covid19-{continent_slug(dataset.region)}-{start_date}-{end_date}.{EXPORT_FORMATS[export_format][0]}'
+
+
+# The selected rows in chunks of at most chunk_rows rows, one country after the other, read by row range from the
+# CountryDateStore. Only one chunk is copied at a time. Yields at least one (possibly empty) chunk.
+def export_chunks(dataset, inputs, columns, chunk_rows=None):
+    chunk_rows = chunk_rows or config.EXPORT_CHUNK_ROWS
+    data_frame, country_table = dataset.data_frame, dataset.country_table
+    row_ranges = [(first, last) for first, last in sorted(dataset.store.row_ranges(
+        inputs['countries'], inputs['start_date'], inputs['end_date'])) if last > first] or [(0, 0)]
+    for first, last in row_ranges:
+        for start in range(first, max(last, first + 1), chunk_rows):
+            rows = data_frame.iloc[start:min(start + chunk_rows, last)]
+            codes = rows['location'].cat.codes.to_numpy()
+            chunk = pd.DataFrame({
+                'location': country_table['location'].to_numpy()[codes],
+                'iso_code': country_table['iso_code'].to_numpy()[codes],
+                'date': rows['date'].to_numpy(),
+            })
+            for column in columns:
+                chunk[column] = (country_table[column].to_numpy()[codes] if column in STATIC_COLUMNS
+                                 else rows[column].to_numpy())
+            yield chunk
+
+
+def csv_chunks(chunks):
+    for index, chunk in enumerate(chunks):
+        yield chunk.to_csv(index=False, header=index == 0, date_format='%Y-%m-%d').encode()
+
+
+def jsonl_chunks(chunks):
+    for chunk in chunks:
+        if len(chunk):
+            chunk = chunk.assign(date=chunk['date'].dt.strftime('%Y-%m-%d'))
+            yield chunk.to_json(orient='records', lines=True).encode()
+
+
+#############################################################################################################
+# Write-only file handing the bytes written by the ParquetWriter to the generator streaming them.
+#############################################################################################################
+class ChunkSink(io.RawIOBase):
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._buffer += data
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def take(self):
+        data = bytes(self._buffer)
+        self._buffer.clear()
+        return data
+
+
+# One row group per chunk, the footer follows the last one.
+def parquet_chunks(chunks):
+    sink = ChunkSink()
+    writer = None
+    for chunk in chunks:
+        table = pa.Table.from_pandas(chunk, schema=writer.schema if writer else None, preserve_index=False)
+        if writer is None:
+            writer = pq.ParquetWriter(sink, table.schema)
+        writer.write_table(table)
+        yield sink.take()
+    writer.close()
+    yield sink.take()
+
+
+ENCODERS = {'csv': csv_chunks, 'parquet': parquet_chunks, 'jsonl': jsonl_chunks}
+
+
+# Bytes of a download, written to the export cache while they are streamed. A download cancelled by the client
+# leaves nothing behind. The generator holds the Dataset it started with, a refresh meanwhile does not change it.
+def stream_export(dataset, export_format, inputs, columns):
+    key = export_cache_key(dataset, export_format, inputs, columns)
+    completed = False
+    try:
+        with open(export_cache.temporary_path(key), 'wb') as cache_file:
+            for data in ENCODERS[export_format](export_chunks(dataset, inputs, columns)):
+                if data:
+                    cache_file.write(data)
+                    # The server asks for the next chunk once this one is sent to the client
+                    yield data
+        export_cache.commit(key)
+        completed = True
+    finally:
+        if not completed:
+            export_cache.discard(key)
+
+
+# Response of GET /export/<format> with the query parameters country (repeated), start_date, end_date and column
+# (repeated): the cached file of the same download, else the rows streamed in chunks. Invalid parameters are
+# answered with 400.
+def export_response(dataset, export_format, arguments):
+    try:
+        inputs, columns = export_parameters(dataset, arguments.getlist('country'), arguments.get('start_date'),
+                                            arguments.get('end_date'), arguments.getlist('column'))
+    except ValueError as error:
+        abort(400, str(error))
+    mimetype = EXPORT_FORMATS[export_format][1]
+    download_name = export_file_name(dataset, export_format, inputs)
+
+    path = export_cache.path(export_cache_key(dataset, export_format, inputs, columns))
+    if path is not None:
+        return send_file(path, mimetype=mimetype, as_attachment=True, download_name=download_name)
+
+    if not export_slots.acquire(blocking=False):
+        response = Response('Too many downloads at once, please retry in a few seconds.', status=503,
+                            mimetype='text/plain')
+        response.headers['Retry-After'] = '5'
+        return response
+    logger.info('Exporting %d countries of the %s data as %s.', len(inputs['countries']), dataset.region,
+                export_format)
+    response = Response(stream_export(dataset, export_format, inputs, columns), mimetype=mimetype)
+    # The slot is released once the download is sent or cancelled
+    response.call_on_close(export_slots.release)
+    response.headers['Content-Disposition'] = f'attachment; filename="{download_name}"'
+    return response
@@ -0,0 +1,196 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import urllib.error
+import urllib.request
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+
+import config
+from metrics import add_metrics
+
+logger = logging.getLogger(__name__)
+
+#############################################################################################################
+# Columns and compact data types of the OWID data set used by the dashboard.
+#############################################################################################################
+CATEGORICAL_COLUMNS = ['iso_code', 'continent', 'location']
+DATE_COLUMN = 'date'
+METRIC_COLUMNS = ['total_cases', 'new_cases', 'total_deaths', 'new_deaths', 'total_tests', 'stringency_index',
+                  'population', 'median_age', 'life_expectancy', 'hospital_beds_per_thousand']
+DATA_COLUMNS = CATEGORICAL_COLUMNS + [DATE_COLUMN] + METRIC_COLUMNS
+
+COLUMN_DTYPES = {**{column: 'category' for column in CATEGORICAL_COLUMNS},
+                 **{column: 'float32' for column in METRIC_COLUMNS}}
+
+MANIFEST_FILE_NAME = 'manifest.json'
+
+# Regions loaded by several threads build a missing snapshot only once.
+_snapshot_lock = threading.Lock()
+# Cache directories rebuilt by this process for config.REBUILD_CACHE.
+_rebuilt_cache_dirs = set()
+
+
+# Map the configured data source to a path or URL readable by pandas.
+def resolve_data_source(source):
+    if source == 'sample':
+        return config.SAMPLE_DATA_SET_PATH
+    return source
+
+
+def is_remote_source(source):
+    return source.startswith(('http://', 'https://'))
+
+
+# Identifier of a continent in file names and cache keys, e.g. 'North America' -> 'north_america'.
+def continent_slug(continent):
+    return re.sub(r'[^a-z0-9]+', '_', continent.lower()).strip('_')
+
+
+# File name of the snapshot of a continent, e.g. 'North America' -> 'north_america.feather'.
+def continent_file_name(continent):
+    return continent_slug(continent) + '.feather'
+
+
+# Identify the current content of the data source: the ETag (or Last-Modified) header of an URL
+# or the sha256 hash of a local file.
+def source_token(source):
+    source = resolve_data_source(source)
+    if is_remote_source(source):
+        request = urllib.request.Request(source, method='HEAD')
+        with urllib.request.urlopen(request, timeout=30) as response:
+            return response.headers.get('ETag') or response.headers.get('Last-Modified')
+
+    digest = hashlib.sha256()
+    with open(source, 'rb') as source_file:
+        for block in iter(lambda: source_file.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# Read only the columns used by the dashboard with compact dtypes.
+def read_covid19_csv(source):
+    return pd.read_csv(resolve_data_source(source), usecols=DATA_COLUMNS, dtype=COLUMN_DTYPES,
+                       parse_dates=[DATE_COLUMN])
+
+
+def read_manifest(cache_dir):
+    manifest_path = os.path.join(cache_dir, MANIFEST_FILE_NAME)
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path) as manifest_file:
+        return json.load(manifest_file)
+
+
+# Arrow table of a data frame whose columns map back to numpy without a copy, see arrow_columns: numeric and date
+# columns keep NaN as a value (no validity bitmap), categorical columns are dictionary encoded.
+def arrow_table(data_frame):
+    columns = {}
+    for column in data_frame.columns:
+        values = data_frame[column]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            columns[column] = pa.DictionaryArray.from_arrays(values.cat.codes.to_numpy(),
+                                                             pa.array(values.cat.categories.astype(str).tolist()))
+        else:
+            columns[column] = pa.array(values.to_numpy(), from_pandas=False)
+    return pa.table(columns)
+
+
+# Columns of an Arrow table as numpy arrays and categoricals. The numeric and date columns of a memory-mapped table
+# written by arrow_table are read-only views on the mapped pages, only the categorical codes are copied. Columns with
+# nulls, e.g. of snapshots written before, are converted with a copy.
+def arrow_columns(table):
+    columns = {}
+    for name, column in zip(table.column_names, table.columns):
+        array = column.combine_chunks() if column.num_chunks != 1 else column.chunk(0)
+        if pa.types.is_dictionary(array.type):
+            columns[name] = pd.Categorical.from_codes(array.indices.fill_null(-1).to_numpy(),
+                                                      array.dictionary.to_pylist())
+        else:
+            columns[name] = array.to_numpy(zero_copy_only=array.null_count == 0)
+    return columns
+
+
+# Write one uncompressed feather file per continent so that it can be memory-mapped on later starts.
+# The rows are sorted by (location, date) and carry the derived metrics of metrics.py.
+def write_snapshot(data_frame, source, cache_dir, token=None):
+    os.makedirs(cache_dir, exist_ok=True)
+
+    continents = {}
+    for continent, continent_data_frame in data_frame.groupby('continent', observed=True):
+        continent_data_frame = continent_data_frame.drop(columns='continent').reset_index(drop=True)
+        for column in ['iso_code', 'location']:
+            continent_data_frame[column] = continent_data_frame[column].cat.remove_unused_categories()
+        continent_data_frame = add_metrics(continent_data_frame.sort_values(['location', 'date'], kind='stable',
+                                                                            ignore_index=True))
+
+        file_name = continent_file_name(continent)
+        # Several worker processes may refresh the snapshot at the same time, replace files atomically.
+        file_path = os.path.join(cache_dir, file_name)
+        # One record batch: every column is one contiguous buffer of the file
+        feather.write_feather(arrow_table(continent_data_frame), f'{file_path}.{os.getpid()}.tmp',
+                              compression='uncompressed', chunksize=max(len(continent_data_frame), 1))
+        os.replace(f'{file_path}.{os.getpid()}.tmp', file_path)
+        continents[continent] = file_name
+
+    manifest = {'source': source, 'source_token': token, 'continents': continents}
+    # Write the manifest last so that a half written snapshot is never picked up.
+    manifest_path = os.path.join(cache_dir, MANIFEST_FILE_NAME)
+    with open(f'{manifest_path}.{os.getpid()}.tmp', 'w') as manifest_file:
+        json.dump(manifest, manifest_file, indent=2)
+    os.replace(f'{manifest_path}.{os.getpid()}.tmp', manifest_path)
+
+    return manifest
+
+
+# Read the csv once and store it as a columnar snapshot split by continent.
+def build_snapshot(source, cache_dir):
+    try:
+        token = source_token(source)
+        data_frame = read_covid19_csv(source)
+    except (urllib.error.URLError, OSError) as error:
+        if not is_remote_source(source):
+            raise
+        logger.warning('Could not download %s (%s), falling back to the bundled sample data.', source, error)
+        source = 'sample'
+        token = source_token(source)
+        data_frame = read_covid19_csv(source)
+
+    return write_snapshot(data_frame, source, cache_dir, token)
+
+
+# Load the data of one continent from the local snapshot, building the snapshot first if needed.
+def load_continent_data_frame(continent, source=None, cache_dir=None, rebuild=None):
+    source = config.DATA_SOURCE if source is None else source
+    cache_dir = config.CACHE_DIR if cache_dir is None else cache_dir
+
+    with _snapshot_lock:
+        # The configured rebuild applies to the first continent loaded, the others use the rebuilt snapshot.
+        if rebuild is None:
+            rebuild = config.REBUILD_CACHE and cache_dir not in _rebuilt_cache_dirs
+
+        manifest = None if rebuild else read_manifest(cache_dir)
+        # A snapshot built from the sample after a failed download is replaced as soon as the source is reachable.
+        if manifest is None or manifest['source'] != source:
+            logger.info('Building the columnar snapshot of %s in %s.', source, cache_dir)
+            manifest = build_snapshot(source, cache_dir)
+            _rebuilt_cache_dirs.add(cache_dir)
+
+    if continent not in manifest['continents']:
+        raise KeyError(f'No data for continent {continent!r} in {cache_dir}.')
+
+    # The rows stay on the pages of the mapped file, see arrow_columns
+    table = feather.read_table(os.path.join(cache_dir, manifest['continents'][continent]), memory_map=True)
+    return pd.DataFrame(arrow_columns(table), copy=False)
+
+
+# Replace NaN values with 0 for the columns shown as numbers in the header and the figures.
+def prepare_data_frame(data_frame):
+    columns_to_replace_nan = ['total_cases', 'total_deaths', 'new_cases', 'new_deaths']
+    data_frame[columns_to_replace_nan] = data_frame[columns_to_replace_nan].fillna(0)
+    return data_frame
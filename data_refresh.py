@@ -0,0 +1,170 @@
+import logging
+import os
+import threading
+
+import config
+from data_loader import (is_remote_source, load_continent_data_frame, prepare_data_frame, read_covid19_csv,
+                         read_manifest, resolve_data_source, source_token, write_snapshot)
+from dataset import Dataset
+
+logger = logging.getLogger(__name__)
+
+# Seconds between two attempts to load the data after a failure at startup.
+LOAD_RETRY_INTERVAL = 30
+
+
+#############################################################################################################
+# Detect new upstream data: the ETag/Last-Modified header of an URL or the content hash of a local file.
+#############################################################################################################
+class DataSourceWatcher:
+
+    def __init__(self, source, token=None):
+        self.source = source
+        self.token = token
+        self._file_stat = None
+        self._polled_file_stat = None
+
+    # Return the new token when the source changed since the last confirmed token, None otherwise.
+    def poll(self):
+        file_stat = None
+        if not is_remote_source(resolve_data_source(self.source)):
+            # Only hash a local file again when its size or modification time changed.
+            stat = os.stat(resolve_data_source(self.source))
+            file_stat = (stat.st_size, stat.st_mtime_ns)
+            if self.token is not None and file_stat == self._file_stat:
+                return None
+
+        token = source_token(self.source)
+        if token is None or token == self.token:
+            self._file_stat = file_stat
+            return None
+        self._polled_file_stat = file_stat
+        return token
+
+    # Remember the token returned by poll once its content is processed. Until then poll returns it again, so
+    # that a failed refresh is retried.
+    def confirm(self, token):
+        self.token = token
+        self._file_stat = self._polled_file_stat
+
+
+#############################################################################################################
+# Background service keeping the Dataset of one continent up to date without a process restart.
+# With lazy=True the data is loaded by the background thread started by start(), current() returns None
+# until it is ready.
+#############################################################################################################
+class DatasetRefresher:
+
+    load_retry_interval = LOAD_RETRY_INTERVAL
+
+    def __init__(self, continent, source=None, cache_dir=None, interval=None, lazy=False):
+        self.continent = continent
+        self.source = config.DATA_SOURCE if source is None else source
+        self.cache_dir = config.CACHE_DIR if cache_dir is None else cache_dir
+        self.interval = config.REFRESH_INTERVAL if interval is None else interval
+
+        self._dataset = None
+        self._ready_event = threading.Event()
+        self.watcher = None
+        # Error of the last failed load, None once the data is loaded
+        self.load_error = None
+
+        self._refresh_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._listeners = []
+
+        if not lazy:
+            self.load()
+
+    # Load the data from the local snapshot, built from the data source when there is none yet.
+    def load(self):
+        dataset = Dataset(prepare_data_frame(
+            load_continent_data_frame(self.continent, source=self.source, cache_dir=self.cache_dir)), self.continent)
+
+        manifest = read_manifest(self.cache_dir)
+        token = manifest.get('source_token') if manifest and manifest['source'] == self.source else None
+        self.watcher = DataSourceWatcher(self.source, token)
+
+        self._dataset = dataset
+        self.load_error = None
+        self._ready_event.set()
+        logger.info('Loaded the %s data, dataset version is %s.', self.continent, dataset.version)
+
+    # The current Dataset, None while it is loading. Callbacks should call this once and keep using the
+    # returned object.
+    def current(self):
+        return self._dataset
+
+    def is_ready(self):
+        return self._ready_event.is_set()
+
+    # Block until the data is loaded, returns False after the timeout.
+    def wait_ready(self, timeout=None):
+        return self._ready_event.wait(timeout)
+
+    # Call listener(dataset) after every swap, e.g. to drop cached values of the previous version.
+    def add_listener(self, listener):
+        self._listeners.append(listener)
+
+    # Check the source and swap in a new Dataset when new rows were published. Returns True on a swap.
+    def refresh(self):
+        with self._refresh_lock:
+            if not self.is_ready():
+                return False
+            token = self.watcher.poll()
+            if token is None:
+                return False
+
+            logger.info('New data detected at %s, refreshing the %s data.', self.source, self.continent)
+            manifest = read_manifest(self.cache_dir)
+            if manifest and manifest['source'] == self.source and manifest.get('source_token') == token:
+                # The refresher of another region or worker already wrote the snapshot of this content.
+                continent_data_frame = load_continent_data_frame(self.continent, source=self.source,
+                                                                 cache_dir=self.cache_dir, rebuild=False)
+            else:
+                data_frame = read_covid19_csv(self.source)
+                # Keep the snapshot up to date for the next start.
+                write_snapshot(data_frame, self.source, self.cache_dir, token)
+                continent_data_frame = data_frame.loc[data_frame['continent'] == self.continent].drop(columns='continent')
+            new_rows = self._dataset.select_new_rows(prepare_data_frame(continent_data_frame))
+            if new_rows.empty:
+                self.watcher.confirm(token)
+                return False
+
+            # A single reference assignment: callbacks see either the old or the new Dataset, never a mix.
+            self._dataset = self._dataset.append(new_rows)
+            # The token is kept only after the swap, the content of a failed refresh is read again next time.
+            self.watcher.confirm(token)
+            logger.info('Appended %d rows, dataset version is now %s.', len(new_rows), self._dataset.version)
+
+            for listener in self._listeners:
+                listener(self._dataset)
+            return True
+
+    def _run(self):
+        while not self.is_ready():
+            try:
+                self.load()
+            except Exception as error:
+                self.load_error = error
+                logger.exception('Loading the %s data from %s failed.', self.continent, self.source)
+                if self._stop_event.wait(self.load_retry_interval):
+                    return
+
+        if self.interval <= 0:
+            return
+        while not self._stop_event.wait(self.interval):
+            try:
+                self.refresh()
+            except Exception:
+                logger.exception('Refreshing the %s data from %s failed.', self.continent, self.source)
+
+    def start(self):
+        if self._thread is not None or (self.is_ready() and self.interval <= 0):
+            return
+        self._thread = threading.Thread(target=self._run, name=f'dataset-refresh-{self.continent}', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
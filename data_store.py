@@ -0,0 +1,142 @@
+import numpy as np
+import pandas as pd
+
+# Columns with a precomputed as-of index: the most recent valid value of a country on or before any row.
+AS_OF_COLUMNS = ['total_cases', 'total_deaths', 'total_tests', 'covid19_death_rate']
+
+# Attributes of a country that do not change from day to day, held once per country in the country table.
+STATIC_COLUMNS = ['population', 'median_age', 'life_expectancy', 'hospital_beds_per_thousand']
+
+# Columns of the country table built from the rows, see build_country_table.
+COUNTRY_COLUMNS = ['location', 'iso_code'] + STATIC_COLUMNS
+
+
+# Convert a date from the DatePickerRange ('YYYY-MM-DD' string) or the data frame to numpy datetime64.
+def to_datetime64(date):
+    return pd.Timestamp(date).to_datetime64()
+
+
+# Index of the last row at or before every row where the values are not null, -1 before the first one.
+def last_valid_index(values):
+    row_index = np.arange(len(values), dtype=np.int32)
+    return np.maximum.accumulate(np.where(pd.notnull(values), row_index, np.int32(-1)))
+
+
+# Contiguous row slices of the countries of a data frame ordered by location: [(country, first, last + 1)].
+def country_row_slices(data_frame):
+    codes = data_frame['location'].cat.codes.to_numpy()
+    if not len(codes):
+        return []
+    boundaries = np.flatnonzero(codes[1:] != codes[:-1]) + 1
+    starts = np.concatenate(([0], boundaries))
+    stops = np.concatenate((boundaries, [len(codes)]))
+    countries = data_frame['location'].cat.categories[codes[starts]]
+    return [(country, int(start), int(stop)) for country, start, stop in zip(countries, starts, stops)]
+
+
+# Dimension table of the countries of a data frame sorted by location whose categories are all used: one row per
+# country code with its name, ISO code and the last valid value of the static attributes.
+def build_country_table(data_frame):
+    codes = data_frame['location'].cat.codes.to_numpy()
+    last_rows = np.append(np.flatnonzero(codes[1:] != codes[:-1]), len(codes) - 1) if len(codes) else codes
+    first_rows = np.concatenate(([0], last_rows[:-1] + 1))[:len(last_rows)]
+    table = pd.DataFrame({
+        'location': data_frame['location'].cat.categories.astype(str),
+        'iso_code': np.asarray(data_frame['iso_code'].array.take(last_rows)).astype(str),
+    })
+    for column in STATIC_COLUMNS:
+        valid_rows = last_valid_index(data_frame[column].to_numpy())[last_rows]
+        values = data_frame[column].to_numpy()[np.maximum(valid_rows, 0)]
+        table[column] = np.where(valid_rows >= first_rows, values, np.nan).astype(values.dtype)
+    return table
+
+
+# Copy of a data frame with the columns of the country table joined in by the country code, for the figures
+# built by plotly express.
+def join_country_columns(data_frame, country_table, columns=('location', 'iso_code')):
+    codes = data_frame['country'].to_numpy()
+    return data_frame.assign(**{column: country_table[column].to_numpy()[codes] for column in columns})
+
+
+#############################################################################################################
+# Query layer over the data frame sorted by (location, date).
+# The rows of a country are one contiguous slice and its dates are sorted, so a (countries, start_date,
+# end_date) selection is one binary search per country followed by zero-copy row slicing.
+#############################################################################################################
+class CountryDateStore:
+
+    def __init__(self, data_frame, country_table, last_valid_rows=None):
+        # Expects the data frame sorted by (location, date) with a categorical 'location' column whose codes are
+        # the rows of the country table.
+        self.data_frame = data_frame
+        self.country_table = country_table
+        self.dates = data_frame['date'].to_numpy()
+
+        # country -> (first row, last row + 1)
+        self.country_slices = {location: (start, stop) for location, start, stop in country_row_slices(data_frame)}
+
+        # column -> last valid row index at or before every row. The index may point into the previous
+        # country, lookups therefore check it against the first row of the selected range.
+        # A shared dataset segment brings them precomputed (see shared_dataset.py).
+        self.last_valid_rows = last_valid_rows if last_valid_rows is not None else {
+            column: last_valid_index(data_frame[column].to_numpy()) for column in AS_OF_COLUMNS if column in data_frame}
+
+    # Row range [first, last + 1) of a country within [start_date, end_date], both dates included.
+    def row_range(self, country, start_date=None, end_date=None):
+        start, stop = self.country_slices.get(country, (0, 0))
+        country_dates = self.dates[start:stop]
+
+        first = start if start_date is None else start + np.searchsorted(country_dates, to_datetime64(start_date), 'left')
+        last = stop if end_date is None else start + np.searchsorted(country_dates, to_datetime64(end_date), 'right')
+        return int(first), int(max(first, last))
+
+    # Row ranges of the selected countries, in the order of the selection.
+    def row_ranges(self, countries, start_date=None, end_date=None):
+        if isinstance(countries, str):
+            countries = [countries]
+        return [self.row_range(country, start_date, end_date) for country in countries]
+
+    # Rows of the selected countries within [start_date, end_date].
+    # A single country is returned as a view on the data frame, several countries are concatenated.
+    def select(self, countries, start_date=None, end_date=None, columns=None):
+        # Ranges are taken in row order, so the result is ordered like the data frame.
+        parts = [self.data_frame.iloc[first:last] for first, last in sorted(self.row_ranges(countries, start_date, end_date))
+                 if last > first]
+
+        if not parts:
+            selection = self.data_frame.iloc[0:0]
+        elif len(parts) == 1:
+            selection = parts[0]
+        else:
+            selection = pd.concat(parts)
+        # Columns are taken after the row slicing, so only the selected rows are copied.
+        return selection if columns is None else selection[columns]
+
+    # Most recent value of the columns on or before end_date within [start_date, end_date] for each country,
+    # like groupby('location').last() on the selected rows but with one binary search per country.
+    # 'date' is the date of the last selected row, or with valid_column the date of its most recent value,
+    # countries without a value of valid_column in the range are then left out. Countries are identified by
+    # their int16 'country' code, static columns are taken from the country table.
+    def latest(self, countries, start_date=None, end_date=None, columns=AS_OF_COLUMNS + STATIC_COLUMNS,
+               valid_column=None):
+        row_ranges = sorted(self.row_ranges(countries, start_date, end_date))
+        first = np.array([first for first, last in row_ranges], dtype=np.int64)
+        last_row = np.array([last - 1 for first, last in row_ranges], dtype=np.int64)
+
+        is_selected = last_row >= first
+        if valid_column is not None:
+            valid_rows = self.last_valid_rows[valid_column][np.maximum(last_row, 0)] if len(last_row) else last_row
+            is_selected &= valid_rows >= first
+            last_row = np.where(is_selected, valid_rows, last_row)
+        first, last_row = first[is_selected], last_row[is_selected]
+
+        codes = self.data_frame['location'].cat.codes.to_numpy()[last_row].astype(np.int16)
+        latest_data_frame = pd.DataFrame({'country': codes, 'date': self.dates[last_row]})
+        for column in columns:
+            if column in STATIC_COLUMNS:
+                latest_data_frame[column] = self.country_table[column].to_numpy()[codes]
+                continue
+            valid_rows = self.last_valid_rows[column][last_row]
+            values = self.data_frame[column].to_numpy()[np.maximum(valid_rows, 0)]
+            latest_data_frame[column] = np.where(valid_rows >= first, values, np.nan).astype(values.dtype)
+        return latest_data_frame
@@ -0,0 +1,137 @@
+import functools
+
+import numpy as np
+import pandas as pd
+from plotly.colors import qualitative, sample_colorscale
+
+import config
+from data_loader import continent_slug
+from data_store import COUNTRY_COLUMNS, STATIC_COLUMNS, CountryDateStore, build_country_table
+from kpis import compute_kpi_series
+from metrics import add_metrics, extend_metrics, has_metrics
+
+# Creating color list by combining different discrete plotly maps
+COLOR_LIST = qualitative.Alphabet + qualitative.Dark24 + qualitative.Dark2
+
+
+# Distinct colors for the countries of a region, sampled from a continuous scale above the size of COLOR_LIST.
+def region_colors(count):
+    if count <= len(COLOR_LIST):
+        return COLOR_LIST[:count]
+    return sample_colorscale('Turbo', [i / max(count - 1, 1) for i in range(count)])
+
+
+# True when the rows are ordered by (location, date) already, like the rows of a snapshot.
+def is_sorted_by_location_date(data_frame):
+    codes = data_frame['location'].cat.codes.to_numpy()
+    dates = data_frame['date'].to_numpy()
+    same_location = codes[1:] == codes[:-1]
+    return bool(np.all(codes[1:] >= codes[:-1]) and np.all(dates[1:][same_location] >= dates[:-1][same_location]))
+
+
+# Content hash of the rows and the country table, identical in every worker process holding the same data.
+def dataset_version(data_frame, country_table):
+    row_hashes = pd.util.hash_pandas_object(data_frame, index=False).to_numpy()
+    country_hashes = pd.util.hash_pandas_object(country_table, index=False).to_numpy()
+    return format((int(row_hashes.sum(dtype=np.uint64)) + int(country_hashes.sum(dtype=np.uint64))) % 2 ** 64, '016x')
+
+
+#############################################################################################################
+# Immutable view of the data of one region (continent) together with the values derived from it.
+# A new Dataset is built on every refresh and swapped in as a whole, so a callback holding a reference
+# always sees a consistent state.
+#############################################################################################################
+class Dataset:
+
+    # The rows keep the country as a categorical 'location' column, whose codes are the rows of the country
+    # table holding the names, ISO codes, colors and static attributes of the countries.
+    # version, last_valid_rows and country_table are passed by shared_dataset.py for data attached from a shared
+    # segment.
+    def __init__(self, data_frame, region=None, version=None, last_valid_rows=None, country_table=None):
+        # Keep the rows of every country together and ordered by date for the CountryDateStore. Sorted rows are
+        # used as they are, they may be read-only views on shared memory.
+        if is_sorted_by_location_date(data_frame):
+            data_frame = data_frame.reset_index(drop=True)
+        else:
+            data_frame = data_frame.sort_values(['location', 'date'], kind='stable', ignore_index=True)
+        # Snapshots written before the derived metrics were added lack their columns.
+        if not has_metrics(data_frame):
+            data_frame = add_metrics(data_frame)
+        if country_table is None:
+            location = data_frame['location']
+            if not np.bincount(location.cat.codes.to_numpy(), minlength=len(location.cat.categories)).all():
+                data_frame = data_frame.assign(location=location.cat.remove_unused_categories())
+            country_table = build_country_table(data_frame)
+            # The ISO code and the static attributes are held once per country in the country table
+            data_frame = data_frame.drop(columns=['iso_code'] + STATIC_COLUMNS, errors='ignore')
+        self.data_frame = data_frame
+        self.region = region or config.DEFAULT_REGION
+        # Cached values of a region start with its namespace, a refresh drops the other versions of the region only.
+        self.cache_namespace = continent_slug(self.region) + '-'
+        self.version = version or self.cache_namespace + dataset_version(data_frame, country_table[COUNTRY_COLUMNS])
+
+        self.first_date = data_frame['date'].min()
+        self.last_date = data_frame['date'].max()
+
+        # getting the list of countries, ordered by their code
+        self.countries = country_table['location'].tolist()
+        self.color_dict = dict(zip(self.countries, region_colors(len(self.countries))))
+
+        # Creating color dictionary for choropleth map
+        self.iso_code_list = country_table['iso_code'].unique().tolist()
+        self.iso_code_color_dict = dict(zip(self.iso_code_list, region_colors(len(self.iso_code_list))))
+
+        self.country_table = country_table.assign(
+            color=[self.color_dict[country] for country in self.countries],
+            iso_color=[self.iso_code_color_dict[iso_code] for iso_code in country_table['iso_code']])
+        self.store = CountryDateStore(data_frame, self.country_table, last_valid_rows)
+
+    # Memory held by the rows, for the memory budget of the loaded regions.
+    @functools.cached_property
+    def nbytes(self):
+        return int(self.data_frame.memory_usage(deep=True).sum())
+
+    # Total confirmed cases and deaths, new confirmed cases and deaths of every date, computed on first use.
+    @functools.cached_property
+    def kpis(self):
+        return compute_kpi_series(self)
+
+    # Rows of updated_data_frame dated after the last known date of their country, all rows of new countries.
+    def select_new_rows(self, updated_data_frame):
+        country_slices = self.store.country_slices
+        last_dates = pd.Series(self.store.dates[[stop - 1 for start, stop in country_slices.values()]],
+                               index=list(country_slices))
+
+        # New countries get NaT, the comparison with NaT is False
+        known_last_date = last_dates.reindex(updated_data_frame['location'].astype(str)).to_numpy()
+        is_new = pd.isna(known_last_date) | (updated_data_frame['date'].to_numpy() > known_last_date)
+        return updated_data_frame.loc[is_new]
+
+    # Rows with the ISO code and the static attributes of their country joined in, like the rows of a snapshot.
+    def snapshot_rows(self):
+        codes = self.data_frame['location'].cat.codes.to_numpy()
+        return self.data_frame.assign(
+            iso_code=pd.Categorical(self.country_table['iso_code'].to_numpy()[codes]),
+            **{column: self.country_table[column].to_numpy()[codes] for column in STATIC_COLUMNS})
+
+    # New Dataset with the rows appended.
+    def append(self, new_rows):
+        frames = [self.snapshot_rows(), new_rows]
+        # Sorted categories like the snapshot, so that the countries and their colors match a fresh load of the
+        # same version, e.g. in another worker process.
+        for column in ['iso_code', 'location']:
+            categories = pd.Index(frames[0][column].cat.categories).union(new_rows[column].cat.categories)
+            categories = categories.sort_values()
+            frames = [frame.assign(**{column: frame[column].cat.set_categories(categories)}) for frame in frames]
+
+        # The index keeps the position before sorting, the new rows follow the rows of this dataset.
+        data_frame = pd.concat(frames, ignore_index=True).sort_values(['location', 'date'], kind='stable')
+        # Only the derived metrics of the new days and the days after them are computed.
+        data_frame = extend_metrics(data_frame.reset_index(drop=True),
+                                    data_frame.index.to_numpy() >= len(self.data_frame))
+
+        dataset = Dataset(data_frame, self.region)
+        # Only the days from the first new row on change, the numbers of the days before are kept.
+        if 'kpis' in self.__dict__ and len(new_rows):
+            dataset.kpis = self.kpis.extend(dataset, new_rows['date'].min())
+        return dataset
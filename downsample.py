@@ -0,0 +1,139 @@
+import numpy as np
+import pandas as pd
+
+import config
+from data_store import country_row_slices
+from instrumentation import timed
+from metrics import DEFAULT_METRIC, METRICS
+
+# Columns of the hover text of the line graph, next to the metric of the y-axis.
+LINE_GRAPH_HOVER_COLUMNS = ['total_cases', 'total_deaths', 'new_cases', 'new_deaths']
+
+# Smallest number of points of a downsampled line, LTTB keeps every point below it.
+MIN_LINE_POINTS = 3
+
+
+# Date window [start, end] of a zoom event of the line graph, None when the date axis shows the whole range.
+# The window is widened to full days and one day on each side, so the lines reach the edges of the plot.
+def zoom_window(relayout_data):
+    if not relayout_data or relayout_data.get('xaxis.autorange'):
+        return None
+    if 'xaxis.range' in relayout_data:
+        start, end = relayout_data['xaxis.range'][:2]
+    elif 'xaxis.range[0]' in relayout_data and 'xaxis.range[1]' in relayout_data:
+        start, end = relayout_data['xaxis.range[0]'], relayout_data['xaxis.range[1]']
+    else:
+        return None
+    start = pd.Timestamp(start).floor('D') - pd.Timedelta(days=1)
+    end = pd.Timestamp(end).ceil('D') + pd.Timedelta(days=1)
+    return str(start.date()), str(end.date())
+
+
+# Rows of a data frame within the date window, both dates included.
+def window_rows(data_frame, window):
+    if window is None:
+        return data_frame
+    dates = data_frame['date'].to_numpy()
+    start, end = (pd.Timestamp(date).to_datetime64() for date in window)
+    return data_frame.loc[(dates >= start) & (dates <= end)]
+
+
+# Indices of the points kept by largest-triangle-three-buckets downsampling of the series (x, y).
+# The first and the last point are always kept, points with a missing y value are skipped.
+def lttb_indices(x, y, threshold):
+    valid = np.flatnonzero(~np.isnan(y))
+    if not len(valid):
+        return np.arange(min(len(y), 1))
+    if threshold >= len(valid) or threshold < 3:
+        return valid
+    x, y = x[valid], y[valid]
+
+    # threshold - 2 buckets between the first and the last point
+    edges = np.linspace(1, len(x) - 1, threshold - 1).astype(np.int64)
+    # Third vertex of the triangles of a bucket: the average point of the next bucket, the last point after the
+    # last bucket. They do not depend on the selected points and are computed at once.
+    bucket_sizes = np.diff(edges)
+    next_x = np.append(np.add.reduceat(x[1:-1], edges[:-1] - 1)[1:] / bucket_sizes[1:], x[-1]).tolist()
+    next_y = np.append(np.add.reduceat(y[1:-1], edges[:-1] - 1)[1:] / bucket_sizes[1:], y[-1]).tolist()
+
+    # Buckets hold a few points each, a plain loop is faster than numpy calls per bucket.
+    x_list, y_list, edge_list = x.tolist(), y.tolist(), edges.tolist()
+    selected = [0]
+    previous_x, previous_y = x_list[0], y_list[0]
+    for bucket in range(threshold - 2):
+        third_x, third_y = next_x[bucket], next_y[bucket]
+        best, best_area = edge_list[bucket], -1.0
+        for point in range(edge_list[bucket], edge_list[bucket + 1]):
+            area = abs((previous_x - third_x) * (y_list[point] - previous_y)
+                       - (previous_x - x_list[point]) * (third_y - previous_y))
+            if area > best_area:
+                best, best_area = point, area
+        selected.append(best)
+        previous_x, previous_y = x_list[best], y_list[best]
+    selected.append(len(x_list) - 1)
+    return valid[selected]
+
+
+# Weekly rows of a data frame sorted by (location, date) for the metric of the y-axis and the hover columns,
+# aggregated as registered in metrics.py: the mean of rates and averages, the cumulative totals at the end of
+# the week and the sums of the new cases and deaths, dated on the Monday of the week.
+def weekly_rows(data_frame, metric=DEFAULT_METRIC):
+    codes = data_frame['location'].cat.codes.to_numpy()
+    days = data_frame['date'].to_numpy().astype('datetime64[D]').astype(np.int64)
+    # 1970-01-01 was a Thursday
+    weeks = (days + 3) // 7
+    boundaries = np.flatnonzero((codes[1:] != codes[:-1]) | (weeks[1:] != weeks[:-1])) + 1
+    starts = np.concatenate(([0], boundaries))
+    lasts = np.concatenate((boundaries, [len(codes)])) - 1
+
+    def weekly_sum(values):
+        valid = ~np.isnan(values)
+        sums = np.add.reduceat(np.where(valid, values, 0.0), starts)
+        counts = np.add.reduceat(valid.astype(np.int64), starts)
+        return sums, counts
+
+    weekly = {
+        'location': data_frame['location'].array.take(starts),
+        'date': (weeks[starts] * 7 - 3).astype('datetime64[D]').astype('datetime64[ns]'),
+    }
+    for column in dict.fromkeys([metric] + LINE_GRAPH_HOVER_COLUMNS):
+        aggregation = METRICS[column].weekly
+        if aggregation == 'last':
+            weekly[column] = data_frame[column].to_numpy()[lasts]
+            continue
+        sums, counts = weekly_sum(data_frame[column].to_numpy(dtype=np.float64))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            weekly[column] = np.where(counts > 0, sums if aggregation == 'sum' else sums / counts, np.nan)
+    return pd.DataFrame(weekly)
+
+
+# Reduce the rows of the line graph to at most max_points, method is 'lttb', 'weekly' or 'none'. With more than
+# max_points / MIN_LINE_POINTS lines every line keeps MIN_LINE_POINTS points.
+# Returns the rows and their resolution: 'daily' when the rows fit the budget, else the method.
+def level_of_detail(data_frame, max_points, method, metric=DEFAULT_METRIC):
+    if method == 'none' or len(data_frame) <= max_points:
+        return data_frame, 'daily'
+    if method == 'weekly':
+        data_frame = weekly_rows(data_frame, metric)
+        if len(data_frame) <= max_points:
+            return data_frame, 'weekly'
+
+    # LTTB on every line with an equal share of the point budget, at least its first, last and one point between
+    slices = country_row_slices(data_frame)
+    threshold = max(max_points // max(len(slices), 1), MIN_LINE_POINTS)
+    days = data_frame['date'].to_numpy().astype('datetime64[D]').astype(np.float64)
+    y = data_frame[metric].to_numpy(dtype=np.float64)
+    indices = np.concatenate([start + lttb_indices(days[start:stop], y[start:stop], threshold)
+                              for _, start, stop in slices])
+    return data_frame.iloc[indices], method
+
+
+# Rows of the line graph of a metric for the selection and the zoom window, at full resolution while they fit the
+# point budget. uirevision keeps the zoom of the user when the downsampled figure is replaced.
+@timed('downsample')
+def line_graph_view(selection, window, uirevision, metric=None, max_points=None, method=None):
+    metric = metric or DEFAULT_METRIC
+    data_frame, resolution = level_of_detail(window_rows(selection['data_frame'], window),
+                                             max_points or config.LINE_GRAPH_MAX_POINTS,
+                                             method or config.LINE_GRAPH_DOWNSAMPLING, metric)
+    return {'data_frame': data_frame, 'resolution': resolution, 'uirevision': uirevision, 'metric': metric}
@@ -0,0 +1,322 @@
+#############################################################################################################
+# Pre-render the dashboard as static pages for read-only visits, served by nginx or a CDN without a Python
+# process. Every preset (region, countries, date range, metric of the line graph) becomes a HTML page and the
+# JSON of its four figures, built with the figure builders of the callbacks:
+#
+#   python export_static.py [--output-dir data/static] [--presets data/static-presets.json] [--workers 4]
+#                           [--regions Europe,Asia] [--force] [--no-refresh]
+#
+# Besides the presets of the presets file, the default view of every region (the default countries over the
+# whole date range) is rendered, the one of the default region also as index.html. The presets are rendered in
+# parallel processes. A run first checks the data source for new data like the background refresh of the app,
+# then renders only the presets whose selected rows changed since the last run (see manifest.json).
+#############################################################################################################
+import argparse
+import concurrent.futures
+import hashlib
+import html
+import json
+import logging
+import os
+import shutil
+
+import pandas as pd
+import plotly
+import plotly.io as pio
+
+import config
+from data_loader import continent_slug
+from data_refresh import DatasetRefresher
+from data_store import COUNTRY_COLUMNS
+from downsample import line_graph_view
+from figures import build_figure, choropleth_map_values, colors, geojson_choropleth_map
+from http_responses import code_version
+from metrics import DEFAULT_METRIC, METRICS
+from selection import compute_selection, default_countries, selection_inputs
+
+logger = logging.getLogger(__name__)
+
+# File listing the rendered presets with the hash of their selection.
+MANIFEST_FILE_NAME = 'manifest.json'
+
+# Files shared by all pages, copied to the static/ directory of the output.
+STATIC_FILES = {
+    'plotly.min.js': os.path.join(os.path.dirname(plotly.__file__), 'package_data', 'plotly.min.js'),
+    'base.css': os.path.join(config.BASE_DIR, 'assets', 'base.css'),
+    'covid_19.css': os.path.join(config.BASE_DIR, 'assets', 'covid_19.css'),
+    'countries.geojson': config.COUNTRY_GEOMETRIES_PATH,
+}
+
+# Settings changing the figures of a selection, part of the hash of a preset with the code.
+FIGURE_SETTINGS = ['FIGURE_MODE', 'CHOROPLETH_MAP_MODE', 'LINE_GRAPH_MAX_POINTS', 'LINE_GRAPH_DOWNSAMPLING']
+FIGURE_CODE_VERSION = code_version(FIGURE_SETTINGS)
+
+# Datasets of the regions in this process. Worker processes started with fork inherit the ones of the main
+# process, others load them from the snapshot written by the main process.
+_datasets = {}
+
+
+def region_dataset(region):
+    dataset = _datasets.get(region)
+    if dataset is None:
+        dataset = _datasets[region] = DatasetRefresher(region, interval=0).current()
+    return dataset
+
+
+# Load the data of a region and append the days published since the snapshot was written.
+def load_region(region, refresh=True):
+    refresher = DatasetRefresher(region, interval=0)
+    if refresh:
+        refresher.refresh()
+    _datasets[region] = refresher.current()
+    return _datasets[region]
+
+
+# The default view of every region and the presets of the presets file, with a unique file name each.
+def load_presets(path, regions):
+    presets = [{'name': continent_slug(region), 'title': f'{region}: default view', 'region': region}
+               for region in regions]
+    if path and os.path.exists(path):
+        with open(path) as presets_file:
+            presets += json.load(presets_file)
+    names = set()
+    for preset in presets:
+        preset['name'] = continent_slug(preset.get('name') or preset.get('title') or '')
+        preset.setdefault('region', config.DEFAULT_REGION)
+        preset.setdefault('title', preset['name'])
+        if not preset['name'] or preset['name'] in names:
+            raise ValueError(f"Preset {preset.get('title')!r} needs a unique name.")
+        if preset.get('metric', DEFAULT_METRIC) not in METRICS:
+            raise ValueError(f"Unknown metric {preset['metric']!r} of the preset {preset['name']!r}.")
+        names.add(preset['name'])
+    return presets
+
+
+# Inputs of the selection of a preset: its countries (default: the default countries of the region) between its
+# start and end date, or over its last 'days' days. Unknown countries are skipped.
+def preset_inputs(preset, dataset):
+    countries = [country for country in preset.get('countries') or default_countries(dataset)
+                 if country in dataset.countries]
+    start_date, end_date = preset.get('start_date'), preset.get('end_date')
+    if preset.get('days'):
+        start_date = str((dataset.last_date - pd.Timedelta(days=preset['days'] - 1)).date())
+        end_date = str(dataset.last_date.date())
+    return selection_inputs(countries, start_date, end_date)
+
+
+def hash_frame(digest, data_frame):
+    digest.update(pd.util.hash_pandas_object(data_frame, index=False).to_numpy().tobytes())
+
+
+# Content hash of everything the figures of a preset are built from: the selected rows, the country table of the
+# region (colors, the countries of the map), the preset and the code and settings of the app.
+def selection_hash(preset, selection, dataset):
+    digest = hashlib.sha1(json.dumps([FIGURE_CODE_VERSION, preset], sort_keys=True).encode())
+    for name in ['data_frame', 'recent_deaths', 'recent_tests', 'recent_death_rate']:
+        hash_frame(digest, selection[name])
+    hash_frame(digest, dataset.country_table[COUNTRY_COLUMNS])
+    return digest.hexdigest()
+
+
+# The four figures of a selection, like the figure callbacks of the server date filtering without zoom.
+def build_figures(selection, dataset, metric):
+    figures = {
+        'line-graph': build_figure('line-graph', selection, dataset,
+                                   view=line_graph_view(selection, None, uirevision=metric, metric=metric)),
+        'pie-chart': build_figure('pie-chart', selection, dataset),
+        'parallel-coordinates': build_figure('parallel-coordinates', selection, dataset),
+    }
+    if config.CHOROPLETH_MAP_MODE == 'geojson':
+        choropleth_map = geojson_choropleth_map(dataset, 'static/countries.geojson')
+        choropleth_map['data'][1].update(choropleth_map_values(selection, dataset))
+        figures['choropleth-map'] = choropleth_map
+    else:
+        figures['choropleth-map'] = build_figure('choropleth-map', selection, dataset)
+    return {figure_id: figure.to_plotly_json() if hasattr(figure, 'to_plotly_json') else figure
+            for figure_id, figure in figures.items()}
+
+
+# Write a file through a temporary file, a server never sees it half written. Unchanged files are not touched.
+def write_file(path, data):
+    if os.path.exists(path):
+        with open(path, 'rb') as existing_file:
+            if existing_file.read() == data:
+                return False
+    temporary_path = f'{path}.{os.getpid()}.tmp'
+    with open(temporary_path, 'wb') as output_file:
+        output_file.write(data)
+    os.replace(temporary_path, path)
+    return True
+
+
+# Render the figures of a preset to <name>.json unless the hash of its selection is the one of the last run.
+# Runs in the worker processes, returns the manifest entry of the preset.
+def render_preset(preset, output_dir, previous_hash=None):
+    dataset = region_dataset(preset['region'])
+    inputs = preset_inputs(preset, dataset)
+    selection = compute_selection(dataset, inputs)
+    content_hash = selection_hash(preset, selection, dataset)
+    figures_path = os.path.join(output_dir, f"{preset['name']}.json")
+
+    rendered = content_hash != previous_hash or not os.path.exists(figures_path)
+    if rendered:
+        figures = build_figures(selection, dataset, preset.get('metric', DEFAULT_METRIC))
+        write_file(figures_path, pio.json.to_json_plotly(figures).encode())
+    return {'hash': content_hash, 'rendered': rendered, 'region': preset['region'], 'title': preset['title'],
+            'inputs': inputs, 'metric': preset.get('metric', DEFAULT_METRIC)}
+
+
+#############################################################################################################
+# HTML of the pages: the header numbers of the region, links to the other presets and the figures, drawn by
+# plotly.js from the JSON of the preset. The JSON URL carries the hash of the selection, so that a CDN can keep
+# it as long as the page links to it.
+#############################################################################################################
+PAGE_TEMPLATE = '''<!DOCTYPE html>
+<html lang="en">
+<head>
+<meta charset="utf-8">
+<meta name="viewport" content="width=device-width, initial-scale=1">
+<title>{title}</title>
+<link rel="stylesheet" href="static/base.css">
+<link rel="stylesheet" href="static/covid_19.css">
+<script src="static/plotly.min.js"></script>
+</head>
+<body>
+<div class="ten columns offset-by-one" style="color: {text_color}">
+<div class="row" style="margin: 15px 0">
+<h1>{heading}</h1>
+<p>Dashboard: Covid-19 outbreak. Last Updated: <b style="color: {confirmed_color}">{last_updated}</b>.
+Outbreak since: {first_date}. {description}</p>
+<p>{links}</p>
+</div>
+<div class="row" style="margin: 15px 0">{numbers}</div>
+<div class="row" style="margin: 15px 0">
+<div class="eight columns"><div id="line-graph"></div></div>
+<div class="four columns"><div id="pie-chart"></div></div>
+</div>
+<div class="row" style="margin: 15px 0">
+<div class="eight columns"><div id="parallel-coordinates"></div></div>
+<div class="four columns"><div id="choropleth-map"></div></div>
+</div>
+</div>
+<script>
+fetch('{figures_url}').then(response => response.json()).then(figures => {{
+  for (const [id, figure] of Object.entries(figures)) {{
+    Plotly.newPlot(id, figure.data, figure.layout, {{responsive: true}});
+  }}
+}});
+</script>
+</body>
+</html>
+'''
+
+NUMBER_TEMPLATE = ('<div class="three columns" style="background-color: #393939; border-radius: 10px; '
+                   'text-align: center; color: {color}"><h4>{label}</h4><p style="font-size: 30px">{value}</p></div>')
+
+
+def format_date(date):
+    return pd.Timestamp(date).strftime('%d-%b-%Y')
+
+
+# Header numbers of the region at the last date, or at the end date of the preset with HEADER_FOLLOWS_END_DATE.
+def header_numbers(dataset, end_date):
+    kpis = dataset.kpis.at(end_date if config.HEADER_FOLLOWS_END_DATE else None)
+    numbers = [('Total Cases: ', kpis['total_cases'], colors['confirmed_text']),
+               ('Total Deceased: ', kpis['total_deaths'], colors['deaths_text']),
+               ('New Cases: ', kpis['new_cases'], colors['recovered_text']),
+               ('New Decease: ', kpis['new_deaths'], colors['recovered_text'])]
+    return ''.join(NUMBER_TEMPLATE.format(label=label, value=f'{value:,.0f}', color=color)
+                   for label, value, color in numbers)
+
+
+def page_html(preset, entry, manifest):
+    dataset = region_dataset(preset['region'])
+    inputs = entry['inputs']
+    start_date = format_date(inputs['start_date'] or dataset.first_date)
+    end_date = format_date(inputs['end_date'] or dataset.last_date)
+    description = (f"{', '.join(inputs['countries'])} from {start_date} to {end_date}, "
+                   f"line graph: {METRICS[entry['metric']].label}.")
+    links = ' | '.join(f'<a href="{name}.html">{html.escape(other["title"])}</a>' for name, other in manifest.items())
+    return PAGE_TEMPLATE.format(
+        title=html.escape(f"COVID-19 Analysis: {preset['title']}"),
+        heading=html.escape(f"Analysis and Visualization of COVID-19 Impact and Response in {preset['region']}."),
+        text_color=colors['text'], confirmed_color=colors['confirmed_text'],
+        last_updated=format_date(dataset.last_date), first_date=format_date(dataset.first_date),
+        description=html.escape(description), links=links,
+        numbers=header_numbers(dataset, inputs['end_date']),
+        figures_url=f"{preset['name']}.json?v={entry['hash'][:16]}")
+
+
+def read_export_manifest(output_dir):
+    try:
+        with open(os.path.join(output_dir, MANIFEST_FILE_NAME)) as manifest_file:
+            return json.load(manifest_file)
+    except (OSError, ValueError):
+        return {}
+
+
+# Delete the files of presets rendered by an earlier run and removed from the presets file since.
+def remove_stale_presets(output_dir, manifest, previous_manifest):
+    for name in previous_manifest.keys() - manifest.keys():
+        for extension in ['json', 'html']:
+            path = os.path.join(output_dir, f'{name}.{extension}')
+            if os.path.exists(path):
+                os.remove(path)
+        logger.info('Removed the preset %s.', name)
+
+
+def export(output_dir, presets, workers=None, force=False):
+    os.makedirs(os.path.join(output_dir, 'static'), exist_ok=True)
+    for name, source_path in STATIC_FILES.items():
+        target_path = os.path.join(output_dir, 'static', name)
+        if not os.path.exists(target_path) or os.path.getmtime(target_path) < os.path.getmtime(source_path):
+            shutil.copyfile(source_path, target_path)
+
+    previous_manifest = read_export_manifest(output_dir)
+    manifest = {}
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {preset['name']: executor.submit(render_preset, preset, output_dir, None if force else
+                                                   previous_manifest.get(preset['name'], {}).get('hash'))
+                   for preset in presets}
+        for name, future in futures.items():
+            manifest[name] = future.result()
+            logger.info('%s the preset %s.', 'Rendered' if manifest[name].pop('rendered') else 'Kept', name)
+
+    # Every page links to every other page, the pages are written again (when changed) on every run.
+    for preset in presets:
+        page = page_html(preset, manifest[preset['name']], manifest).encode()
+        write_file(os.path.join(output_dir, f"{preset['name']}.html"), page)
+        if preset['name'] == continent_slug(config.DEFAULT_REGION):
+            write_file(os.path.join(output_dir, 'index.html'), page)
+
+    remove_stale_presets(output_dir, manifest, previous_manifest)
+    write_file(os.path.join(output_dir, MANIFEST_FILE_NAME), json.dumps(manifest, indent=2).encode())
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Pre-render the default views and presets as static pages.')
+    parser.add_argument('--output-dir', default=config.STATIC_EXPORT_DIR, help='Directory of the pages.')
+    parser.add_argument('--presets', default=config.STATIC_EXPORT_PRESETS, help='JSON file of the presets.')
+    parser.add_argument('--regions', default=','.join(config.REGIONS),
+                        help='Comma separated regions whose default view is rendered.')
+    parser.add_argument('--workers', type=int, default=None, help='Rendering processes. Default: CPU count.')
+    parser.add_argument('--force', action='store_true', help='Render every preset, changed or not.')
+    parser.add_argument('--no-refresh', action='store_true', help='Use the snapshot without checking the source.')
+    arguments = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+
+    presets = load_presets(arguments.presets, [region.strip() for region in arguments.regions.split(',')
+                                               if region.strip()])
+    for region in dict.fromkeys(preset['region'] for preset in presets):
+        try:
+            load_region(region, refresh=not arguments.no_refresh)
+        except KeyError as error:
+            logger.warning('Skipping the presets of %s: %s', region, error)
+    presets = [preset for preset in presets if preset['region'] in _datasets]
+    manifest = export(arguments.output_dir, presets, arguments.workers, arguments.force)
+    print(f'{len(manifest)} presets in {arguments.output_dir}')
+
+
+if __name__ == '__main__':
+    main()
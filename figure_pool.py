@@ -0,0 +1,17 @@
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+import config
+
+# Threads building the figures of the combined figure callback, shared by all requests of the worker process.
+executor = ThreadPoolExecutor(max_workers=config.FIGURE_WORKERS, thread_name_prefix='figure')
+
+
+# Call the functions of tasks ({name: function}) concurrently in the pool and return {name: result}.
+# Every task runs in a copy of the context of the request, so the phases it measures (see instrumentation.py)
+# count towards the callback request. A single task runs in the calling thread.
+def run_concurrently(tasks):
+    if len(tasks) <= 1:
+        return {name: function() for name, function in tasks.items()}
+    futures = {name: executor.submit(contextvars.copy_context().run, function) for name, function in tasks.items()}
+    return {name: future.result() for name, future in futures.items()}
@@ -0,0 +1,456 @@
+import functools
+import importlib.util
+
+import numpy as np
+import plotly.express as px
+import plotly.graph_objects as go
+import plotly.io as pio
+from plotly.colors import get_colorscale
+
+import config
+from data_store import country_row_slices, join_country_columns
+from geometries import mapped_iso_codes, region_map_bounds
+from instrumentation import timed
+from metrics import DEFAULT_METRIC, METRICS
+
+# Serialize figures with orjson when it is installed, numpy arrays are then encoded without conversion to lists.
+if importlib.util.find_spec('orjson') is not None:
+    pio.json.config.default_engine = 'orjson'
+
+#Overwrite your CSS setting by including style locally
+colors = {
+    'background': '#2D2D2D',
+    'text': '#E1E2E5',
+    'figure_text': '#ffffff',
+    'confirmed_text':'#3CA4FF',
+    'deaths_text':'#f44336',
+    'recovered_text':'#5A9E6F',
+    'highest_case_bg':'#393939',
+
+}
+
+LINE_GRAPH_LABELS = {'date': 'Date', 'stringency_index': 'Government stringency index (0-100)',
+                     'location': 'European country', 'total_cases': 'Total confirmed cases',
+                     'total_deaths': 'Total deaths', 'new_cases': 'New confirmed cases',
+                     'new_deaths': 'New deaths'}
+
+CHOROPLETH_MAP_LABELS = {'iso_code': 'ISO code', 'date': 'Date', 'location': 'European country',
+                         'total_cases': 'Total confirmed cases', 'total_deaths': 'Total deaths',
+                         'covid19_death_rate': 'COVID-19 Death rate(%)'}
+
+# Title of the line graph for the resolution of its rows, see downsample.py.
+LINE_GRAPH_TITLES = {'daily': 'Line Graphs for Multivariate Data',
+                     'lttb': 'Line Graphs for Multivariate Data (downsampled, zoom in for daily data)',
+                     'weekly': 'Line Graphs for Multivariate Data (weekly values, zoom in for daily data)'}
+
+PIE_CHART_HOVERTEMPLATE = 'Total tests: %{value} <br>Recent data available date,' + 'European country: %{customdata}</br>'
+
+# Scope of the choropleth map of a region, regions without a plotly scope show the world fitted to the countries.
+REGION_GEO_SCOPES = {'Europe': 'europe', 'Asia': 'asia', 'Africa': 'africa',
+                     'North America': 'north america', 'South America': 'south america'}
+
+
+# Label of a country of the region in the legends and hover texts.
+def location_label(region):
+    return 'European country' if region == 'Europe' else 'Country'
+
+
+def pie_chart_hovertemplate(region):
+    return PIE_CHART_HOVERTEMPLATE.replace('European country', location_label(region))
+
+# Dark theme shared by the figures.
+dark_theme = dict(plot_bgcolor=colors['background'], paper_bgcolor=colors['background'],
+                  title_font=dict(color=colors['figure_text']),
+                  xaxis=dict(title_font=dict(color=colors['figure_text'])),
+                  yaxis=dict(title_font=dict(color=colors['figure_text'])),
+                  xaxis_tickfont=dict(color=colors['figure_text']),
+                  yaxis_tickfont=dict(color=colors['figure_text']),
+                  legend=dict(font=dict(color=colors['figure_text'])))
+
+
+#############################################################################################################
+# Figures built with plotly express and plotly graph objects.
+#############################################################################################################
+# The rows, the metric of the y-axis and the layout changes of the line graph, for the level of detail view of
+# downsample.py.
+def line_graph_view_rows(selection, view):
+    if view is None:
+        return selection['data_frame'], DEFAULT_METRIC, {}
+    return view['data_frame'], view['metric'], {'title': {'text': LINE_GRAPH_TITLES[view['resolution']]},
+                                                'uirevision': view['uirevision']}
+
+
+def express_line_graph(selection, dataset, view=None):
+    data_frame, metric, view_layout = line_graph_view_rows(selection, view)
+    fig_line_graph = px.line(data_frame,
+                             x='date', y=metric,
+                             labels={**LINE_GRAPH_LABELS, metric: METRICS[metric].label,
+                                     'location': location_label(dataset.region)},
+                             color='location', color_discrete_map=dataset.color_dict,
+                             hover_data=['total_cases', 'total_deaths', 'new_cases', 'new_deaths'],
+                             title='Line Graphs for Multivariate Data', height=700)
+
+    fig_line_graph.update_layout(**dark_theme, **view_layout)
+
+    return fig_line_graph
+
+
+def express_parallel_coordinates_plot(selection, dataset):
+    countries_in_europe = dataset.countries
+
+    # The most recent data for each country, copied as columns are added below
+    recent_deaths_data_frame = selection['recent_deaths'].copy()
+
+    # Calculate the COVID-19 death rate
+    recent_deaths_data_frame['covid19_death_rate'] = (recent_deaths_data_frame['total_deaths'] / recent_deaths_data_frame['total_cases']) * 100
+
+    # Fill NA values with 0
+    recent_deaths_data_frame.fillna(0, inplace=True)
+
+    # The country codes are the positions of the countries in the tick labels of the countries axis
+    recent_deaths_data_frame['num'] = recent_deaths_data_frame['country']
+
+    # Plotting Parallel Coordinates for the data frame
+    fig_parallel_coordinates = go.Figure(data=go.Parcoords(
+        line=dict(color=recent_deaths_data_frame['num'], colorscale='HSV',
+                  showscale=False, cmin=0, cmax=len(countries_in_europe)),
+                  dimensions=list(
+                      [
+                        dict(range=[0, len(countries_in_europe)],
+                               tickvals=list(range(len(countries_in_europe))), ticktext=countries_in_europe,
+                                label="countries", values=recent_deaths_data_frame['num']),
+                        dict(range=[0, recent_deaths_data_frame['hospital_beds_per_thousand'].max()],
+                             label="Hospitals beds per 1000", values=recent_deaths_data_frame['hospital_beds_per_thousand']),
+                        dict(range=[0, recent_deaths_data_frame['median_age'].max()],
+                             label='Median Age', values=recent_deaths_data_frame['median_age']),
+                        dict(range=[0, recent_deaths_data_frame['population'].max()],
+                             label='Population', values=recent_deaths_data_frame['population']),
+                        dict(range=[0, recent_deaths_data_frame['life_expectancy'].max()],
+                             label='Life expectancy', values=recent_deaths_data_frame['life_expectancy']),
+                        dict(range=[0, recent_deaths_data_frame['covid19_death_rate'].max()],
+                             label='COVID-19 Death rate', values=recent_deaths_data_frame['covid19_death_rate']),
+                        ]
+                    )
+        ), layout=go.Layout(
+            autosize=True,
+            height=700,
+            hovermode='closest',
+            margin=dict(l=170, r=85, t=75))
+    )
+
+    # Updating margin of the plot
+    fig_parallel_coordinates.update_layout(
+        plot_bgcolor=colors['background'],
+        paper_bgcolor=colors['background'],
+        title={
+            'text': "Parallel Coordinates",
+            'y': 0.99,
+            'x': 0.2,
+            'xanchor': 'center',
+            'yanchor': 'top'
+            },
+            title_font=dict(color=colors['figure_text']),
+            legend=dict(font=dict(color=colors['figure_text']))
+        )
+
+    fig_parallel_coordinates.update_traces(labelfont=dict(color= colors['figure_text']))  # Change the color here
+
+    return fig_parallel_coordinates
+
+
+def express_pie_chart(selection, dataset):
+    fig_pie_chart = px.pie(join_country_columns(selection['recent_tests'], dataset.country_table), values='total_tests', names='location', title='Pie Chart',
+                           color='location', color_discrete_map=dataset.color_dict, hover_data=['date'],
+                           labels={'location': location_label(dataset.region), 'date': 'Recent data available date',
+                                   'total_tests': 'Total tests'}, height=700)
+
+    fig_pie_chart.update_traces(textposition='inside', textinfo='percent+label',
+                                hovertemplate=pie_chart_hovertemplate(dataset.region),
+                                )
+
+    fig_pie_chart.update_layout(**dark_theme)
+
+    return fig_pie_chart
+
+
+def express_choropleth_map(selection, dataset):
+    fig_choropleth_map = px.choropleth(join_country_columns(selection['recent_death_rate'], dataset.country_table),
+                                       color='iso_code', locations='iso_code',
+                                       hover_name='location', hover_data=['date', 'covid19_death_rate', 'total_deaths', 'total_cases'],
+                                       labels={**CHOROPLETH_MAP_LABELS, 'location': location_label(dataset.region)},
+                                       scope=REGION_GEO_SCOPES.get(dataset.region, 'world'),
+                                       color_discrete_map=dataset.iso_code_color_dict)
+
+    fig_choropleth_map.update_geos(fitbounds="locations", lataxis_showgrid=True, lonaxis_showgrid=True)
+
+    fig_choropleth_map.update_layout(height=700, title=f'Choropleth map ({dataset.region})', **dark_theme)
+
+    return fig_choropleth_map
+
+
+#############################################################################################################
+# Lightweight figures: the layouts are validated once at import and the callbacks only fill in the trace
+# arrays as numpy arrays. The returned dicts are serialized by Dash without plotly validation.
+#############################################################################################################
+def layout_template(**layout):
+    return go.Layout(template=pio.templates[pio.templates.default], **layout).to_plotly_json()
+
+
+# Layouts of the four figures of a region, validated once per region.
+@functools.lru_cache(maxsize=None)
+def light_layouts(region):
+    return {
+        'line-graph': layout_template(
+            title='Line Graphs for Multivariate Data', height=700,
+            **{**dark_theme,
+               'xaxis': dict(anchor='y', domain=[0.0, 1.0], title=dict(text=LINE_GRAPH_LABELS['date'], font=dict(color=colors['figure_text']))),
+               'yaxis': dict(anchor='x', domain=[0.0, 1.0], title=dict(text=LINE_GRAPH_LABELS['stringency_index'], font=dict(color=colors['figure_text']))),
+               'legend': dict(title=dict(text=location_label(region)), tracegroupgap=0, font=dict(color=colors['figure_text']))}),
+
+        'parallel-coordinates': layout_template(
+            autosize=True, height=700, hovermode='closest', margin=dict(l=170, r=85, t=75),
+            plot_bgcolor=colors['background'], paper_bgcolor=colors['background'],
+            title=dict(text='Parallel Coordinates', y=0.99, x=0.2, xanchor='center', yanchor='top',
+                       font=dict(color=colors['figure_text'])),
+            legend=dict(font=dict(color=colors['figure_text']))),
+
+        'pie-chart': layout_template(
+            title='Pie Chart', height=700,
+            **{**dark_theme, 'legend': dict(tracegroupgap=0, font=dict(color=colors['figure_text']))}),
+
+        'choropleth-map': layout_template(
+            title=f'Choropleth map ({region})', height=700, margin=dict(t=60),
+            geo=dict(domain=dict(x=[0.0, 1.0], y=[0.0, 1.0]), scope=REGION_GEO_SCOPES.get(region, 'world'),
+                     fitbounds='locations', lataxis=dict(showgrid=True), lonaxis=dict(showgrid=True)),
+            **{**dark_theme, 'legend': dict(title=dict(text=CHOROPLETH_MAP_LABELS['iso_code']), tracegroupgap=0,
+                                            font=dict(color=colors['figure_text']))}),
+    }
+
+HSV_COLORSCALE = get_colorscale('HSV')
+
+# Figure shown while the data is loading.
+LOADING_FIGURE = {'data': [], 'layout': layout_template(
+    height=700, plot_bgcolor=colors['background'], paper_bgcolor=colors['background'],
+    xaxis=dict(visible=False), yaxis=dict(visible=False),
+    annotations=[dict(text='Loading data...', showarrow=False, xref='paper', yref='paper', x=0.5, y=0.5,
+                      font=dict(size=20, color=colors['figure_text']))])}
+
+# Hover text of a line of the metric, following 'European country=<country>'
+def line_graph_hovertemplate(metric=DEFAULT_METRIC):
+    return ('<br>' + LINE_GRAPH_LABELS['date'] + '=%{x}<br>' + METRICS[metric].label + '=%{y}<br>'
+            + '<br>'.join(f'{LINE_GRAPH_LABELS[column]}=%{{customdata[{i}]}}'
+                          for i, column in enumerate(['total_cases', 'total_deaths', 'new_cases', 'new_deaths']))
+            + '<extra></extra>')
+
+
+# Layout of the line graph of a region with the y-axis titled after the metric.
+@functools.lru_cache(maxsize=None)
+def line_graph_layout(region, metric=DEFAULT_METRIC):
+    layout = light_layouts(region)['line-graph']
+    yaxis = layout['yaxis']
+    return {**layout, 'yaxis': {**yaxis, 'title': {**yaxis['title'], 'text': METRICS[metric].label}}}
+
+CHOROPLETH_MAP_HOVERTEMPLATE = ('<b>%{hovertext}</b><br><br>' + CHOROPLETH_MAP_LABELS['iso_code'] + '=%{location}<br>'
+                                + '<br>'.join(f'{CHOROPLETH_MAP_LABELS[column]}=%{{customdata[{i}]}}'
+                                              for i, column in enumerate(['date', 'covid19_death_rate', 'total_deaths', 'total_cases']))
+                                + '<extra></extra>')
+
+
+def light_line_graph(selection, dataset, view=None):
+    data_frame, metric, view_layout = line_graph_view_rows(selection, view)
+    dates = data_frame['date'].to_numpy()
+    y = data_frame[metric].to_numpy()
+    hovertemplate = line_graph_hovertemplate(metric)
+    customdata = np.column_stack([data_frame[column].to_numpy()
+                                  for column in ['total_cases', 'total_deaths', 'new_cases', 'new_deaths']])
+
+    traces = [{
+        'type': 'scatter', 'mode': 'lines', 'name': country, 'legendgroup': country, 'showlegend': True,
+        'x': dates[start:stop], 'y': y[start:stop], 'customdata': customdata[start:stop],
+        'line': {'color': dataset.color_dict.get(country), 'dash': 'solid'},
+        'hovertemplate': location_label(dataset.region) + '=' + country + hovertemplate,
+        'xaxis': 'x', 'yaxis': 'y',
+    } for country, start, stop in country_row_slices(data_frame)]
+
+    layout = line_graph_layout(dataset.region, metric)
+    if view_layout:
+        layout = {**layout, **view_layout, 'title': {**layout['title'], **view_layout['title']}}
+    return {'data': traces, 'layout': layout}
+
+
+def light_parallel_coordinates_plot(selection, dataset):
+    countries_in_europe = dataset.countries
+    recent_deaths_data_frame = selection['recent_deaths']
+
+    # COVID-19 death rate and the static attributes, NA values filled with 0
+    total_deaths = recent_deaths_data_frame['total_deaths'].to_numpy()
+    total_cases = recent_deaths_data_frame['total_cases'].to_numpy()
+    with np.errstate(divide='ignore', invalid='ignore'):
+        covid19_death_rate = np.nan_to_num(total_deaths / total_cases * 100, nan=0.0, posinf=0.0, neginf=0.0)
+
+    # The country codes are the positions of the countries in the tick labels of the countries axis
+    num = recent_deaths_data_frame['country'].to_numpy()
+
+    dimensions = [dict(range=[0, len(countries_in_europe)],
+                       tickvals=list(range(len(countries_in_europe))), ticktext=countries_in_europe,
+                       label='countries', values=num)]
+    for column, label in [('hospital_beds_per_thousand', 'Hospitals beds per 1000'), ('median_age', 'Median Age'),
+                          ('population', 'Population'), ('life_expectancy', 'Life expectancy')]:
+        values = np.nan_to_num(recent_deaths_data_frame[column].to_numpy(), nan=0.0)
+        dimensions.append(dict(range=[0, float(values.max()) if len(values) else None], label=label, values=values))
+    dimensions.append(dict(range=[0, float(covid19_death_rate.max()) if len(covid19_death_rate) else None],
+                           label='COVID-19 Death rate', values=covid19_death_rate))
+
+    trace = {
+        'type': 'parcoords',
+        'line': {'color': num, 'colorscale': HSV_COLORSCALE, 'showscale': False,
+                 'cmin': 0, 'cmax': len(countries_in_europe)},
+        'dimensions': dimensions,
+        'labelfont': {'color': colors['figure_text']},
+    }
+    return {'data': [trace], 'layout': light_layouts(dataset.region)['parallel-coordinates']}
+
+
+def light_pie_chart(selection, dataset):
+    recent_tests_data_frame = selection['recent_tests']
+    codes = recent_tests_data_frame['country'].to_numpy()
+    countries = dataset.country_table['location'].to_numpy()[codes]
+    dates = np.datetime_as_string(recent_tests_data_frame['date'].to_numpy(), unit='D')
+
+    trace = {
+        'type': 'pie', 'name': '', 'legendgroup': '', 'showlegend': True,
+        'labels': countries, 'values': recent_tests_data_frame['total_tests'].to_numpy(),
+        'customdata': np.column_stack([dates, countries]),
+        'marker': {'colors': dataset.country_table['color'].to_numpy()[codes]},
+        'domain': {'x': [0.0, 1.0], 'y': [0.0, 1.0]},
+        'textposition': 'inside', 'textinfo': 'percent+label',
+        'hovertemplate': pie_chart_hovertemplate(dataset.region),
+    }
+    return {'data': [trace], 'layout': light_layouts(dataset.region)['pie-chart']}
+
+
+def light_choropleth_map(selection, dataset):
+    recent_death_rate_data_frame = selection['recent_death_rate']
+    dates = np.datetime_as_string(recent_death_rate_data_frame['date'].to_numpy(), unit='D')
+    customdata = np.column_stack([dates] + [recent_death_rate_data_frame[column].to_numpy().astype(object)
+                                            for column in ['covid19_death_rate', 'total_deaths', 'total_cases']])
+    countries = dataset.country_table.iloc[recent_death_rate_data_frame['country'].to_numpy()]
+
+    # One trace per country colored by its ISO code, like px.choropleth with a discrete color map
+    traces = [{
+        'type': 'choropleth', 'geo': 'geo', 'name': iso_code, 'showlegend': True, 'showscale': False,
+        'locations': [iso_code], 'z': [1], 'hovertext': [country], 'customdata': customdata[i:i + 1],
+        'colorscale': [[0.0, iso_color], [1.0, iso_color]],
+        'hovertemplate': CHOROPLETH_MAP_HOVERTEMPLATE,
+    } for i, (iso_code, country, iso_color) in enumerate(zip(countries['iso_code'], countries['location'],
+                                                              countries['iso_color']))]
+
+    return {'data': traces, 'layout': light_layouts(dataset.region)['choropleth-map']}
+
+
+#############################################################################################################
+# Choropleth map of the bundled country geometries (config.CHOROPLETH_MAP_MODE = 'geojson'). The base figure of a
+# region is sent once: a fixed projection, a grey layer of every country of the region and an empty layer of the
+# selected countries. Updates only replace the values of the second layer, see choropleth_map_values.
+#############################################################################################################
+DEATH_RATE_COLORSCALE = get_colorscale('Reds')
+
+
+@functools.lru_cache(maxsize=None)
+def geojson_choropleth_layout(region):
+    lon_range, lat_range = region_map_bounds(region)
+    return layout_template(
+        title=f'Choropleth map ({region})', height=700, margin=dict(t=60),
+        geo=dict(domain=dict(x=[0.0, 1.0], y=[0.0, 1.0]), visible=False, bgcolor=colors['background'],
+                 projection=dict(type='mercator'), lonaxis=dict(range=list(lon_range)),
+                 lataxis=dict(range=list(lat_range))),
+        **dark_theme)
+
+
+# Base figure of the map of a region. geojson is the URL of the bundled geometries, fetched once by the browser.
+@timed('figure')
+def geojson_choropleth_map(dataset, geojson):
+    iso_codes = mapped_iso_codes(dataset.iso_code_list)
+    border = {'line': {'color': colors['background'], 'width': 0.5}}
+    base_layer = {
+        'type': 'choropleth', 'geo': 'geo', 'geojson': geojson, 'locations': iso_codes, 'z': [0] * len(iso_codes),
+        'colorscale': [[0.0, '#4d4d4d'], [1.0, '#4d4d4d']], 'showscale': False, 'hoverinfo': 'skip', 'marker': border,
+    }
+    value_layer = {
+        'type': 'choropleth', 'geo': 'geo', 'geojson': geojson, 'locations': [], 'z': [], 'customdata': [],
+        'hovertext': [], 'zmin': 0, 'colorscale': DEATH_RATE_COLORSCALE, 'marker': border,
+        'colorbar': {'title': {'text': CHOROPLETH_MAP_LABELS['covid19_death_rate'], 'font': {'color': colors['figure_text']}},
+                     'tickfont': {'color': colors['figure_text']}},
+        'hovertemplate': CHOROPLETH_MAP_HOVERTEMPLATE,
+    }
+    return {'data': [base_layer, value_layer], 'layout': geojson_choropleth_layout(dataset.region)}
+
+
+# Values of the selected countries for the second layer of the base figure.
+@timed('figure')
+def choropleth_map_values(selection, dataset):
+    recent_death_rate_data_frame = selection['recent_death_rate']
+    countries = dataset.country_table.iloc[recent_death_rate_data_frame['country'].to_numpy()]
+    is_mapped = countries['iso_code'].isin(mapped_iso_codes(countries['iso_code'])).to_numpy()
+    recent_death_rate_data_frame, countries = recent_death_rate_data_frame.loc[is_mapped], countries.loc[is_mapped]
+    dates = np.datetime_as_string(recent_death_rate_data_frame['date'].to_numpy(), unit='D')
+    customdata = np.column_stack([dates] + [recent_death_rate_data_frame[column].to_numpy().astype(object)
+                                            for column in ['covid19_death_rate', 'total_deaths', 'total_cases']])
+    return {
+        'locations': countries['iso_code'].tolist(),
+        'z': recent_death_rate_data_frame['covid19_death_rate'].to_numpy(),
+        'customdata': customdata,
+        'hovertext': countries['location'].tolist(),
+    }
+
+
+# Layouts and hover templates of the light figures of the default region, for the figures built in the browser
+# by assets/clientside.js. The series carry the figure_overrides of their region and metric.
+def clientside_figure_templates():
+    return {
+        'layouts': light_layouts(config.DEFAULT_REGION),
+        'line_graph_location_label': location_label(config.DEFAULT_REGION),
+        'line_graph_hovertemplate': line_graph_hovertemplate(),
+        'pie_chart_hovertemplate': pie_chart_hovertemplate(config.DEFAULT_REGION),
+        'choropleth_map_hovertemplate': CHOROPLETH_MAP_HOVERTEMPLATE,
+        'parallel_coordinates_colorscale': HSV_COLORSCALE,
+        'figure_text': colors['figure_text'],
+        'loading': LOADING_FIGURE,
+    }
+
+
+# The parts of the templates that differ for a region and the metric of the line graph: legend and y-axis
+# title, choropleth scope and title, labels.
+def figure_overrides(region, metric=DEFAULT_METRIC):
+    layouts = light_layouts(region)
+    line_graph = line_graph_layout(region, metric)
+    return {
+        'layouts': {'line-graph': {'legend': line_graph['legend'], 'yaxis': line_graph['yaxis']},
+                    'choropleth-map': {'title': layouts['choropleth-map']['title'], 'geo': layouts['choropleth-map']['geo']}},
+        'line_graph_location_label': location_label(region),
+        'line_graph_hovertemplate': line_graph_hovertemplate(metric),
+        'pie_chart_hovertemplate': pie_chart_hovertemplate(region),
+    }
+
+
+FIGURE_BUILDERS = {
+    'express': {
+        'line-graph': express_line_graph,
+        'parallel-coordinates': express_parallel_coordinates_plot,
+        'pie-chart': express_pie_chart,
+        'choropleth-map': express_choropleth_map,
+    },
+    'light': {
+        'line-graph': light_line_graph,
+        'parallel-coordinates': light_parallel_coordinates_plot,
+        'pie-chart': light_pie_chart,
+        'choropleth-map': light_choropleth_map,
+    },
+}
+
+
+# Build the figure of the given graph id from a selection, mode is 'light' or 'express'.
+# The line graph takes the level of detail view as an option.
+@timed('figure')
+def build_figure(figure_id, selection, dataset, mode=None, **options):
+    return FIGURE_BUILDERS[mode or config.FIGURE_MODE][figure_id](selection, dataset, **options)
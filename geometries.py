@@ -0,0 +1,36 @@
+import functools
+import json
+
+import config
+
+# Longitude and latitude ranges of the map of a region, a fixed projection instead of fitting the bounds of the
+# selected countries on every update. Regions without an entry show the whole world.
+REGION_MAP_BOUNDS = {
+    'Europe': ((-25.0, 45.0), (34.0, 72.0)),
+    'Asia': ((25.0, 150.0), (-12.0, 60.0)),
+    'Africa': ((-20.0, 55.0), (-36.0, 38.0)),
+    'North America': ((-170.0, -50.0), (5.0, 75.0)),
+    'South America': ((-85.0, -33.0), (-57.0, 14.0)),
+    'Oceania': ((110.0, 180.0), (-50.0, 0.0)),
+}
+
+
+# Country geometries of the bundled GeoJSON by OWID iso code (the feature id), read once per process. The browser
+# loads the same file once from GET /geometries/countries.geojson and keeps it in its cache.
+# Natural Earth 1:110m countries with coordinates rounded to 0.01 degrees, exterior rings clockwise as
+# expected by plotly. Microstates (Andorra, Monaco, ...) are too small for this scale and have no geometry.
+@functools.lru_cache(maxsize=None)
+def load_country_geometries(path=None):
+    with open(path or config.COUNTRY_GEOMETRIES_PATH) as geometries_file:
+        feature_collection = json.load(geometries_file)
+    return {feature['id']: feature for feature in feature_collection['features']}
+
+
+# Iso codes with a geometry, in the given order.
+def mapped_iso_codes(iso_codes):
+    geometries = load_country_geometries()
+    return [iso_code for iso_code in iso_codes if iso_code in geometries]
+
+
+def region_map_bounds(region):
+    return REGION_MAP_BOUNDS.get(region, ((-180.0, 180.0), (-60.0, 85.0)))
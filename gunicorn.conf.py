@@ -0,0 +1,33 @@
+#############################################################################################################
+# gunicorn settings of the dashboard with the data shared between the workers:
+#
+#   gunicorn -c gunicorn.conf.py
+#
+# The master process loads the data of every region once and publishes it to shared memory (see
+# shared_dataset.py), the workers attach to it read-only instead of loading their own copy.
+#############################################################################################################
+import multiprocessing
+import os
+
+os.environ.setdefault('COVID19_SHARED_DATASET', '1')
+
+wsgi_app = 'COVID-19:server'
+bind = os.environ.get('COVID19_BIND', '0.0.0.0:8050')
+workers = int(os.environ.get('COVID19_WORKERS', min(multiprocessing.cpu_count(), 4)))
+threads = int(os.environ.get('COVID19_THREADS', 4))
+timeout = 120
+
+publisher = None
+
+
+# Publish the data before the first worker starts.
+def when_ready(server):
+    global publisher
+    from shared_dataset import SharedDatasetPublisher
+    publisher = SharedDatasetPublisher()
+    publisher.start()
+
+
+def on_exit(server):
+    if publisher is not None:
+        publisher.stop()
@@ -0,0 +1,159 @@
+import gzip
+import hashlib
+import os
+
+import dash
+from flask import Response, g, request
+
+import config
+from server_cache import MemoryCache
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Endpoints of Dash whose responses depend on the data, the code and the settings of the app only: the layout and
+# the callback graph of a page load. The callbacks are left out, browsers never send If-None-Match with a POST.
+CONDITIONAL_ENDPOINTS = ('_dash-layout', '_dash-dependencies')
+
+# Content types worth compressing. The woff and woff2 fonts are compressed already.
+COMPRESSIBLE_TYPES = {'application/json', 'application/javascript', 'image/svg+xml', 'font/ttf',
+                      'application/x-font-ttf', 'application/vnd.ms-fontobject'}
+
+# Compression levels of the dynamic responses, compressed on every request, and of the static files, compressed
+# once per worker process and then served from static_cache.
+DYNAMIC_LEVELS = {'br': 4, 'gzip': 6}
+STATIC_LEVELS = {'br': 9, 'gzip': 9}
+
+# Compressed static files (plotly.js, the Dash components, assets/) of this worker process.
+STATIC_CACHE_MAX_BYTES = 64 * 1024 ** 2
+static_cache = MemoryCache(config.STATIC_MAX_AGE, STATIC_CACHE_MAX_BYTES)
+
+
+# Fingerprint of the code and the settings of the app, part of every ETag, so that the responses of a previous
+# deployment or of other settings are not confirmed with 304. Identical in every worker process and host.
+# settings names the config values to include, default every COVID19_ environment variable.
+def code_version(settings=None):
+    digest = hashlib.sha1(dash.__version__.encode())
+    for name in sorted(os.listdir(config.BASE_DIR)):
+        if name.endswith('.py'):
+            with open(os.path.join(config.BASE_DIR, name), 'rb') as source_file:
+                digest.update(source_file.read())
+    if settings is None:
+        values = {name: value for name, value in os.environ.items() if name.startswith('COVID19_')}
+    else:
+        values = {name: getattr(config, name) for name in settings}
+    for name, value in sorted(values.items()):
+        digest.update(f'{name}={value}'.encode())
+    return digest.hexdigest()[:16]
+
+
+CODE_VERSION = code_version()
+
+
+def is_conditional_request():
+    return request.method == 'GET' and request.path.endswith(CONDITIONAL_ENDPOINTS)
+
+
+# Files of assets/ and of the Dash component packages.
+def is_static_request():
+    return request.endpoint is not None and (request.endpoint.endswith('.static') or
+                                             '_dash-component-suites/' in request.path)
+
+
+# ETag of the response to the current request: the code, the data versions of the loaded regions and the URL.
+# Weak, as the same content is sent with different encodings.
+def request_etag(data_version):
+    return hashlib.sha1(f'{CODE_VERSION}|{data_version()}|{request.full_path}'.encode()).hexdigest()
+
+
+# Answer 304 without building the response when the client already holds the response of the same data. The ETag
+# is computed before the response is built: a refresh meanwhile changes the version, and the next request gets a
+# full response again.
+def check_etag(data_version):
+    if not is_conditional_request():
+        return None
+    etag = g.response_etag = request_etag(data_version)
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+        response.set_etag(etag, weak=True)
+        response.cache_control.no_cache = True
+        return response
+    return None
+
+
+def set_cache_headers(response):
+    etag = g.pop('response_etag', None)
+    if etag is not None and response.status_code == 200:
+        # The client stores the response and asks again with If-None-Match
+        response.set_etag(etag, weak=True)
+        response.cache_control.no_cache = True
+    elif is_static_request() and response.status_code in (200, 304) and (request.args.get('m') or
+                                                                         request.args.get('v')):
+        # Dash appends the modification time to the files of assets/ (?m=), the fonts of font-awesome carry
+        # their version (?v=): a changed file has a new URL and the browser can keep this one.
+        response.cache_control.no_cache = None
+        response.cache_control.public = True
+        response.cache_control.max_age = config.STATIC_MAX_AGE
+        response.cache_control.immutable = True
+    return response
+
+
+def is_compressible(response):
+    return response.mimetype.startswith('text/') or response.mimetype in COMPRESSIBLE_TYPES
+
+
+# Encoding of the response accepted by the client, brotli preferred when it is installed.
+def accepted_encoding():
+    if brotli is not None and request.accept_encodings['br']:
+        return 'br'
+    if request.accept_encodings['gzip']:
+        return 'gzip'
+    return None
+
+
+def compress_data(data, encoding, levels):
+    if encoding == 'br':
+        return brotli.compress(data, quality=levels['br'])
+    return gzip.compress(data, compresslevel=levels['gzip'], mtime=0)
+
+
+# Compress the body of a response from COMPRESSION_MIN_BYTES on. Streamed responses and files, e.g. the exports,
+# are sent as they are, the static files sent with send_file (assets/) are read and compressed once.
+def compress_response(response):
+    if (response.status_code != 200 or 'Content-Encoding' in response.headers or not is_compressible(response)
+            or (response.is_streamed and not (response.direct_passthrough and is_static_request()))):
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = accepted_encoding()
+    size = response.content_length if response.direct_passthrough else response.calculate_content_length()
+    if encoding is None or size is None or size < config.COMPRESSION_MIN_BYTES:
+        return response
+
+    response.direct_passthrough = False
+    etag, weak = response.get_etag()
+    if is_static_request():
+        key = f'{encoding}:{request.path}:{etag}'
+        data = static_cache.get(key)
+        if data is None:
+            data = compress_data(response.get_data(), encoding, STATIC_LEVELS)
+            static_cache.set(key, data)
+        else:
+            response.close()
+    else:
+        data = compress_data(response.get_data(), encoding, DYNAMIC_LEVELS)
+    response.set_data(data)
+    response.headers['Content-Encoding'] = encoding
+    if etag is not None and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+
+# Hook the ETags, the cache headers and the compression into the Flask server of the Dash app.
+# data_version() returns the current version of the data, e.g. RegionRegistry.version.
+def configure_responses(server, data_version):
+    server.before_request(lambda: check_etag(data_version))
+    if config.COMPRESSION:
+        server.after_request(compress_response)
+    server.after_request(set_cache_headers)
@@ -0,0 +1,335 @@
+import contextvars
+import cProfile
+import functools
+import json
+import logging
+import os
+import threading
+import time
+
+from flask import Response, g, request
+
+import config
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds of the histogram buckets: seconds of the callback phases, bytes of the response payload and the
+# number of countries and days of the selection.
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+PAYLOAD_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+COUNTRY_BUCKETS = (1, 2, 4, 8, 16, 32, 64)
+DAY_BUCKETS = (7, 30, 90, 180, 365, 730, 1460)
+
+# Path of the Dash endpoint running the server callbacks.
+CALLBACK_ENDPOINT = '_dash-update-component'
+
+# Trace of the callback request handled by the current thread, None outside of callback requests.
+_current_trace = contextvars.ContextVar('callback_trace', default=None)
+
+
+#############################################################################################################
+# Cumulative histogram in the Prometheus exposition format.
+#############################################################################################################
+class Histogram:
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+        self.count += 1
+        self.sum += value
+
+    def samples(self, name, labels):
+        for bound, count in zip(self.buckets, self.counts):
+            yield f'{name}_bucket', dict(labels, le=f'{bound:g}'), count
+        yield f'{name}_bucket', dict(labels, le='+Inf'), self.count
+        yield f'{name}_sum', labels, self.sum
+        yield f'{name}_count', labels, self.count
+
+
+#############################################################################################################
+# Counters and histograms of the callbacks of this worker process, rendered as Prometheus text by GET /metrics.
+# Every worker process keeps its own numbers, the scraper sums them up per instance.
+#############################################################################################################
+class MetricsRegistry:
+
+    def __init__(self):
+        self._metrics = {}  # name -> (type, help, buckets, {labels: Histogram or count})
+        self._lock = threading.Lock()
+
+    def histogram(self, name, help_text, buckets):
+        self._metrics.setdefault(name, ('histogram', help_text, buckets, {}))
+
+    def counter(self, name, help_text):
+        self._metrics.setdefault(name, ('counter', help_text, None, {}))
+
+    def observe(self, name, value, **labels):
+        _, _, buckets, series = self._metrics[name]
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    def increment(self, name, value=1, **labels):
+        series = self._metrics[name][3]
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series[key] = series.get(key, 0) + value
+
+    def render(self):
+        lines = []
+        with self._lock:
+            for name, (metric_type, help_text, _, series) in self._metrics.items():
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} {metric_type}')
+                for key, value in series.items():
+                    samples = value.samples(name, dict(key)) if metric_type == 'histogram' else [(name, dict(key), value)]
+                    for sample_name, labels, sample in samples:
+                        lines.append(f'{sample_name}{format_labels(labels)} {sample:g}')
+        return '\n'.join(lines) + '\n'
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for value in labels.values())
+    return '{' + ','.join(f'{name}="{value}"' for name, value in zip(labels, escaped)) + '}'
+
+
+registry = MetricsRegistry()
+registry.counter('covid19_callback_requests_total', 'Callback requests by callback and HTTP status.')
+registry.histogram('covid19_callback_duration_seconds', 'Duration of the callback requests.', LATENCY_BUCKETS)
+registry.histogram('covid19_callback_phase_duration_seconds',
+                   'Duration of the phases of the callback requests: parse (request body), callback (the whole '
+                   'callback function), selection, downsample, figure and series within it, and serialize (response).', LATENCY_BUCKETS)
+registry.histogram('covid19_callback_payload_bytes', 'Size of the serialized callback responses, before compression.',
+                   PAYLOAD_BUCKETS)
+registry.histogram('covid19_callback_response_bytes', 'Size of the callback responses as sent, after compression.',
+                   PAYLOAD_BUCKETS)
+registry.histogram('covid19_callback_selection_countries', 'Countries of the selection of a callback.', COUNTRY_BUCKETS)
+registry.histogram('covid19_callback_selection_days', 'Days of the selection of a callback.', DAY_BUCKETS)
+
+
+#############################################################################################################
+# Timings of one callback request: the phases measured by timed() and the callback function, and the
+# cardinality of the selection set with annotate().
+#############################################################################################################
+class CallbackTrace:
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.callback = None
+        self.callback_started = None
+        self.callback_ended = None
+        self.phases = {}
+        self.annotations = {}
+        # Size of the serialized response before compression, see measure_payload
+        self.payload_bytes = None
+        # Phases of the combined figure callback are measured in several threads, see figure_pool.py
+        self._lock = threading.Lock()
+
+    def add_phase(self, phase, seconds):
+        with self._lock:
+            self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+
+# Measure the calls of a function as a phase of the callback request, e.g. 'selection' or 'figure'.
+# Calls outside of a callback request, e.g. from the benchmarks, are not measured.
+def timed(phase):
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            trace = _current_trace.get()
+            if trace is None:
+                return function(*args, **kwargs)
+            started = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                trace.add_phase(phase, time.perf_counter() - started)
+        return wrapper
+    return decorator
+
+
+# Record values of the current callback request, e.g. the number of countries and days of the selection.
+def annotate(**values):
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.annotations.update((name, value) for name, value in values.items() if value is not None)
+
+
+# Name the callback request after the function and measure it, placed below @app.callback.
+# cardinality(*args) may return the countries and days of the selection from the callback arguments.
+def instrumented_callback(cardinality=None):
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            trace = _current_trace.get()
+            if trace is None:
+                return function(*args, **kwargs)
+            trace.callback = function.__name__
+            if cardinality is not None:
+                annotate(**(cardinality(*args, **kwargs) or {}))
+            trace.callback_started = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                trace.callback_ended = time.perf_counter()
+        return wrapper
+    return decorator
+
+
+def is_callback_request():
+    return request.path.endswith(CALLBACK_ENDPOINT)
+
+
+# Size of the body of a response, None for streamed responses of unknown length.
+def response_size(response):
+    size = response.calculate_content_length()
+    if size is None and not response.is_streamed:
+        size = len(response.get_data())
+    return size
+
+
+def start_trace():
+    if config.INSTRUMENTATION and is_callback_request():
+        g.callback_trace_token = _current_trace.set(CallbackTrace())
+
+
+# Record the size of the serialized callback response before it is compressed.
+def measure_payload(response):
+    trace = _current_trace.get()
+    if trace is not None and 'callback_trace_token' in g:
+        trace.payload_bytes = response_size(response)
+    return response
+
+
+# Record the trace of a callback request once the response is serialized and compressed.
+def finish_trace(response):
+    token = g.pop('callback_trace_token', None)
+    if token is None:
+        return response
+    trace = _current_trace.get()
+    _current_trace.reset(token)
+    ended = time.perf_counter()
+
+    callback = trace.callback or request_output()
+    if trace.callback_started is not None:
+        trace.add_phase('parse', trace.callback_started - trace.started)
+        trace.add_phase('callback', trace.callback_ended - trace.callback_started)
+        trace.add_phase('serialize', ended - trace.callback_ended)
+    response_bytes = response_size(response)
+    # Without measure_payload, e.g. without compression, the response is sent as serialized
+    payload_bytes = trace.payload_bytes if trace.payload_bytes is not None else response_bytes
+    duration = ended - trace.started
+
+    registry.increment('covid19_callback_requests_total', callback=callback, status=response.status_code)
+    registry.observe('covid19_callback_duration_seconds', duration, callback=callback)
+    for phase, seconds in trace.phases.items():
+        registry.observe('covid19_callback_phase_duration_seconds', seconds, callback=callback, phase=phase)
+    if payload_bytes is not None:
+        registry.observe('covid19_callback_payload_bytes', payload_bytes, callback=callback)
+    if response_bytes is not None:
+        registry.observe('covid19_callback_response_bytes', response_bytes, callback=callback)
+    if 'countries' in trace.annotations:
+        registry.observe('covid19_callback_selection_countries', trace.annotations['countries'], callback=callback)
+    if 'days' in trace.annotations:
+        registry.observe('covid19_callback_selection_days', trace.annotations['days'], callback=callback)
+
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(json.dumps(dict({
+            'event': 'callback',
+            'callback': callback,
+            'status': response.status_code,
+            'duration_ms': round(duration * 1000, 3),
+            'phases_ms': {phase: round(seconds * 1000, 3) for phase, seconds in trace.phases.items()},
+            'payload_bytes': payload_bytes,
+            'response_bytes': response_bytes,
+        }, **trace.annotations)))
+    return response
+
+
+# Drop the trace of a request that failed before its response was built.
+def discard_trace(error=None):
+    token = g.pop('callback_trace_token', None)
+    if token is not None:
+        _current_trace.reset(token)
+
+
+# Output of the callback named in the request body, for callbacks without instrumented_callback.
+def request_output():
+    body = request.get_json(silent=True) or {}
+    return str(body.get('output', 'unknown'))
+
+
+#############################################################################################################
+# Profiler of a single request, switched on with the header 'X-Profile: 1' or the query flag '?profile=1'
+# when config.PROFILING is set. pyinstrument (sampling, HTML report) is used when installed, else cProfile
+# (pstats file). The report is written to config.PROFILE_DIR, its name is returned in the X-Profile-File header.
+#############################################################################################################
+def profiling_requested():
+    return request.headers.get('X-Profile') == '1' or request.args.get('profile') == '1'
+
+
+def start_profiler():
+    if not (config.PROFILING and profiling_requested()):
+        return
+    try:
+        from pyinstrument import Profiler
+        profiler = Profiler()
+    except ImportError:
+        profiler = cProfile.Profile()
+    g.profiler = profiler
+    g.profiler_started = time.time()
+    if isinstance(profiler, cProfile.Profile):
+        profiler.enable()
+    else:
+        profiler.start()
+
+
+def stop_profiler(response):
+    profiler = g.pop('profiler', None)
+    if profiler is None:
+        return response
+    name = request.path.strip('/').replace('/', '_') or 'index'
+    os.makedirs(config.PROFILE_DIR, exist_ok=True)
+    if isinstance(profiler, cProfile.Profile):
+        profiler.disable()
+        path = os.path.join(config.PROFILE_DIR, f'{g.profiler_started:.6f}-{name}.prof')
+        profiler.dump_stats(path)
+    else:
+        profiler.stop()
+        path = os.path.join(config.PROFILE_DIR, f'{g.profiler_started:.6f}-{name}.html')
+        with open(path, 'w') as file:
+            file.write(profiler.output_html())
+    logger.info(json.dumps({'event': 'profile', 'path': request.path, 'report': path}))
+    response.headers['X-Profile-File'] = os.path.basename(path)
+    return response
+
+
+# Hook the timings and the profiler into the Flask server of the Dash app and serve GET /metrics.
+def instrument_server(server):
+    server.before_request(start_profiler)
+    server.before_request(start_trace)
+    # after_request functions run in reverse order: the trace is finished before the profiler is stopped
+    server.after_request(stop_profiler)
+    server.after_request(finish_trace)
+    server.teardown_request(discard_trace)
+
+    @server.route('/metrics')
+    def metrics():
+        return Response(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+# Measure the callback responses before they are compressed. after_request functions run in reverse order: call it
+# after the compression is hooked into the server, see http_responses.configure_responses.
+def instrument_payload(server):
+    server.after_request(measure_payload)
@@ -0,0 +1,72 @@
+import numpy as np
+import pandas as pd
+
+# Header numbers: cumulative columns are summed over the most recent value of every country,
+# daily columns are summed over the countries reporting on the day.
+CUMULATIVE_KPI_COLUMNS = ['total_cases', 'total_deaths']
+DAILY_KPI_COLUMNS = ['new_cases', 'new_deaths']
+
+
+def to_day(date):
+    return pd.Timestamp(date).to_datetime64().astype('datetime64[D]')
+
+
+#############################################################################################################
+# Header numbers of every date from first_day to the last date of the data, one entry per day.
+# The numbers of any date are an index lookup, so the header can follow the selected end date.
+#############################################################################################################
+class KpiSeries:
+
+    def __init__(self, first_day, values):
+        self.first_day = first_day
+        self.values = values  # column -> float64 array
+        self.day_count = len(values[CUMULATIVE_KPI_COLUMNS[0]])
+
+    # Numbers of a date, the last date when it is None. Dates outside the series are clipped to it.
+    def at(self, date=None):
+        index = self.day_count - 1 if date is None else int((to_day(date) - self.first_day).astype(np.int64))
+        index = min(max(index, 0), self.day_count - 1)
+        return {column: float(values[index]) for column, values in self.values.items()}
+
+    # Series of a dataset made of these days and new rows dated on or after since.
+    # The days before since are kept, only the following days are computed again.
+    def extend(self, dataset, since):
+        if to_day(dataset.first_date) < self.first_day:
+            return compute_kpi_series(dataset)
+        since = min(max(to_day(since), self.first_day), self.first_day + self.day_count)
+        kept = int((since - self.first_day).astype(np.int64))
+        following = compute_kpi_series(dataset, since)
+        return KpiSeries(self.first_day, {column: np.concatenate((values[:kept], following.values[column]))
+                                          for column, values in self.values.items()})
+
+
+# Header numbers of the dataset from start_date (default the first date) on, in one pass over the rows.
+def compute_kpi_series(dataset, start_date=None):
+    data_frame = dataset.data_frame
+    first_day = to_day(dataset.first_date if start_date is None else start_date)
+    day_count = int((to_day(dataset.last_date) - first_day).astype(np.int64)) + 1
+
+    days = (dataset.store.dates.astype('datetime64[D]') - first_day).astype(np.int64)
+    rows = days >= 0
+    day_index = days[rows]
+    countries = data_frame['location'].cat.categories
+    country_index = data_frame['location'].cat.codes.to_numpy()[rows]
+
+    values = {}
+    for column in DAILY_KPI_COLUMNS:
+        daily = np.nan_to_num(data_frame[column].to_numpy(dtype=np.float64)[rows])
+        values[column] = np.bincount(day_index, weights=daily, minlength=day_count)
+
+    # Countries keep their value from before start_date until they report a new one.
+    carried = None
+    if start_date is not None:
+        carried = dataset.store.latest(dataset.countries, None, first_day - 1, CUMULATIVE_KPI_COLUMNS)
+    for column in CUMULATIVE_KPI_COLUMNS:
+        # day x country matrix of the reported values, the first row holds the carried values
+        matrix = np.full((day_count + 1, len(countries)), np.nan)
+        if carried is not None:
+            matrix[0, carried['country'].to_numpy()] = carried[column].to_numpy()
+        matrix[day_index + 1, country_index] = data_frame[column].to_numpy(dtype=np.float64)[rows]
+        values[column] = np.nansum(pd.DataFrame(matrix).ffill().to_numpy()[1:], axis=1)
+
+    return KpiSeries(first_day, values)
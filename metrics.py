@@ -0,0 +1,170 @@
+import collections
+
+import numpy as np
+
+#############################################################################################################
+# Registry of the metrics of the line graph. Raw columns of the data set have no compute function, derived
+# metrics are computed once per dataset version over the data frame sorted by (location, date) and stored as
+# extra columns of the columnar snapshot.
+# compute(values, starts) receives the float64 columns and the derived metrics registered before it, and
+# the first row of the country of every row. lookback is the number of earlier rows of the same country a
+# value depends on, weekly the aggregation of the weekly line graph ('mean', 'sum' or 'last').
+# The OWID data has one row per country and day, so shifting by rows shifts by days.
+#############################################################################################################
+Metric = collections.namedtuple('Metric', ['label', 'lookback', 'weekly', 'compute'])
+
+# Days of the rolling averages and the growth rate, and the delay of deaths behind cases of the lagged fatality rate.
+ROLLING_WINDOW = 7
+FATALITY_LAG = 14
+
+# Columns of the OWID data set read by the compute functions. NaN counts as 0 like in prepare_data_frame.
+INPUT_COLUMNS = ['new_cases', 'new_deaths', 'total_cases', 'total_deaths', 'population']
+ZERO_FILLED_COLUMNS = ['new_cases', 'new_deaths', 'total_cases', 'total_deaths']
+
+
+# First row of the country of every row of a data frame sorted by location.
+def group_starts(codes):
+    is_start = np.ones(len(codes), dtype=bool)
+    is_start[1:] = codes[1:] != codes[:-1]
+    return np.maximum.accumulate(np.where(is_start, np.arange(len(codes)), 0))
+
+
+# Values of the row periods rows earlier within the same country, NaN for the first rows of a country.
+def grouped_shift(values, starts, periods):
+    shifted = np.full(len(values), np.nan)
+    if periods < len(values):
+        shifted[periods:] = values[:len(values) - periods]
+    shifted[np.arange(len(values)) - periods < starts] = np.nan
+    return shifted
+
+
+# Mean of the valid values of the last window rows of the same country.
+# The rows are added in a fixed order, so a value does not depend on the rows computed with it.
+def grouped_rolling_mean(values, starts, window):
+    sums = np.zeros(len(values))
+    counts = np.zeros(len(values))
+    for periods in range(window):
+        shifted = grouped_shift(values, starts, periods)
+        valid = ~np.isnan(shifted)
+        sums += np.where(valid, shifted, 0.0)
+        counts += valid
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(counts > 0, sums / counts, np.nan)
+
+
+# Ratio in percent, NaN where the denominator is not positive.
+def percent(numerator, denominator):
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(denominator > 0, numerator / denominator * 100, np.nan)
+
+
+def per_million(values, population):
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(population > 0, values / population * 1e6, np.nan)
+
+
+def new_cases_smoothed(values, starts):
+    return grouped_rolling_mean(values['new_cases'], starts, ROLLING_WINDOW)
+
+
+def new_deaths_smoothed(values, starts):
+    return grouped_rolling_mean(values['new_deaths'], starts, ROLLING_WINDOW)
+
+
+def total_cases_per_million(values, starts):
+    return per_million(values['total_cases'], values['population'])
+
+
+def total_deaths_per_million(values, starts):
+    return per_million(values['total_deaths'], values['population'])
+
+
+def new_cases_smoothed_per_million(values, starts):
+    return per_million(values['new_cases_smoothed'], values['population'])
+
+
+# Change of the 7-day average of new cases against the week before, in percent.
+def new_cases_growth_rate(values, starts):
+    previous_week = grouped_shift(values['new_cases_smoothed'], starts, ROLLING_WINDOW)
+    return percent(values['new_cases_smoothed'], previous_week) - 100
+
+
+def covid19_death_rate(values, starts):
+    return percent(values['total_deaths'], values['total_cases'])
+
+
+# Deaths over the cases confirmed FATALITY_LAG days earlier, the share of the cases that had time to resolve.
+def lagged_case_fatality_rate(values, starts):
+    return percent(values['total_deaths'], grouped_shift(values['total_cases'], starts, FATALITY_LAG))
+
+
+METRICS = {
+    'stringency_index': Metric('Government stringency index (0-100)', 0, 'mean', None),
+    'new_cases': Metric('New confirmed cases', 0, 'sum', None),
+    'new_deaths': Metric('New deaths', 0, 'sum', None),
+    'total_cases': Metric('Total confirmed cases', 0, 'last', None),
+    'total_deaths': Metric('Total deaths', 0, 'last', None),
+    'new_cases_smoothed': Metric('New confirmed cases (7-day average)', ROLLING_WINDOW - 1, 'mean', new_cases_smoothed),
+    'new_deaths_smoothed': Metric('New deaths (7-day average)', ROLLING_WINDOW - 1, 'mean', new_deaths_smoothed),
+    'total_cases_per_million': Metric('Total confirmed cases per million', 0, 'last', total_cases_per_million),
+    'total_deaths_per_million': Metric('Total deaths per million', 0, 'last', total_deaths_per_million),
+    'new_cases_smoothed_per_million': Metric('New confirmed cases per million (7-day average)', ROLLING_WINDOW - 1,
+                                             'mean', new_cases_smoothed_per_million),
+    'new_cases_growth_rate': Metric('Weekly growth of new cases (%)', 2 * ROLLING_WINDOW - 1, 'mean', new_cases_growth_rate),
+    'covid19_death_rate': Metric('COVID-19 Death rate(%)', 0, 'last', covid19_death_rate),
+    'lagged_case_fatality_rate': Metric(f'Case fatality rate, deaths over cases {FATALITY_LAG} days earlier (%)',
+                                        FATALITY_LAG, 'last', lagged_case_fatality_rate),
+}
+
+DEFAULT_METRIC = 'stringency_index'
+
+# Metrics stored as extra columns of the data frame.
+DERIVED_METRIC_COLUMNS = [name for name, metric in METRICS.items() if metric.compute is not None]
+MAX_LOOKBACK = max(metric.lookback for metric in METRICS.values())
+
+
+def has_metrics(data_frame):
+    return all(column in data_frame for column in DERIVED_METRIC_COLUMNS)
+
+
+# Derived metrics of every row of a data frame sorted by (location, date), as float32 arrays.
+def compute_metrics(data_frame):
+    starts = group_starts(data_frame['location'].cat.codes.to_numpy())
+    values = {column: data_frame[column].to_numpy(dtype=np.float64) for column in INPUT_COLUMNS}
+    for column in ZERO_FILLED_COLUMNS:
+        values[column] = np.nan_to_num(values[column])
+
+    for name in DERIVED_METRIC_COLUMNS:
+        values[name] = METRICS[name].compute(values, starts)
+    return {name: values[name].astype(np.float32) for name in DERIVED_METRIC_COLUMNS}
+
+
+def add_metrics(data_frame):
+    return data_frame.assign(**compute_metrics(data_frame))
+
+
+# Data frame sorted by (location, date) with the derived metrics computed again from the first row in the mask
+# of every country on, e.g. for newly appended days. Only these rows and the MAX_LOOKBACK rows before them are read.
+def extend_metrics(data_frame, rows):
+    codes = data_frame['location'].cat.codes.to_numpy()
+    starts = group_starts(codes)
+    row_index = np.flatnonzero(rows)
+    if not len(row_index):
+        return data_frame if has_metrics(data_frame) else add_metrics(data_frame)
+
+    # Rows from the lookback before the first computed row of each country to the end of the country
+    first_rows = np.sort(row_index[np.unique(codes[row_index], return_index=True)[1]])
+    stops = np.append(np.flatnonzero(codes[1:] != codes[:-1]) + 1, len(codes))
+    ranges = [(row, max(starts[row], row - MAX_LOOKBACK), stops[np.searchsorted(stops, row, 'right')])
+              for row in first_rows.tolist()]
+    context = np.concatenate([np.arange(start, stop) for row, start, stop in ranges])
+    computed = np.concatenate([np.arange(start, stop) >= row for row, start, stop in ranges])
+
+    metrics = compute_metrics(data_frame.iloc[context])
+    data_frame = data_frame.copy(deep=False)
+    for name, values in metrics.items():
+        column = data_frame[name].to_numpy(dtype=np.float32, copy=True) if name in data_frame \
+            else np.full(len(data_frame), np.nan, dtype=np.float32)
+        column[context[computed]] = values[computed]
+        data_frame[name] = column
+    return data_frame
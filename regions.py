@@ -0,0 +1,116 @@
+import collections
+import logging
+import threading
+import time
+
+import config
+from data_refresh import DatasetRefresher
+
+if config.SHARED_DATASET:
+    # Workers of gunicorn attach to the data published by its master process (fcntl is not available on Windows).
+    from shared_dataset import SharedDatasetRefresher as DatasetRefresher
+
+logger = logging.getLogger(__name__)
+
+# Seconds a callback waits for the data of a region that is still loading.
+LOAD_TIMEOUT = 120
+
+
+#############################################################################################################
+# Datasets of the regions (continents) requested from this worker, each loaded from its partition of the
+# columnar snapshot on first use and kept up to date by its own DatasetRefresher.
+# Regions idle for longer than the idle timeout are dropped, and the least recently used ones while the
+# loaded data exceeds the memory budget. The default region stays loaded.
+#############################################################################################################
+class RegionRegistry:
+
+    def __init__(self, regions=None, default_region=None, lazy=False, idle_timeout=None, memory_budget=None):
+        self.regions = list(config.REGIONS if regions is None else regions)
+        self.default_region = config.DEFAULT_REGION if default_region is None else default_region
+        self.idle_timeout = config.REGION_IDLE_TIMEOUT if idle_timeout is None else idle_timeout
+        self.memory_budget = config.REGION_MEMORY_BUDGET if memory_budget is None else memory_budget
+        if self.default_region not in self.regions:
+            self.regions.insert(0, self.default_region)
+
+        self._refreshers = collections.OrderedDict()  # region -> DatasetRefresher, least recently used first
+        self._last_used = {}
+        self._listeners = []
+        self._lock = threading.Lock()
+
+        self._refreshers[self.default_region] = DatasetRefresher(self.default_region, lazy=lazy)
+        self._last_used[self.default_region] = time.monotonic()
+
+    # Call listener(dataset) after every swap of the dataset of a region.
+    def add_listener(self, listener):
+        self._listeners.append(listener)
+        for refresher in list(self._refreshers.values()):
+            refresher.add_listener(listener)
+
+    def start(self):
+        self._refreshers[self.default_region].start()
+
+    # The refresher of a region, created and started on first use. Unknown regions fall back to the default.
+    def refresher(self, region=None):
+        region = region if region in self.regions else self.default_region
+        with self._lock:
+            refresher = self._refreshers.get(region)
+            if refresher is None:
+                logger.info('Loading the %s data.', region)
+                refresher = DatasetRefresher(region, lazy=True)
+                for listener in self._listeners:
+                    refresher.add_listener(listener)
+                refresher.start()
+                self._refreshers[region] = refresher
+            self._refreshers.move_to_end(region)
+            self._last_used[region] = time.monotonic()
+        self.evict()
+        return refresher
+
+    # The dataset of a region, None while it is loading. With wait=True the call blocks until it is loaded.
+    def current(self, region=None, wait=False):
+        refresher = self.refresher(region)
+        if wait:
+            refresher.wait_ready(LOAD_TIMEOUT)
+        return refresher.current()
+
+    def is_ready(self, region=None):
+        return self._refreshers[region or self.default_region].is_ready()
+
+    # Versions of the loaded regions as one string, which changes with every refresh, load and drop of a region.
+    # Regions still loading are included, the responses of a callback differ once their data is ready.
+    def version(self):
+        return ','.join(f'{region}:{refresher.current().version if refresher.is_ready() else "loading"}'
+                        for region, refresher in sorted(list(self._refreshers.items())))
+
+    # Regions with loaded data and their size in bytes.
+    def memory_usage(self):
+        usage = {}
+        for region, refresher in list(self._refreshers.items()):
+            dataset = refresher.current()
+            if dataset is not None:
+                usage[region] = dataset.nbytes
+        return usage
+
+    # Drop idle regions, then the least recently used ones above the memory budget.
+    # The default region and the region used last are never dropped.
+    def evict(self):
+        with self._lock:
+            now = time.monotonic()
+            candidates = [region for region in list(self._refreshers)[:-1] if region != self.default_region]
+            for region in candidates:
+                if now - self._last_used[region] > self.idle_timeout:
+                    self._drop(region, 'idle')
+
+            usage = self.memory_usage()
+            total = sum(usage.values())
+            for region in candidates:
+                if total <= self.memory_budget:
+                    break
+                if region in self._refreshers:
+                    total -= usage.get(region, 0)
+                    self._drop(region, 'memory budget')
+
+    def _drop(self, region, reason):
+        logger.info('Dropping the %s data (%s).', region, reason)
+        self._refreshers.pop(region).stop()
+        self._last_used.pop(region, None)
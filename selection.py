@@ -0,0 +1,116 @@
+import pandas as pd
+
+import config
+from instrumentation import annotate, timed
+from server_cache import FileSystemCache, MemoryCache, make_versioned_cache_key
+
+# Selections are shared by the four figure callbacks, possibly running in different worker processes.
+selection_cache = FileSystemCache(config.SERVER_CACHE_DIR, config.SELECTION_CACHE_TIMEOUT,
+                                  config.SELECTION_CACHE_MAX_BYTES)
+
+# Selections recently used by this worker process, in front of selection_cache: the figure callbacks of one
+# interaction served by the same process read the selection without loading it from its file every time.
+RECENT_SELECTIONS_MAX_BYTES = 32 * 1024 ** 2
+recent_selections = MemoryCache(config.SELECTION_CACHE_TIMEOUT, RECENT_SELECTIONS_MAX_BYTES)
+
+
+# Selecting the most recent data for each country within the date range.
+# The COVID-19 death rate is a derived metric computed with the dataset (see metrics.py).
+def select_recent_data_for_each_countries(store, country_list, start_date, end_date):
+    death_rate_data_frame = store.latest(country_list, start_date, end_date,
+                                         ['total_cases', 'total_deaths', 'covid19_death_rate'])
+    death_rate_data_frame['covid19_death_rate'] = death_rate_data_frame['covid19_death_rate'].round(2)
+
+    return death_rate_data_frame
+
+
+# Countries selected when the page opens, and after switching to a region without any of the selected countries.
+# Also the countries of the default views pre-rendered by export_static.py.
+DEFAULT_COUNTRIES = ['Germany', 'France', 'Netherlands', 'Russia']
+
+
+def default_countries(dataset):
+    if dataset is None:
+        return DEFAULT_COUNTRIES
+    return [i for i in DEFAULT_COUNTRIES if i in dataset.countries] or dataset.countries[:len(DEFAULT_COUNTRIES)]
+
+
+# Normalized inputs of a selection, the same countries picked in another order share one selection.
+def selection_inputs(countries, start_date, end_date):
+    if isinstance(countries, str):
+        countries = [countries]
+    return {'countries': sorted(countries or []), 'start_date': start_date, 'end_date': end_date}
+
+
+def selection_key(dataset, inputs):
+    return make_versioned_cache_key(dataset.version, 'selection', inputs)
+
+
+# The rows selected by the dropdown and the date range, and the most recent data of each country.
+def compute_selection(dataset, inputs):
+    countries, start_date, end_date = inputs['countries'], inputs['start_date'], inputs['end_date']
+
+    selected_data_frame = dataset.store.select(countries, start_date, end_date)
+
+    # Most recent total deaths, total cases and static attributes of each country within the date range
+    recent_deaths_data_frame = dataset.store.latest(
+        countries, start_date, end_date,
+        ['total_cases', 'total_deaths', 'population', 'hospital_beds_per_thousand', 'median_age', 'life_expectancy'])
+
+    # Most recent total tests of each country within the date range, dated when they were reported
+    recent_tests_data_frame = dataset.store.latest(countries, start_date, end_date, ['total_tests'],
+                                                   valid_column='total_tests')
+
+    # Most recent death rate of each country within the date range
+    recent_death_rate_data_frame = select_recent_data_for_each_countries(dataset.store, countries, start_date, end_date)
+
+    return {
+        'version': dataset.version,
+        'countries': countries,
+        'data_frame': selected_data_frame,
+        'recent_deaths': recent_deaths_data_frame,
+        'recent_tests': recent_tests_data_frame,
+        'recent_death_rate': recent_death_rate_data_frame,
+    }
+
+
+# Number of countries and days of a selection, recorded with the timings of the callbacks.
+def selection_cardinality(dataset, inputs):
+    first_date, last_date = dataset.first_date, dataset.last_date
+    if inputs['start_date']:
+        first_date = max(first_date, pd.Timestamp(inputs['start_date']).floor('D'))
+    if inputs['end_date']:
+        last_date = min(last_date, pd.Timestamp(inputs['end_date']).floor('D'))
+    return {'countries': len(inputs['countries']), 'days': max((last_date - first_date).days + 1, 0)}
+
+
+# The selection of the inputs in the dataset and its key: from this process, from the shared cache or computed
+# and stored in both.
+def cached_selection(dataset, inputs):
+    key = selection_key(dataset, inputs)
+    selection = recent_selections.get(key)
+    if selection is None:
+        selection = selection_cache.get(key)
+        if selection is None:
+            selection = compute_selection(dataset, inputs)
+            selection_cache.set(key, selection)
+        recent_selections.set(key, selection)
+    return key, selection
+
+
+# Compute the selection once per input combination and dataset version and store it in the shared cache.
+# Returns the data for the dcc.Store read by the figure callbacks.
+@timed('selection')
+def update_selection(dataset, countries, start_date, end_date):
+    inputs = selection_inputs(countries, start_date, end_date)
+    key, _ = cached_selection(dataset, inputs)
+    cardinality = selection_cardinality(dataset, inputs)
+    annotate(**cardinality)
+    return {'key': key, 'region': dataset.region, 'inputs': inputs, 'cardinality': cardinality}
+
+
+# The selection of the inputs stored in the dcc.Store, in the given (current) dataset of its region. After a
+# refresh the key in the store names the previous version, the selection is looked up by the key of the dataset.
+@timed('selection')
+def load_selection(dataset, selection_data):
+    return cached_selection(dataset, selection_data['inputs'])[1]
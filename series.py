@@ -0,0 +1,57 @@
+import numpy as np
+
+from data_store import STATIC_COLUMNS
+from figures import figure_overrides
+from instrumentation import timed
+from metrics import DEFAULT_METRIC
+from server_cache import make_versioned_cache_key
+
+# Columns shipped to the browser for the date filtering in assets/clientside.js, the static attributes are
+# shipped as one value per country.
+SERIES_COLUMNS = ['total_cases', 'total_deaths', 'new_cases', 'new_deaths', 'total_tests']
+
+
+def series_key(dataset, countries, metric=None):
+    return make_versioned_cache_key(dataset.version, 'series', sorted(countries), metric or DEFAULT_METRIC)
+
+
+# Columnar series of the selected countries over the whole date range, for the dcc.Store read by the clientside
+# callback. Dates are day offsets from first_date, the columns keep their float32 values (NaN becomes null).
+# 'y' holds the metric of the line graph.
+@timed('series')
+def country_series(dataset, countries, metric=None):
+    metric = metric or DEFAULT_METRIC
+    if isinstance(countries, str):
+        countries = [countries]
+    first_day = dataset.first_date.to_datetime64().astype('datetime64[D]')
+
+    series = {}
+    for country in countries or []:
+        start, stop = dataset.store.row_range(country)
+        rows = dataset.data_frame.iloc[start:stop]
+        if not len(rows):
+            continue
+        attributes = dataset.country_table.iloc[rows['location'].cat.codes.iloc[0]]
+        series[country] = {
+            'iso_code': attributes['iso_code'],
+            'color': attributes['color'],
+            'iso_color': attributes['iso_color'],
+            **{column: None if np.isnan(attributes[column]) else float(attributes[column])
+               for column in STATIC_COLUMNS},
+            'day': (rows['date'].to_numpy().astype('datetime64[D]') - first_day).astype(np.int32),
+            **{column: rows[column].to_numpy() for column in SERIES_COLUMNS},
+            'y': rows[metric].to_numpy(),
+        }
+
+    return {
+        'version': dataset.version,
+        # Templates of the region and the metric differing from the templates of the default region
+        'overrides': figure_overrides(dataset.region, metric),
+        'first_date': str(dataset.first_date.date()),
+        # Axis of the countries of the parallel coordinates plot
+        'all_countries': list(dataset.countries),
+        # Countries in the order of the selection store of the server, the same countries picked in another
+        # order show the same figures.
+        'countries': sorted(series),
+        'series': series,
+    }
@@ -0,0 +1,266 @@
+import collections
+import functools
+import hashlib
+import json
+import os
+import pickle
+import sys
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+from plotly.basedatatypes import BaseFigure
+
+
+# Stable key of the given parts, identical in every worker process.
+def make_cache_key(*parts):
+    return hashlib.sha1(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+
+
+# Key of a value derived from one dataset version. The version prefix lets a refresh drop stale entries.
+# Versions start with the region of the dataset, see Dataset.version.
+def make_versioned_cache_key(version, *parts):
+    return f'{version}-{make_cache_key(*parts)}'
+
+
+def is_other_version(key, version, namespace=''):
+    return key.startswith(namespace) and not key.startswith(version + '-')
+
+
+# Approximate memory held by a cached value without serializing it: the buffers of arrays and data frames, the
+# length of strings and the items of containers. The cost grows with the number of Python objects of the value,
+# not with the size of its arrays.
+def estimate_size(value):
+    if isinstance(value, (str, bytes, bytearray)):
+        return len(value)
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return int(np.sum(value.memory_usage(index=False, deep=True)))
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(estimate_size(key) + estimate_size(item) for key, item in value.items())
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(estimate_size(item) for item in value)
+    if isinstance(value, BaseFigure):
+        # The properties held by a figure of plotly express, to_plotly_json would copy them
+        return estimate_size(value._data) + estimate_size(value._layout)
+    return sys.getsizeof(value)
+
+
+#############################################################################################################
+# In-process cache with LRU eviction under a memory cap and a time to live.
+#############################################################################################################
+class MemoryCache:
+
+    def __init__(self, timeout, max_bytes=None):
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+        self._entries = collections.OrderedDict()  # key -> (value, size, expires)
+        self._size = 0
+        self._lock = threading.Lock()
+
+    # The cached value or None when it is missing or expired.
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[2] < time.monotonic():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def set(self, key, value):
+        size = estimate_size(value)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, size, time.monotonic() + self.timeout)
+            self._size += size
+            # Evict the least recently used entries above the memory cap.
+            while self.max_bytes is not None and self._size > self.max_bytes and len(self._entries) > 1:
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, key):
+        self._size -= self._entries.pop(key)[1]
+
+    # Drop the entries of every other dataset version within the namespace, e.g. the region of the dataset.
+    def discard_other_versions(self, version, namespace=''):
+        with self._lock:
+            for key in [key for key in self._entries if is_other_version(key, version, namespace)]:
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+
+#############################################################################################################
+# Pickle based cache in a directory shared by all worker processes of the server.
+# The modification time of a file is its last use: reads touch it, evictions remove the oldest files.
+#############################################################################################################
+class FileSystemCache:
+
+    extension = '.pkl'
+
+    def __init__(self, directory, timeout, max_bytes=None):
+        self.directory = directory
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + self.extension)
+
+    # The cached value or None when it is missing or older than the timeout.
+    def get(self, key):
+        path = self._path(key)
+        try:
+            if time.time() - os.path.getmtime(path) > self.timeout:
+                return None
+            with open(path, 'rb') as cache_file:
+                value = pickle.load(cache_file)
+            if self.max_bytes is not None:
+                os.utime(path)
+            return value
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+
+    def set(self, key, value):
+        path = self._path(key)
+        # Write to a temporary file first, other workers never read a partially written value.
+        # Threads of a worker may write the same key at once, each writes its own temporary file.
+        temporary_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(temporary_path, 'wb') as cache_file:
+            pickle.dump(value, cache_file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temporary_path, path)
+
+        if self.max_bytes is not None:
+            self._evict()
+
+    def _cache_files(self):
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if entry.name.endswith(self.extension):
+                    try:
+                        yield entry, entry.stat()
+                    except OSError:
+                        continue
+
+    # Remove expired files, then the least recently used files above the memory cap.
+    def _evict(self):
+        now = time.time()
+        files = []
+        for entry, stat in self._cache_files():
+            if now - stat.st_mtime > self.timeout:
+                self._remove(entry.path)
+            else:
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+
+        size = sum(file_size for _, file_size, _ in files)
+        for _, file_size, path in sorted(files)[:-1]:
+            if size <= self.max_bytes:
+                break
+            self._remove(path)
+            size -= file_size
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    # Drop the entries of every other dataset version within the namespace, e.g. the region of the dataset.
+    def discard_other_versions(self, version, namespace=''):
+        for entry, _ in self._cache_files():
+            if is_other_version(entry.name, version, namespace):
+                self._remove(entry.path)
+
+    def clear(self):
+        for entry, _ in self._cache_files():
+            self._remove(entry.path)
+
+
+#############################################################################################################
+# Files written as they are, e.g. the finished exports, in a directory shared by all worker processes and evicted
+# like the entries of the FileSystemCache. A file is written to its temporary path while it is streamed to the
+# client and becomes visible to the other requests once it is complete.
+#############################################################################################################
+class FileCache(FileSystemCache):
+
+    extension = '.data'
+
+    # Path of the cached file or None when it is missing or older than the timeout.
+    def path(self, key):
+        path = self._path(key)
+        try:
+            if time.time() - os.path.getmtime(path) > self.timeout:
+                return None
+            if self.max_bytes is not None:
+                os.utime(path)
+            return path
+        except OSError:
+            return None
+
+    def temporary_path(self, key):
+        return f'{self._path(key)}.{os.getpid()}.{threading.get_ident()}.tmp'
+
+    # Make the file written to the temporary path of the key the cached file.
+    def commit(self, key):
+        os.replace(self.temporary_path(key), self._path(key))
+        if self.max_bytes is not None:
+            self._evict()
+
+    def discard(self, key):
+        self._remove(self.temporary_path(key))
+
+
+#############################################################################################################
+# Cache that stores nothing, used when caching is switched off.
+#############################################################################################################
+class NullCache:
+
+    def get(self, key):
+        return None
+
+    def set(self, key, value):
+        pass
+
+    def discard_other_versions(self, version, namespace=''):
+        pass
+
+    def clear(self):
+        pass
+
+
+# Create the cache of the configured backend: 'memory', 'filesystem' or 'none'.
+def create_cache(backend, directory, timeout, max_bytes=None):
+    if backend == 'memory':
+        return MemoryCache(timeout, max_bytes)
+    if backend == 'filesystem':
+        return FileSystemCache(directory, timeout, max_bytes)
+    if backend == 'none':
+        return NullCache()
+    raise ValueError(f'Unknown cache backend {backend!r}, expected memory, filesystem or none.')
+
+
+# Cache the results of a function under the key returned by key_function for the same arguments.
+# Results are not cached when key_function returns None.
+def memoize(cache, key_function):
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args):
+            key = key_function(*args)
+            if key is None:
+                return function(*args)
+            value = cache.get(key)
+            if value is None:
+                value = function(*args)
+                cache.set(key, value)
+            return value
+        return wrapper
+    return decorator
@@ -0,0 +1,242 @@
+import fcntl
+import io
+import json
+import logging
+import os
+import threading
+import weakref
+
+import pandas as pd
+import pyarrow as pa
+
+import config
+from data_loader import arrow_columns, arrow_table, continent_slug
+from data_store import COUNTRY_COLUMNS, STATIC_COLUMNS
+from data_refresh import DatasetRefresher
+from dataset import Dataset
+
+logger = logging.getLogger(__name__)
+
+# Columns of a segment holding the last valid row indexes of the CountryDateStore.
+LAST_VALID_PREFIX = '_last_valid_'
+
+# Key of the schema metadata holding the country table as JSON.
+COUNTRY_TABLE_KEY = b'country_table'
+
+
+# Arrow IPC file holding the rows of one version of a region.
+def segment_path(directory, version):
+    return os.path.join(directory, f'{version}.arrow')
+
+
+# Small JSON file naming the current segment of a region, replaced atomically on every publish.
+def pointer_path(directory, region):
+    return os.path.join(directory, f'{continent_slug(region)}.json')
+
+
+def read_pointer(directory, region):
+    with open(pointer_path(directory, region)) as pointer_file:
+        return json.load(pointer_file)
+
+
+# Write the rows of a Dataset and the indexes derived from them as an uncompressed Arrow IPC file, which the
+# workers memory-map. Numeric columns keep NaN as a value (no validity bitmap) so that they map to numpy
+# without a copy. The small country table travels in the schema metadata.
+def write_segment(dataset, directory):
+    path = segment_path(directory, dataset.version)
+    if os.path.exists(path):
+        return path
+
+    table = arrow_table(dataset.data_frame)
+    for column, rows in dataset.store.last_valid_rows.items():
+        table = table.append_column(LAST_VALID_PREFIX + column, pa.array(rows, from_pandas=False))
+    country_table = dataset.country_table[COUNTRY_COLUMNS].to_json(orient='split', index=False)
+    table = table.replace_schema_metadata({COUNTRY_TABLE_KEY: country_table})
+
+    temporary_path = f'{path}.{os.getpid()}.tmp'
+    with pa.OSFile(temporary_path, 'wb') as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(temporary_path, path)
+    return path
+
+
+# Make a Dataset the current version of its region for every worker.
+def publish(dataset, directory):
+    os.makedirs(directory, exist_ok=True)
+    path = write_segment(dataset, directory)
+    pointer = {'region': dataset.region, 'version': dataset.version, 'path': os.path.basename(path)}
+    temporary_path = f'{pointer_path(directory, dataset.region)}.{os.getpid()}.tmp'
+    with open(temporary_path, 'w') as pointer_file:
+        json.dump(pointer, pointer_file)
+    os.replace(temporary_path, pointer_path(directory, dataset.region))
+    logger.info('Published the %s data, dataset version is %s.', dataset.region, dataset.version)
+
+
+# Delete the old segments of a region that no worker references any more. A worker holds a shared lock on
+# the segments it uses, so the exclusive lock is only granted for unused ones.
+def retire_segments(directory, region):
+    current = read_pointer(directory, region)['path']
+    prefix = continent_slug(region) + '-'
+    for name in os.listdir(directory):
+        if not name.startswith(prefix) or not name.endswith('.arrow') or name == current:
+            continue
+        path = os.path.join(directory, name)
+        try:
+            descriptor = os.open(path, os.O_RDONLY)
+        except FileNotFoundError:
+            continue
+        try:
+            fcntl.flock(descriptor, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            continue
+        else:
+            os.unlink(path)
+            logger.info('Retired the segment %s.', name)
+        finally:
+            os.close(descriptor)
+
+
+# Open the current segment of a region with a shared lock. Retries when the segment was retired between
+# reading the pointer and taking the lock.
+def open_segment(directory, region):
+    for _ in range(10):
+        try:
+            pointer = read_pointer(directory, region)
+        except FileNotFoundError:
+            raise FileNotFoundError(f'No shared {region} data in {directory}. With COVID19_SHARED_DATASET=1 the '
+                                    'app has to run under gunicorn -c gunicorn.conf.py, whose master process '
+                                    'publishes the data.') from None
+        path = os.path.join(directory, pointer['path'])
+        try:
+            descriptor = os.open(path, os.O_RDONLY)
+        except FileNotFoundError:
+            continue
+        fcntl.flock(descriptor, fcntl.LOCK_SH)
+        try:
+            if os.stat(path).st_ino == os.fstat(descriptor).st_ino:
+                return pointer, path, descriptor
+        except FileNotFoundError:
+            pass
+        os.close(descriptor)
+    raise RuntimeError(f'Could not attach to the shared {region} data in {directory}.')
+
+
+# Dataset of a region backed by the memory-mapped segment: the numeric and date columns are read-only
+# views on the shared pages, only the categorical codes are copied.
+def attach_dataset(directory, region):
+    pointer, path, descriptor = open_segment(directory, region)
+    try:
+        table = pa.ipc.open_file(pa.memory_map(path, 'r')).read_all()
+    except Exception:
+        os.close(descriptor)
+        raise
+
+    columns = arrow_columns(table)
+    last_valid_rows = {name[len(LAST_VALID_PREFIX):]: columns.pop(name) for name in list(columns)
+                       if name.startswith(LAST_VALID_PREFIX)}
+
+    dtypes = {'location': str, 'iso_code': str, **{column: 'float32' for column in STATIC_COLUMNS}}
+    country_table = pd.read_json(io.StringIO(table.schema.metadata[COUNTRY_TABLE_KEY].decode()), orient='split',
+                                 dtype=dtypes, convert_dates=False)
+    dataset = Dataset(pd.DataFrame(columns, copy=False), region, version=pointer['version'],
+                      last_valid_rows=last_valid_rows, country_table=country_table)
+    # The shared lock is held as long as the Dataset is referenced.
+    weakref.finalize(dataset, os.close, descriptor)
+    return dataset
+
+
+#############################################################################################################
+# DatasetRefresher of a worker process reading the data published by the SharedDatasetPublisher of the
+# gunicorn master instead of the snapshot. A refresh swaps in the segment of a newly published version.
+#############################################################################################################
+class SharedDatasetRefresher(DatasetRefresher):
+
+    load_retry_interval = 1
+
+    def __init__(self, continent, directory=None, lazy=False):
+        self.directory = config.SHARED_MEMORY_DIR if directory is None else directory
+        super().__init__(continent, interval=config.SHARED_POLL_INTERVAL, lazy=lazy)
+
+    def load(self):
+        self._dataset = attach_dataset(self.directory, self.continent)
+        self.load_error = None
+        self._ready_event.set()
+        logger.info('Attached to the shared %s data, dataset version is %s.', self.continent, self._dataset.version)
+
+    def refresh(self):
+        with self._refresh_lock:
+            if not self.is_ready() or read_pointer(self.directory, self.continent)['version'] == self._dataset.version:
+                return False
+
+            self._dataset = attach_dataset(self.directory, self.continent)
+            logger.info('Attached to the new shared %s data, dataset version is %s.', self.continent,
+                        self._dataset.version)
+            for listener in self._listeners:
+                listener(self._dataset)
+            return True
+
+
+#############################################################################################################
+# Loads the data of every region once in the gunicorn master process and publishes every new version to the
+# shared memory directory, where the workers attach to it. The default region is published before the
+# workers start, the other regions follow in the background. Old segments are retired by a thread polling
+# every SHARED_POLL_INTERVAL seconds, once the last worker using them moved on.
+#############################################################################################################
+class SharedDatasetPublisher:
+
+    def __init__(self, regions=None, directory=None, interval=None):
+        self.regions = list(config.REGIONS if regions is None else regions)
+        self.directory = config.SHARED_MEMORY_DIR if directory is None else directory
+        self.interval = config.SHARED_POLL_INTERVAL if interval is None else interval
+        if config.DEFAULT_REGION not in self.regions:
+            self.regions.insert(0, config.DEFAULT_REGION)
+
+        self._refreshers = {}
+        self._published = {}  # region -> published version
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    # Listener of the refreshers, also called from their threads.
+    def publish(self, dataset):
+        with self._lock:
+            if self._published.get(dataset.region) == dataset.version:
+                return
+            publish(dataset, self.directory)
+            self._published[dataset.region] = dataset.version
+            retire_segments(self.directory, dataset.region)
+
+    # Publish the regions loaded since the last call and delete the segments no worker uses any more.
+    def poll(self):
+        for region, refresher in self._refreshers.items():
+            dataset = refresher.current()
+            if dataset is None:
+                continue
+            if self._published.get(region) != dataset.version:
+                self.publish(dataset)
+            else:
+                with self._lock:
+                    retire_segments(self.directory, region)
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                self.poll()
+            except Exception:
+                logger.exception('Publishing the shared data to %s failed.', self.directory)
+
+    def start(self):
+        for region in self.regions:
+            refresher = DatasetRefresher(region, lazy=region != config.DEFAULT_REGION)
+            refresher.add_listener(self.publish)
+            self._refreshers[region] = refresher
+            refresher.start()
+        self.poll()
+        self._thread = threading.Thread(target=self._run, name='shared-dataset-publisher', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        for refresher in self._refreshers.values():
+            refresher.stop()
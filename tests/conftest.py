@@ -0,0 +1,30 @@
+import atexit
+import importlib.util
+import os
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+# The modules of the dashboard are top-level modules of the repository root.
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+# Settings of the tests, read by config.py on its first import: the bundled sample data, snapshot and caches in a
+# temporary directory and no background refresh. Settings of the environment running the tests are ignored.
+TEST_CACHE_DIR = tempfile.mkdtemp(prefix='covid19-tests-')
+atexit.register(shutil.rmtree, TEST_CACHE_DIR, True)
+for name in [name for name in os.environ if name.startswith('COVID19_')]:
+    del os.environ[name]
+os.environ.update(COVID19_DATA_SOURCE='sample', COVID19_CACHE_DIR=TEST_CACHE_DIR, COVID19_REFRESH_INTERVAL='0')
+
+
+# The module of the Dash app, COVID-19.py, with the data of the default region loaded.
+@pytest.fixture(scope='session')
+def app_module():
+    spec = importlib.util.spec_from_file_location('covid19_app', os.path.join(BASE_DIR, 'COVID-19.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    module.regions.current(wait=True)
+    return module
@@ -0,0 +1,58 @@
+import io
+import os
+
+import pandas as pd
+import pytest
+
+import config
+
+COUNTRIES = ['Germany', 'France']
+
+
+@pytest.fixture
+def client(app_module):
+    app_module.export_cache.clear()
+    return app_module.server.test_client()
+
+
+def download(client, query):
+    response = client.get(f'/export/csv?{query}')
+    data = response.get_data()
+    response.close()
+    return response, data
+
+
+# The download has the rows of the selection, like the CountryDateStore, and is cached for the next request.
+def test_download_of_the_selection(app_module, client):
+    dataset = app_module.regions.current(wait=True)
+    query = app_module.update_export_link(config.DEFAULT_REGION, COUNTRIES, '2020-04-01', '2020-05-15', 'csv',
+                                          ['new_cases', 'population']).split('?', 1)[1]
+    response, data = download(client, query)
+    assert response.status_code == 200
+    assert 'filename="covid19-europe-2020-04-01-2020-05-15.csv"' in response.headers['Content-Disposition']
+
+    rows = pd.read_csv(io.BytesIO(data))
+    expected = dataset.store.select(COUNTRIES, '2020-04-01', '2020-05-15')
+    assert list(rows.columns) == ['location', 'iso_code', 'date', 'new_cases', 'population']
+    assert rows['new_cases'].tolist() == expected['new_cases'].tolist()
+    assert sorted(rows['location'].unique()) == sorted(COUNTRIES)
+
+    cache_files = os.listdir(app_module.export_cache.directory)
+    assert [name.endswith(app_module.export_cache.extension) for name in cache_files] == [True]
+    cached_response, cached_data = download(client, query)
+    assert cached_response.status_code == 200 and cached_data == data
+
+
+@pytest.mark.parametrize('query', ['start_date=garbage', 'end_date=2020-13-45', 'start_date=nat',
+                                   'start_date=2020-05-01T00:00Z', 'start_date=2020-06-01&end_date=2020-05-01',
+                                   'column=bogus', 'column=new_cases&column=bogus', 'country=Atlantis'])
+def test_invalid_parameters_are_answered_with_400(client, query):
+    response, data = download(client, f'region={config.DEFAULT_REGION}&{query}')
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize('path', ['/export/csv?region=Atlantis', '/export/csv', '/export/csv?region=',
+                                  f'/export/xml?region={config.DEFAULT_REGION}'])
+def test_unknown_regions_and_formats_are_answered_with_404(client, path):
+    response = client.get(path)
+    assert response.status_code == 404
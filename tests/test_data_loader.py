@@ -0,0 +1,62 @@
+import os
+
+import pandas as pd
+import pandas.testing as pdt
+import pyarrow.feather as feather
+import pytest
+
+import config
+from data_loader import load_continent_data_frame, read_covid19_csv, write_snapshot
+
+CONTINENT = 'Europe'
+# Copies of the sample countries in the snapshot, enough rows for several default record batches of 64k rows.
+COPIES = 20
+
+
+# Address ranges of the mapped files named file_name in this process.
+def mapped_ranges(file_name):
+    ranges = []
+    with open('/proc/self/maps') as maps_file:
+        for line in maps_file:
+            fields = line.split()
+            if len(fields) == 6 and os.path.basename(fields[5]) == file_name:
+                start, stop = (int(address, 16) for address in fields[0].split('-'))
+                ranges.append((start, stop))
+    return ranges
+
+
+@pytest.fixture(scope='module')
+def snapshot_dir(tmp_path_factory):
+    cache_dir = str(tmp_path_factory.mktemp('snapshot'))
+    data_frame = read_covid19_csv(config.SAMPLE_DATA_SET_PATH)
+    copies = [data_frame.assign(location=data_frame['location'].astype(str) + f' {copy}') for copy in range(COPIES)]
+    data_frame = pd.concat(copies, ignore_index=True).astype({'location': 'category'})
+    write_snapshot(data_frame, 'sample', cache_dir)
+    return cache_dir
+
+
+def test_snapshot_round_trip(snapshot_dir):
+    data_frame = load_continent_data_frame(CONTINENT, 'sample', snapshot_dir, rebuild=False)
+    expected = feather.read_table(os.path.join(snapshot_dir, 'europe.feather')).to_pandas()
+    pdt.assert_frame_equal(data_frame, expected, check_categorical=False)
+    # Missing values are kept as NaN, not dropped to nulls
+    assert data_frame['total_deaths'].isna().any()
+
+
+def test_snapshot_is_one_record_batch(snapshot_dir):
+    table = feather.read_table(os.path.join(snapshot_dir, 'europe.feather'))
+    assert all(column.num_chunks == 1 for column in table.columns)
+
+
+@pytest.mark.skipif(not os.path.exists('/proc/self/maps'), reason='needs /proc/self/maps')
+def test_snapshot_columns_are_views_of_the_mapped_file(snapshot_dir):
+    data_frame = load_continent_data_frame(CONTINENT, 'sample', snapshot_dir, rebuild=False)
+    ranges = mapped_ranges('europe.feather')
+    assert ranges
+
+    for column in data_frame.columns:
+        if isinstance(data_frame[column].dtype, pd.CategoricalDtype):
+            continue
+        values = data_frame[column].to_numpy()
+        address = values.__array_interface__['data'][0]
+        assert any(start <= address < stop for start, stop in ranges), column
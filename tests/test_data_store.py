@@ -0,0 +1,83 @@
+import numpy as np
+import pandas as pd
+import pandas.testing as pdt
+import pytest
+
+COUNTRIES = ['France', 'Germany', 'Italy']
+DATE_RANGES = [(None, None), ('2020-04-01', '2020-06-30'), ('2020-05-15', None), (None, '2020-03-01'),
+               ('2030-01-01', None)]
+
+
+@pytest.fixture(scope='module')
+def dataset(app_module):
+    return app_module.regions.current(wait=True)
+
+
+# Rows of the countries within [start_date, end_date] found by a boolean scan of the whole data frame.
+def scanned_rows(data_frame, countries, start_date, end_date):
+    is_selected = data_frame['location'].isin(countries)
+    if start_date is not None:
+        is_selected &= data_frame['date'] >= pd.Timestamp(start_date)
+    if end_date is not None:
+        is_selected &= data_frame['date'] <= pd.Timestamp(end_date)
+    return data_frame.loc[is_selected]
+
+
+@pytest.mark.parametrize('start_date, end_date', DATE_RANGES)
+def test_select_matches_a_scan(dataset, start_date, end_date):
+    data_frame = dataset.data_frame
+    for countries in [COUNTRIES, COUNTRIES[:1], list(reversed(COUNTRIES)), ['Atlantis']]:
+        selection = dataset.store.select(countries, start_date, end_date)
+        pdt.assert_frame_equal(selection, scanned_rows(data_frame, countries, start_date, end_date))
+
+    columns = ['date', 'total_cases']
+    pdt.assert_frame_equal(dataset.store.select(COUNTRIES, start_date, end_date, columns),
+                           scanned_rows(data_frame, COUNTRIES, start_date, end_date)[columns])
+
+
+# A single country is a view on the rows of the data frame, not a copy.
+def test_select_single_country_is_a_view(dataset):
+    selection = dataset.store.select('France')
+    assert np.shares_memory(selection['total_cases'].to_numpy(), dataset.data_frame['total_cases'].to_numpy())
+
+
+def test_row_ranges(dataset):
+    start, stop = dataset.store.country_slices['France']
+    assert dataset.store.row_ranges('France') == [(start, stop)]
+    # Unknown countries and ranges without rows give empty ranges
+    first, last = dataset.store.row_range('Atlantis')
+    assert first == last
+    first, last = dataset.store.row_range('France', '2020-06-01', '2020-05-01')
+    assert first == last
+    assert dataset.store.row_range('France', '2030-01-01') == (stop, stop)
+
+
+# latest() gives the last valid value of every column within the range, like groupby().last() on the selected rows.
+@pytest.mark.parametrize('start_date, end_date', DATE_RANGES)
+def test_latest_matches_groupby_last(dataset, start_date, end_date):
+    columns = ['total_cases', 'total_deaths', 'total_tests']
+    latest = dataset.store.latest(COUNTRIES, start_date, end_date, columns=columns + ['population'])
+
+    rows = scanned_rows(dataset.data_frame, COUNTRIES, start_date, end_date)
+    expected = rows.groupby('location', observed=True)[['date'] + columns].last()
+    assert dataset.country_table['location'].to_numpy()[latest['country']].tolist() == expected.index.tolist()
+    assert latest['date'].tolist() == expected['date'].tolist()
+    for column in columns:
+        np.testing.assert_array_equal(latest[column].to_numpy(), expected[column].to_numpy())
+    np.testing.assert_array_equal(latest['population'].to_numpy(),
+                                  dataset.country_table['population'].to_numpy()[latest['country']])
+
+
+# With valid_column the date is the date of the last value of the column, countries without one are left out.
+# Germany has rows but no tests until 2020-03-16, Italy has tests from 2020-03-15 on.
+@pytest.mark.parametrize('start_date, end_date', [('2020-03-01', '2020-09-30'), ('2020-03-09', '2020-03-15')])
+def test_latest_of_valid_column(dataset, start_date, end_date):
+    rows = scanned_rows(dataset.data_frame, COUNTRIES, start_date, end_date)
+    rows = rows.loc[rows['total_tests'].notna()]
+    expected = rows.groupby('location', observed=True)[['date', 'total_tests']].last()
+
+    latest = dataset.store.latest(COUNTRIES, start_date, end_date, columns=['total_tests'],
+                                  valid_column='total_tests')
+    assert dataset.country_table['location'].to_numpy()[latest['country']].tolist() == expected.index.tolist()
+    assert latest['date'].tolist() == expected['date'].tolist()
+    np.testing.assert_array_equal(latest['total_tests'].to_numpy(), expected['total_tests'].to_numpy())
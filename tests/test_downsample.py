@@ -0,0 +1,77 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from downsample import MIN_LINE_POINTS, level_of_detail, lttb_indices, weekly_rows, zoom_window
+from metrics import DEFAULT_METRIC, METRICS
+
+
+# Rows of countries x days sorted by (location, date) with random values of the metrics of the line graph.
+def line_rows(countries, days, seed=0):
+    rng = np.random.default_rng(seed)
+    names = [f'Country {index:04d}' for index in range(countries)]
+    data_frame = pd.DataFrame({
+        'location': pd.Categorical(np.repeat(names, days), categories=names),
+        'date': np.tile(pd.date_range('2020-03-02', periods=days).to_numpy(), countries),
+    })
+    for column in METRICS:
+        data_frame[column] = rng.random(countries * days).astype('float32')
+    return data_frame
+
+
+def test_lttb_keeps_the_first_and_last_points():
+    x = np.arange(1000, dtype=np.float64)
+    y = np.sin(x / 20)
+    indices = lttb_indices(x, y, 100)
+    assert len(indices) == 100
+    assert indices[0] == 0 and indices[-1] == 999
+    assert np.all(np.diff(indices) > 0)
+    # The peaks of the sine survive
+    assert y[indices].max() > 0.99 and y[indices].min() < -0.99
+
+
+def test_lttb_skips_missing_values():
+    y = np.array([np.nan, 1.0, np.nan, 2.0, 3.0])
+    assert lttb_indices(np.arange(5.0), y, 10).tolist() == [1, 3, 4]
+
+
+@pytest.mark.parametrize('method', ['lttb', 'weekly'])
+def test_level_of_detail_fits_the_budget(method):
+    data_frame = line_rows(countries=4, days=400)
+    rows, resolution = level_of_detail(data_frame, 500, method)
+    assert resolution == method
+    assert len(rows) <= 500
+    assert rows['location'].nunique() == 4
+
+
+def test_level_of_detail_keeps_daily_rows_within_the_budget():
+    data_frame = line_rows(countries=2, days=100)
+    rows, resolution = level_of_detail(data_frame, 500, 'lttb')
+    assert resolution == 'daily' and len(rows) == len(data_frame)
+
+
+# More lines than max_points / 3: every line keeps three points instead of all of them.
+def test_level_of_detail_of_many_countries():
+    countries, days, max_points = 300, 200, 600
+    rows, resolution = level_of_detail(line_rows(countries, days), max_points, 'lttb')
+    assert resolution == 'lttb'
+    assert len(rows) == countries * MIN_LINE_POINTS
+    assert rows.groupby('location', observed=True).size().eq(MIN_LINE_POINTS).all()
+
+
+def test_weekly_rows_aggregate_by_week():
+    data_frame = line_rows(countries=2, days=14)
+    weekly = weekly_rows(data_frame, DEFAULT_METRIC)
+    # 2020-03-02 was a Monday: two weeks per country
+    assert len(weekly) == 4
+    assert (weekly['date'].dt.dayofweek == 0).all()
+    first_week = data_frame.iloc[:7]
+    assert weekly['new_cases'].iloc[0] == pytest.approx(first_week['new_cases'].to_numpy(dtype=np.float64).sum())
+    assert weekly['total_cases'].iloc[0] == first_week['total_cases'].iloc[-1]
+
+
+def test_zoom_window():
+    assert zoom_window(None) is None
+    assert zoom_window({'xaxis.autorange': True}) is None
+    assert zoom_window({'xaxis.range[0]': '2020-04-01 12:00', 'xaxis.range[1]': '2020-04-10'}) == (
+        '2020-03-31', '2020-04-11')
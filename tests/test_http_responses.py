@@ -0,0 +1,64 @@
+import gzip
+
+import config
+
+COUNTRIES = ['France', 'Germany']
+
+
+def selection_request(region):
+    inputs = [('region-dropdown', 'value', region), ('country-dropdown', 'value', COUNTRIES),
+              ('date-range-slider', 'start_date', None), ('date-range-slider', 'end_date', None)]
+    return {'output': 'selection.data', 'outputs': {'id': 'selection', 'property': 'data'},
+            'inputs': [{'id': id, 'property': prop, 'value': value} for id, prop, value in inputs],
+            'changedPropIds': ['country-dropdown.value'], 'state': []}
+
+
+# A reload of the page with the ETag of the layout is answered with 304.
+def test_layout_is_conditional(app_module):
+    client = app_module.server.test_client()
+    response = client.get('/_dash-layout')
+    assert response.status_code == 200
+    etag, weak = response.get_etag()
+    assert etag and weak
+    assert response.cache_control.no_cache
+
+    assert client.get('/_dash-layout', headers={'If-None-Match': f'W/"{etag}"'}).status_code == 304
+    assert client.get('/_dash-layout', headers={'If-None-Match': 'W/"other"'}).status_code == 200
+
+
+# Browsers never send If-None-Match with the POST of a callback, no ETag is computed for it.
+def test_callbacks_are_not_conditional(app_module):
+    client = app_module.server.test_client()
+    body = selection_request(app_module.config.DEFAULT_REGION)
+    response = client.post('/_dash-update-component', json=body)
+    assert response.status_code == 200
+    assert response.get_etag() == (None, None)
+    assert client.post('/_dash-update-component', json=body, headers={'If-None-Match': '*'}).status_code == 200
+
+
+def test_responses_are_compressed(app_module):
+    client = app_module.server.test_client()
+    response = client.get('/_dash-layout', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in response.vary
+
+
+# Sum of the samples of a histogram of GET /metrics over all callbacks.
+def histogram_sum(client, name):
+    lines = client.get('/metrics').get_data(as_text=True).splitlines()
+    return sum(float(line.rsplit(' ', 1)[1]) for line in lines if line.startswith(f'{name}_sum'))
+
+
+# The payload size of a callback is measured before compression, the response size after it.
+def test_callback_payload_is_measured_before_compression(app_module, monkeypatch):
+    monkeypatch.setattr(config, 'COMPRESSION_MIN_BYTES', 0)
+    client = app_module.server.test_client()
+    payload_bytes = histogram_sum(client, 'covid19_callback_payload_bytes')
+    response_bytes = histogram_sum(client, 'covid19_callback_response_bytes')
+
+    response = client.post('/_dash-update-component', json=selection_request(config.DEFAULT_REGION),
+                           headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    body = response.get_data()
+    assert histogram_sum(client, 'covid19_callback_payload_bytes') - payload_bytes == len(gzip.decompress(body))
+    assert histogram_sum(client, 'covid19_callback_response_bytes') - response_bytes == len(body)
@@ -0,0 +1,88 @@
+import os
+
+import pandas as pd
+import pandas.testing as pdt
+import pytest
+
+import config
+from data_refresh import DatasetRefresher
+from dataset import Dataset
+
+CONTINENT = 'Europe'
+# Country missing from the first version of the source, published with the new days.
+NEW_COUNTRY = 'Germany'
+NEW_DAYS = 5
+
+
+def write_source(path, data_frame):
+    data_frame.to_csv(path, index=False)
+    # A rewrite within the same clock tick keeps the modification time, the size alone may not change
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+
+def rows_by_country_date(dataset):
+    data_frame = dataset.data_frame.assign(location=dataset.data_frame['location'].astype(str))
+    return data_frame.sort_values(['location', 'date'], ignore_index=True)
+
+
+# A refresh appending new days and a new country gives the same Dataset as loading the new source from scratch.
+# Source without the last days and without NEW_COUNTRY, and the full sample.
+def old_and_new_sources():
+    full_data_frame = pd.read_csv(config.SAMPLE_DATA_SET_PATH)
+    dates = pd.to_datetime(full_data_frame['date'])
+    old_data_frame = full_data_frame.loc[(dates <= dates.max() - pd.Timedelta(days=NEW_DAYS)) &
+                                         (full_data_frame['location'] != NEW_COUNTRY)]
+    return old_data_frame, full_data_frame
+
+
+def test_refresh_appends_new_days_and_countries(tmp_path):
+    old_data_frame, full_data_frame = old_and_new_sources()
+    source = str(tmp_path / 'owid-covid-data.csv')
+    write_source(source, old_data_frame)
+
+    refresher = DatasetRefresher(CONTINENT, source=source, cache_dir=str(tmp_path / 'cache'), interval=0)
+    old_dataset = refresher.current()
+    assert NEW_COUNTRY not in old_dataset.countries
+    # The header numbers are extended by the refresh rather than computed again
+    old_dataset.kpis.at()
+
+    write_source(source, full_data_frame)
+    assert refresher.refresh()
+    dataset = refresher.current()
+    fresh_dataset = DatasetRefresher(CONTINENT, source=source, cache_dir=str(tmp_path / 'fresh'),
+                                     interval=0).current()
+
+    assert dataset is not old_dataset
+    assert dataset.version == fresh_dataset.version
+    assert dataset.countries == fresh_dataset.countries
+    assert dataset.last_date == fresh_dataset.last_date
+    pdt.assert_frame_equal(rows_by_country_date(dataset), rows_by_country_date(fresh_dataset))
+    assert dataset.kpis.at() == fresh_dataset.kpis.at()
+    assert dataset.kpis.at(old_dataset.last_date) == fresh_dataset.kpis.at(old_dataset.last_date)
+
+    # Nothing new is published: no swap
+    assert not refresher.refresh()
+    assert refresher.current() is dataset
+
+
+# A failed refresh does not consume the new content of the source, the next refresh appends it.
+def test_failed_refresh_is_retried(tmp_path, monkeypatch):
+    old_data_frame, full_data_frame = old_and_new_sources()
+    source = str(tmp_path / 'owid-covid-data.csv')
+    write_source(source, old_data_frame)
+    refresher = DatasetRefresher(CONTINENT, source=source, cache_dir=str(tmp_path / 'cache'), interval=0)
+    old_dataset = refresher.current()
+
+    def failing_append(dataset, new_rows):
+        raise MemoryError
+    write_source(source, full_data_frame)
+    with monkeypatch.context() as patch:
+        patch.setattr(Dataset, 'append', failing_append)
+        with pytest.raises(MemoryError):
+            refresher.refresh()
+    assert refresher.current() is old_dataset
+
+    assert refresher.refresh()
+    assert NEW_COUNTRY in refresher.current().countries
+    assert refresher.current().last_date > old_dataset.last_date
@@ -0,0 +1,56 @@
+import types
+
+import pytest
+
+import regions
+from regions import RegionRegistry
+
+REGIONS = ['Europe', 'Asia', 'Africa']
+
+
+# Monotonic clock of the RegionRegistry advanced by the tests.
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(regions, 'time', types.SimpleNamespace(monotonic=lambda: now[0]))
+    return now
+
+
+def loaded_registry(memory_budget=2 ** 40):
+    registry = RegionRegistry(REGIONS, 'Europe', idle_timeout=60, memory_budget=memory_budget)
+    for region in REGIONS[1:]:
+        assert registry.current(region, wait=True).region == region
+    return registry
+
+
+def test_idle_regions_are_dropped(clock):
+    registry = loaded_registry()
+    clock[0] += 30
+    registry.refresher('Africa')
+    assert list(registry._refreshers) == REGIONS
+
+    # Asia is idle, Europe is the default region
+    clock[0] += 31
+    registry.refresher('Africa')
+    assert list(registry._refreshers) == ['Europe', 'Africa']
+    # It is loaded again on its next use
+    assert registry.current('Asia', wait=True).region == 'Asia'
+
+
+def test_least_recently_used_regions_are_dropped_above_the_memory_budget(clock):
+    usage = loaded_registry().memory_usage()
+    registry = loaded_registry(memory_budget=usage['Europe'] + usage['Africa'])
+    registry.refresher('Africa')
+    assert list(registry._refreshers) == ['Europe', 'Africa']
+    assert sum(registry.memory_usage().values()) <= registry.memory_budget
+
+    # The region used last stays loaded even above the budget
+    registry.memory_budget = 0
+    registry.refresher('Africa')
+    assert list(registry._refreshers) == ['Europe', 'Africa']
+
+
+# Unknown regions fall back to the default region.
+def test_unknown_region_is_the_default_region(clock):
+    registry = RegionRegistry(REGIONS, 'Europe')
+    assert registry.refresher('Atlantis') is registry.refresher('Europe')
@@ -0,0 +1,57 @@
+import pandas as pd
+import pytest
+from dash.exceptions import PreventUpdate
+
+import selection
+from dataset import Dataset
+from figures import LOADING_FIGURE
+
+COUNTRIES = ['France', 'Germany']
+
+
+# The Dataset of the region without its last days, a refresh to another version.
+def earlier_dataset(dataset, days=10):
+    rows = dataset.snapshot_rows()
+    return Dataset(rows.loc[rows['date'] <= dataset.last_date - pd.Timedelta(days=days)], dataset.region)
+
+
+def test_selection_inputs_are_normalized(app_module):
+    dataset = app_module.regions.current(wait=True)
+    inputs = selection.selection_inputs(['Germany', 'France'], '2020-04-01', None)
+    assert inputs == selection.selection_inputs(COUNTRIES, '2020-04-01', None)
+    assert selection.selection_inputs('France', None, None)['countries'] == ['France']
+    # Keys are versioned, a refresh drops the keys of the previous version
+    assert selection.selection_key(dataset, inputs).startswith(dataset.version + '-')
+    assert selection.selection_key(dataset, inputs) != selection.selection_key(earlier_dataset(dataset), inputs)
+
+
+# After a refresh the figures of a selection stored before it are keyed on the new version, not on the key in
+# the dcc.Store.
+def test_figures_follow_the_current_dataset(app_module, monkeypatch):
+    refresher = app_module.regions.refresher()
+    stored = app_module.update_selection_store(refresher.current().region, COUNTRIES, None, None)
+    dataset = earlier_dataset(refresher.current())
+    monkeypatch.setattr(refresher, '_dataset', dataset)
+    app_module.discard_stale_cache_entries(dataset)
+
+    app_module.line_graph_figure(app_module.stored_selection_dataset(stored), stored, None)
+    assert app_module.figure_cache._entries
+    assert all(key.startswith(dataset.version + '-') for key in app_module.figure_cache._entries)
+    loaded = selection.load_selection(dataset, stored)
+    assert loaded['version'] == dataset.version
+    assert loaded['data_frame']['date'].max() == dataset.last_date
+    assert all(key.startswith(dataset.version + '-') for key in selection.recent_selections._entries)
+
+
+# A region that does not load within the timeout shows the loading figures instead of failing the callbacks.
+def test_figures_of_a_region_not_loaded(app_module, monkeypatch):
+    stored = app_module.update_selection_store(app_module.config.DEFAULT_REGION, COUNTRIES, None, None)
+    monkeypatch.setattr(app_module.regions, 'current', lambda region=None, wait=False: None)
+
+    dataset = app_module.stored_selection_dataset(stored)
+    assert dataset is None
+    assert app_module.line_graph_figure(dataset, stored, None) is LOADING_FIGURE
+    assert app_module.parallel_coordinates_figure(dataset, stored) is LOADING_FIGURE
+    assert app_module.pie_chart_figure(dataset, stored) is LOADING_FIGURE
+    with pytest.raises(PreventUpdate):
+        app_module.update_choropleth_map(stored, stored['region'])
@@ -0,0 +1,109 @@
+import os
+import pickle
+import threading
+import time
+
+import numpy as np
+import plotly.graph_objects as go
+import pytest
+
+from server_cache import FileSystemCache, MemoryCache, estimate_size, make_versioned_cache_key, memoize
+
+VERSION = 'europe-0123456789abcdef'
+
+
+# Monotonic clock of the MemoryCache advanced by the tests.
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time, 'monotonic', lambda: now[0])
+    return now
+
+
+def test_memory_cache_evicts_least_recently_used(clock):
+    value = np.zeros(100)
+    cache = MemoryCache(timeout=60, max_bytes=2 * value.nbytes)
+    cache.set('a', value)
+    cache.set('b', value)
+    assert cache.get('a') is value
+    # 'b' is the least recently used entry
+    cache.set('c', value)
+    assert cache.get('b') is None
+    assert cache.get('a') is value and cache.get('c') is value
+
+    # An entry above the cap alone is kept until the next one
+    cache.set('d', np.zeros(1000))
+    assert list(cache._entries) == ['d']
+
+
+def test_memory_cache_entries_expire(clock):
+    cache = MemoryCache(timeout=60)
+    cache.set('a', 'value')
+    clock[0] += 60
+    assert cache.get('a') == 'value'
+    clock[0] += 1
+    assert cache.get('a') is None
+    assert cache._size == 0
+
+
+# A refresh drops the entries of the other versions of its region only.
+def test_memory_cache_discards_other_versions():
+    cache = MemoryCache(timeout=60)
+    keys = {name: make_versioned_cache_key(version, 'figure') for name, version in
+            [('current', VERSION), ('stale', 'europe-fedcba9876543210'), ('other region', 'asia-fedcba9876543210')]}
+    for name, key in keys.items():
+        cache.set(key, name)
+    cache.discard_other_versions(VERSION, 'europe-')
+    assert [cache.get(key) for key in keys.values()] == ['current', None, 'other region']
+
+
+# The size of arrays, figures and containers is estimated without pickling, also for values pickle rejects.
+def test_estimate_size():
+    values = np.zeros(1000)
+    assert estimate_size(values) == values.nbytes
+    assert estimate_size({'x': values, 'name': 'France'}) >= values.nbytes + len('France')
+    assert estimate_size(go.Figure(go.Scatter(x=values, y=values))) >= 2 * values.nbytes
+
+    lock = threading.Lock()
+    with pytest.raises(TypeError):
+        pickle.dumps(lock)
+    assert estimate_size([lock]) > 0
+
+
+def test_filesystem_cache(tmp_path):
+    cache = FileSystemCache(str(tmp_path), timeout=60)
+    cache.set('key', {'value': [1, 2]})
+    assert cache.get('key') == {'value': [1, 2]}
+    assert cache.get('missing') is None
+    assert not [name for name in os.listdir(tmp_path) if name.endswith('.tmp')]
+
+    # Older than the timeout
+    path = os.path.join(tmp_path, 'key' + FileSystemCache.extension)
+    os.utime(path, (time.time() - 61, time.time() - 61))
+    assert cache.get('key') is None
+
+
+# The least recently used files above the cap are removed, reads count as use.
+def test_filesystem_cache_evicts_least_recently_used(tmp_path):
+    value = b'x' * 1000
+    cache = FileSystemCache(str(tmp_path), timeout=60, max_bytes=3500)
+    for age, key in enumerate(['a', 'b', 'c']):
+        cache.set(key, value)
+        modified = time.time() - 30 + age
+        os.utime(os.path.join(tmp_path, key + FileSystemCache.extension), (modified, modified))
+    assert cache.get('a') == value
+
+    cache.set('d', value)
+    assert [key for key in 'abcd' if cache.get(key) is not None] == ['a', 'c', 'd']
+
+
+def test_memoize_skips_none_keys():
+    calls = []
+
+    @memoize(MemoryCache(timeout=60), lambda value: None if value < 0 else str(value))
+    def square(value):
+        calls.append(value)
+        return value * value
+
+    assert [square(2), square(2), square(-1), square(-1)] == [4, 4, 1, 1]
+    assert calls == [2, -1, -1]
@@ -0,0 +1,76 @@
+import gc
+import os
+
+import numpy as np
+import pandas as pd
+import pandas.testing as pdt
+import pytest
+
+# Segments are locked with fcntl, which is not available on Windows
+pytest.importorskip('fcntl')
+
+from dataset import Dataset  # noqa: E402
+from shared_dataset import SharedDatasetRefresher, attach_dataset, publish, retire_segments  # noqa: E402
+
+COUNTRIES = ['France', 'Germany']
+
+
+@pytest.fixture(scope='module')
+def dataset(app_module):
+    return app_module.regions.current(wait=True)
+
+
+def earlier_dataset(dataset, days=10):
+    rows = dataset.snapshot_rows()
+    return Dataset(rows.loc[rows['date'] <= dataset.last_date - pd.Timedelta(days=days)], dataset.region)
+
+
+def segment_names(directory):
+    return sorted(name for name in os.listdir(directory) if name.endswith('.arrow'))
+
+
+# An attached Dataset has the rows, the country table and the indexes of the published one, on read-only pages.
+def test_attached_dataset_equals_the_published_one(dataset, tmp_path):
+    publish(dataset, str(tmp_path))
+    attached = attach_dataset(str(tmp_path), dataset.region)
+
+    assert attached.version == dataset.version
+    assert attached.countries == dataset.countries
+    pdt.assert_frame_equal(attached.data_frame, dataset.data_frame)
+    pdt.assert_frame_equal(attached.country_table, dataset.country_table)
+    for column, rows in dataset.store.last_valid_rows.items():
+        np.testing.assert_array_equal(attached.store.last_valid_rows[column], rows)
+    pdt.assert_frame_equal(attached.store.latest(COUNTRIES, valid_column='total_tests'),
+                           dataset.store.latest(COUNTRIES, valid_column='total_tests'))
+    assert not attached.data_frame['total_cases'].to_numpy().flags.writeable
+
+
+# A segment is retired once the last Dataset attached to it is gone.
+def test_segments_in_use_are_not_retired(dataset, tmp_path):
+    directory = str(tmp_path)
+    publish(earlier_dataset(dataset), directory)
+    attached = attach_dataset(directory, dataset.region)
+    publish(dataset, directory)
+    assert len(segment_names(directory)) == 2
+
+    retire_segments(directory, dataset.region)
+    assert len(segment_names(directory)) == 2
+    del attached
+    gc.collect()
+    retire_segments(directory, dataset.region)
+    assert segment_names(directory) == [f'{dataset.version}.arrow']
+
+
+# A worker swaps in the segment of a newly published version and notifies its listeners.
+def test_refresher_attaches_to_new_versions(dataset, tmp_path):
+    directory = str(tmp_path)
+    publish(earlier_dataset(dataset), directory)
+    refresher = SharedDatasetRefresher(dataset.region, directory)
+    swapped = []
+    refresher.add_listener(swapped.append)
+    assert not refresher.refresh()
+
+    publish(dataset, directory)
+    assert refresher.refresh()
+    assert refresher.current().version == dataset.version
+    assert swapped == [refresher.current()]